@@ -0,0 +1,179 @@
+#
+# Finds the Gaussians that barely move. Deforms every Gaussian for each frame of the first part of the validation
+# (test) audio, keeps the range of its deformed attributes and writes point_cloud/iteration_<n>/static.pth with
+#   ranges     half the range of every attribute group in its own unit, i.e. the largest error made by replacing
+#              the Gaussian with a constant: positions in projected pixels, log-scales (relative size), unit
+#              quaternion components, activated opacity and SH coefficients
+#   score      the largest of these ranges divided by the group's tolerance (--tol_*), so 1 means every group
+#              stays within its tolerance
+#   xyz ... attention   the mid-range deformed attributes that replace it, and its mean attention
+# Then renders the rest of the validation frames, held out from the analysis, with growing fractions of static
+# Gaussians (render.py --static_threshold) and reports PSNR, the PSNR change and the deformation time per fraction.
+#
+#     python analyze_static.py -s data/<id> -m output/<model> --configs arguments/64_dim_1_transformer.py
+#
+import json
+import math
+import os
+from argparse import ArgumentParser
+
+import torch
+
+from arguments import ModelParams, PipelineParams, get_combined_args, ModelHiddenParams
+from gaussian_renderer import render_from_batch
+from scene import Scene
+from scene.gaussian_model import GaussianModel, STATIC_NAME, STATIC_ATTRIBUTES
+from utils.camera_utils import camera_features
+from utils.image_utils import psnr
+from utils.loader_utils import CameraPrefetcher
+from utils.timer import StageTimer
+
+# default tolerance of every attribute group, in the units of `ranges` (pixels for the positions)
+TOLERANCES = {"xyz": 0.25, "scaling": 0.02, "rotation": 0.01, "opacity": 0.01, "shs": 0.02}
+
+
+def analyze(gaussians, cameras, batch_size, tolerances=TOLERANCES, indices=None):
+    gaussians.partition_static(None)
+    canonical = [gaussians.get_xyz, gaussians._scaling, gaussians._rotation, gaussians._opacity, gaussians.get_features]
+    num_points = gaussians.get_xyz.shape[0]
+    low, high, attention, frames = None, None, 0, 0
+    # largest pixels per world unit at the deformed position, to express the motion in projected pixels
+    pixels_per_unit = torch.zeros(num_points, device=gaussians.get_xyz.device)
+    for viewpoint_cams in CameraPrefetcher(cameras, batch_size=batch_size, shuffle=False, sampler=indices):
+        B = len(viewpoint_cams)
+        aud, eye, cam = [torch.cat(feature, dim=0) for feature in zip(*[camera_features(c, "cuda") for c in viewpoint_cams])]
+        inputs = [t.unsqueeze(0).repeat(B, *[1] * t.dim()) for t in canonical]
+        deformed = gaussians._deformation(*inputs, aud, eye, cam)
+        values = torch.cat([t.float().reshape(B, num_points, -1) for t in deformed[:5]], dim=-1) # B, N, C
+        low = values.amin(dim=0) if low is None else torch.minimum(low, values.amin(dim=0))
+        high = values.amax(dim=0) if high is None else torch.maximum(high, values.amax(dim=0))
+        attention = attention + deformed[5].float().sum(dim=0) # layer, N, 4
+        for camera, xyz in zip(viewpoint_cams, deformed[0].float()):
+            view = camera.world_view_transform.to(xyz.device)
+            depth = (xyz @ view[:3, 2] + view[3, 2]).clamp_min(camera.znear)
+            focal = camera.image_width / (2 * math.tan(camera.FoVx / 2))
+            pixels_per_unit = torch.maximum(pixels_per_unit, focal / depth)
+        frames += B
+
+    middle, half = (low + high) / 2, (high - low) / 2
+    analysis = {"num_points": num_points, "frames": frames, "tolerances": dict(tolerances)}
+    ranges, start = {}, 0
+    for name, shape in zip(STATIC_ATTRIBUTES[:5], [t.shape[1:] for t in canonical]):
+        width = math.prod(shape)
+        analysis[name] = middle[:, start:start + width].reshape(num_points, *shape)
+        ranges[name] = half[:, start:start + width]
+        if name == "opacity":
+            ranges[name] = (gaussians.opacity_activation(high[:, start:start + width]) -
+                            gaussians.opacity_activation(low[:, start:start + width])) / 2
+        start += width
+    ranges["xyz"] = ranges["xyz"].norm(dim=1) * pixels_per_unit
+    ranges["rotation"] = ranges["rotation"] / analysis["rotation"].norm(dim=1, keepdim=True).clamp_min(1e-8)
+    ranges = {name: r if r.dim() == 1 else r.amax(dim=1) for name, r in ranges.items()}
+    analysis["ranges"] = ranges
+    analysis["score"] = torch.stack([ranges[name] / tolerances[name] for name in ranges]).amax(dim=0)
+    analysis["attention"] = (attention / frames).transpose(0, 1) # N, layer, 4
+    return analysis
+
+
+def evaluate(gaussians, pipeline, cameras, batch_size, frames, reference=None, amp_dtype=None, indices=None):
+    """
+    Renders `frames` cameras (of `indices` when given); returns PSNR against the ground truth (and `reference`
+    renders), timing and the images.
+    """
+    timer = StageTimer()
+    gt_psnr, reference_psnr, images = [], [], []
+    loader = iter(CameraPrefetcher(cameras, batch_size=batch_size, shuffle=False, sampler=indices))
+    rendered = 0
+    timer.start()
+    while rendered < frames:
+        viewpoint_cams = next(loader)[:frames - rendered]
+        timer.lap("dataloading")
+        output = render_from_batch(viewpoint_cams, gaussians, pipeline, random_color=False, stage="fine",
+                                   batch_size=len(viewpoint_cams), only_infer=True, amp_dtype=amp_dtype, timer=timer)
+        image = output["rendered_image_tensor"].clamp(0.0, 1.0)
+        gt_psnr.append(psnr(image, output["gt_tensor"]).squeeze(1).cpu())
+        if reference is not None:
+            target = reference[rendered:rendered + image.shape[0]].to(image.device).float() / 255
+            reference_psnr.append(psnr(image, target).squeeze(1).clamp(max=100.0).cpu())
+        images.append((image * 255).round().byte().cpu())
+        rendered += image.shape[0]
+        timer.start()
+    stages = timer.summary()
+    result = {
+        "psnr": torch.cat(gt_psnr).mean().item(),
+        "deformation_ms": 1000 * stages.get("deformation", 0.0) / rendered,
+        "render_fps": rendered / sum(stages.get(name, 0.0) for name in ("camera_setup", "deformation", "rasterization")),
+    }
+    if reference is not None:
+        result["psnr_vs_full"] = torch.cat(reference_psnr).mean().item()
+    return result, torch.cat(images)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Static Gaussian analysis")
+    model = ModelParams(parser, sentinel=True)
+    pipeline = PipelineParams(parser)
+    hyperparam = ModelHiddenParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--configs", type=str)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--fit_fraction", type=float, default=0.5,
+                        help="analyze the first part of the validation frames, report PSNR on the rest (1 reports on the analyzed frames)")
+    parser.add_argument("--frames", type=int, default=None, help="held-out frames rendered per fraction (default: all)")
+    for name, tolerance in TOLERANCES.items():
+        parser.add_argument("--tol_" + name, type=float, default=tolerance)
+    parser.add_argument("--skip_fractions", nargs="+", type=float, default=[0.25, 0.5, 0.75, 0.9])
+    parser.add_argument("--output", type=str, default=None, help="JSON report (default: static_report.json next to static.pth)")
+    args = get_combined_args(parser)
+    if args.configs:
+        import mmcv
+        from utils.params_utils import merge_hparams
+        config = mmcv.Config.fromfile(args.configs)
+        args = merge_hparams(args, config)
+    args.only_infer = True
+    dataset, hyper, pipe = model.extract(args), hyperparam.extract(args), pipeline.extract(args)
+
+    with torch.no_grad():
+        gaussians = GaussianModel(dataset.sh_degree, hyper)
+        scene = Scene(dataset, gaussians, load_iteration=args.iteration, shuffle=False)
+        gaussians.eval()
+        cameras = scene.getTestCameras()
+        path = os.path.join(dataset.model_path, "point_cloud", "iteration_" + str(scene.loaded_iter))
+        tolerances = {name: getattr(args, "tol_" + name) for name in TOLERANCES}
+
+        # fit on the start of the validation clip, report on the held-out rest (different audio)
+        fit = min(max(int(round(args.fit_fraction * len(cameras))), 1), len(cameras))
+        held_out = fit < len(cameras)
+        fit_indices = range(fit)
+        report_indices = range(fit, len(cameras)) if held_out else fit_indices
+        if not held_out:
+            print("[WARNING] reporting on the analyzed frames, the PSNR change is optimistic")
+
+        gaussians.static_analysis = analyze(gaussians, cameras, args.batch, tolerances, fit_indices)
+        torch.save(gaussians.static_analysis, os.path.join(path, STATIC_NAME))
+        print("Analyzed {} Gaussians over {} frames, written to {}".format(
+            gaussians.static_analysis["num_points"], gaussians.static_analysis["frames"], os.path.join(path, STATIC_NAME)))
+        print("Within every tolerance (score <= 1): {:.1%}".format((gaussians.static_analysis["score"] <= 1).float().mean().item()))
+
+        frames = min(args.frames or len(report_indices), len(report_indices))
+        full, reference = evaluate(gaussians, pipe, cameras, args.batch, frames, indices=report_indices)
+        scores = gaussians.static_analysis["score"].sort().values
+        runs = [dict(skip_fraction=0.0, threshold=None, **full)]
+        for fraction in sorted(args.skip_fractions):
+            threshold = scores[max(int(math.ceil(fraction * scores.shape[0])) - 1, 0)].item()
+            skipped = gaussians.partition_static(threshold)
+            result, _ = evaluate(gaussians, pipe, cameras, args.batch, frames, reference, indices=report_indices)
+            runs.append(dict(skip_fraction=skipped, threshold=threshold, **result))
+        gaussians.partition_static(None)
+
+    print("{:>8} {:>10} {:>8} {:>8} {:>12} {:>14}".format("skipped", "threshold", "PSNR", "delta", "vs full", "deform ms/fr"))
+    for run in runs:
+        run["psnr_delta"] = run["psnr"] - full["psnr"]
+        print("{:8.1%} {:>10} {:8.2f} {:+8.3f} {:>12} {:14.3f}".format(
+            run["skip_fraction"], "-" if run["threshold"] is None else "{:.2e}".format(run["threshold"]), run["psnr"],
+            run["psnr_delta"], "-" if "psnr_vs_full" not in run else "{:.2f}".format(run["psnr_vs_full"]), run["deformation_ms"]))
+    output = args.output or os.path.join(path, "static_report.json")
+    with open(output, "w") as f:
+        json.dump({"model": dataset.model_path, "iteration": scene.loaded_iter, "fit_frames": fit, "frames": frames,
+                   "held_out": held_out, "tolerances": tolerances, "runs": runs}, f, indent=2)
+    print("Pick a threshold and render with: python render.py ... --static_threshold <threshold>")
@@ -58,6 +58,7 @@ class ModelParams(ParamGroup):
         self.add_points=False
         self.extension=".png"
         self.llffhold=8
+        self.compact_checkpoint=False  # also save point_cloud.safetensors (fp16 SH, int16 rotations), preferred when loading
         super().__init__(parser, "Loading Parameters", sentinel)
 
     def extract(self, args):
@@ -70,6 +71,8 @@ class PipelineParams(ParamGroup):
         self.convert_SHs_python = False
         self.compute_cov3D_python = False
         self.debug = True
+        self.crop = ""  # inference: rasterize only a crop around the head, "bounds" (exact) or "face" (grown face_rect + crop_margin, approximate)
+        self.crop_margin = 8  # pixels added around the crop
         super().__init__(parser, "Pipeline Parameters")
 class ModelHiddenParams(ParamGroup):
     def __init__(self, parser):
@@ -160,6 +163,12 @@ class OptimizationParams(ParamGroup):
         self.split_gs_in_fine_stage=False
         self.canonical_tri_plane_factor_list=["scales","rotations","opacity","shs"]
         self.train_l=["xyz","deformation","grid","f_dc","f_rest","opacity","scaling","rotation"]
+        self.amp = "none"  # mixed precision for the deformation network / VGG loss: none, fp16 or bf16
+        self.timing_interval = 0  # print per-section iteration times every N iterations (0 = off)
+        self.log_interval = 10  # copy loss/psnr metrics to the host (progress bar, wandb) every N iterations
+        self.checkpoint_interval = 0  # write a resumable checkpoint to <model_path>/checkpoints every N iterations (0 = off)
+        self.keep_checkpoints = 2
+        self.debug_point_growth = False  # dump <model_path>/add_point_cloud/*.ply every time points are grown
         super().__init__(parser, "Optimization Parameters")
 
 def get_combined_args(parser : ArgumentParser):
@@ -0,0 +1,97 @@
+"""
+Spatial-audio attention benchmark. Checks that the few-token attention path of Spatial_Audio_Attention_Module
+(queries shared by the batch, optionally projected once and cached) matches the generic multi-head attention
+it replaces, then times both for a range of batch sizes. Exits with code 1 when the outputs or attention maps
+differ by more than --atol.
+
+    python -m benchmarks.bench_attention --batch_sizes 1 4 8 16 --output bench/attention.json
+    python -m benchmarks.bench_attention --device cpu --points 10000
+
+benchmarks.check_parity runs the same comparison on a tiny network on the CPU.
+"""
+import sys
+from argparse import ArgumentParser
+
+import torch
+
+from arguments import ModelHiddenParams
+from benchmarks.bench_utils import environment, write_report, check_baseline, time_ms
+
+SOURCE_TOKENS = 4  # audio, eye, cam, null
+
+
+def make_module(hyper, points, device):
+    """A randomly initialized attention module and tri-plane features of `points` Gaussians."""
+    from scene.transformer.transformer import Spatial_Audio_Attention_Module
+
+    # eval mode: dropout would make the two paths draw different masks
+    module = Spatial_Audio_Attention_Module(hyper).to(device).eval()
+    return module, torch.randn(points, hyper.d_model, device=device)
+
+
+def max_difference(module, enc_x, enc_source):
+    """Largest absolute difference of the outputs and attention maps of the generic and few-token paths."""
+    reference, reference_attention = module(enc_x, enc_source, generic=True)
+    shared, shared_attention = module(enc_x, enc_source)
+    cached, cached_attention = module(enc_x, enc_source, query=module.project_query(enc_x))
+    return {
+        "output": max((shared - reference).abs().max().item(), (cached - reference).abs().max().item()),
+        "attention": max((shared_attention - reference_attention).abs().max().item(),
+                         (cached_attention - reference_attention).abs().max().item()),
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Spatial-audio attention benchmark")
+    hp = ModelHiddenParams(parser)
+    parser.add_argument("--configs", type=str, default="arguments/64_dim_1_transformer.py")
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu", choices=["cuda", "cpu"])
+    parser.add_argument("--batch_sizes", nargs="+", type=int, default=[1, 4, 8, 16])
+    parser.add_argument("--points", type=int, default=34650)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--atol", type=float, default=1e-4, help="largest accepted difference from the generic path")
+    parser.add_argument("--output", type=str, default=None, help="write the JSON report here")
+    parser.add_argument("--baseline", type=str, default=None, help="compare with this report (written if missing)")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--update_baseline", action="store_true")
+    args = parser.parse_args(sys.argv[1:])
+    if args.configs:
+        import mmcv
+        from utils.params_utils import merge_hparams
+        config = mmcv.Config.fromfile(args.configs)
+        args = merge_hparams(args, config)
+
+    torch.manual_seed(0)
+    hyper = hp.extract(args)
+    module, enc_x = make_module(hyper, args.points, args.device)
+
+    results, failed = {}, False
+    with torch.no_grad():
+        query = module.project_query(enc_x)
+        for batch_size in args.batch_sizes:
+            enc_source = torch.randn(batch_size, SOURCE_TOKENS, hyper.d_model, device=args.device)
+            difference = max_difference(module, enc_x, enc_source)
+            failed |= max(difference.values()) > args.atol
+            generic = time_ms(lambda: module(enc_x, enc_source, generic=True), args.device, args.repeats)
+            few_tokens = time_ms(lambda: module(enc_x, enc_source, query=query), args.device, args.repeats)
+            results["batch{}".format(batch_size)] = {"generic_ms": generic, "few_tokens_ms": few_tokens,
+                                                     "max_abs_diff": difference}
+            print("[BENCH batch {}] generic {:.3f}ms | few tokens {:.3f}ms ({:.1f}x) | max diff output {:.2e} attention {:.2e}".format(
+                batch_size, generic, few_tokens, generic / few_tokens, difference["output"], difference["attention"]))
+
+    report = {
+        "benchmark": "attention",
+        "environment": environment(),
+        "settings": {"device": args.device, "configs": args.configs, "points": args.points, "d_model": hyper.d_model,
+                     "n_head": hyper.n_head, "n_layer": hyper.n_layer, "repeats": args.repeats},
+        "results": {name: {"generic_ms": run["generic_ms"], "few_tokens_ms": run["few_tokens_ms"]}
+                    for name, run in results.items()},
+        "details": {name: run["max_abs_diff"] for name, run in results.items()},
+    }
+    if args.output:
+        write_report(report, args.output)
+    if failed:
+        print("[MISMATCH] the few-token attention differs from the generic path by more than {}".format(args.atol))
+        sys.exit(1)
+    if args.baseline and not check_baseline(report, args.baseline, args.tolerance, args.update_baseline):
+        sys.exit(1)
@@ -0,0 +1,116 @@
+"""
+Compiled deformation benchmark. Runs the dynamic forward of an (untrained) deformation network eagerly and as a
+CompiledDeformation graph (render.py --compile_deformation) for a range of batch sizes, including a batch padded
+up to the compiled size, and reports the time per call of both and their largest difference. Exits with code 1
+when the compiled outputs differ by more than --atol.
+
+    python -m benchmarks.bench_compile --output bench/compile.json               # CPU, TorchScript trace
+    python -m benchmarks.bench_compile --backend compile --batch_sizes 1 8       # torch.compile (PyTorch 2)
+    python -m benchmarks.bench_compile --int8                                    # quantize_for_cpu first
+
+benchmarks.check_parity runs the same comparison on a tiny network without a --configs file.
+"""
+import sys
+import time
+from argparse import ArgumentParser
+
+import torch
+
+from arguments import ModelHiddenParams
+from benchmarks.bench_utils import environment, write_report, check_baseline, time_ms
+
+HEAD_RADII = (0.09, 0.12, 0.09)  # like benchmarks.synthetic_scene
+ATTRIBUTES = ("xyz", "scaling", "rotation", "opacity", "shs", "attention")
+
+
+def make_inputs(points, batch_size, device):
+    """Canonical Gaussians on a head-sized ellipsoid, repeated per frame as render_from_batch does, and random conditioning."""
+    directions = torch.nn.functional.normalize(torch.randn(points, 3), dim=1)
+    xyz = directions * torch.tensor(HEAD_RADII)
+    canonical = [xyz, torch.full((points, 3), -5.0), torch.tensor([1.0, 0.0, 0.0, 0.0]).repeat(points, 1),
+                 torch.full((points, 1), -2.0), 0.1 * torch.randn(points, 16, 3)]
+    canonical = [t.to(device).unsqueeze(0).repeat(batch_size, *[1] * t.dim()) for t in canonical]
+    frames = [torch.randn(batch_size, 8, 29, 16), torch.rand(batch_size, 1), torch.randn(batch_size, 12)]
+    return canonical, [t.to(device) for t in frames]
+
+
+def compiled_difference(network, compiled, inputs):
+    """Largest difference of every deformed attribute of the CompiledDeformation from the eager forward."""
+    reference = network(*inputs)
+    outputs = compiled(*inputs)
+    return {name: (a.float() - b.float()).abs().max().item() for name, a, b in zip(ATTRIBUTES, outputs, reference)}
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Compiled deformation benchmark")
+    hp = ModelHiddenParams(parser)
+    parser.add_argument("--configs", type=str, default="arguments/64_dim_1_transformer.py")
+    parser.add_argument("--device", type=str, default="cpu", choices=["cuda", "cpu"])
+    parser.add_argument("--backend", type=str, default="trace", choices=["trace", "compile"])
+    parser.add_argument("--int8", action="store_true", help="quantize the network for the CPU (render.py --precision int8)")
+    parser.add_argument("--batch_sizes", nargs="+", type=int, default=[1, 4, 8])
+    parser.add_argument("--points", type=int, default=34650)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--atol", type=float, default=1e-4, help="largest accepted difference from the eager forward")
+    parser.add_argument("--output", type=str, default=None, help="write the JSON report here")
+    parser.add_argument("--baseline", type=str, default=None, help="compare with this report (written if missing)")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--update_baseline", action="store_true")
+    args = parser.parse_args(sys.argv[1:])
+    if args.configs:
+        import mmcv
+        from utils.params_utils import merge_hparams
+        config = mmcv.Config.fromfile(args.configs)
+        args = merge_hparams(args, config)
+
+    from scene.deformation import deform_network, CompiledDeformation
+
+    torch.manual_seed(0)
+    hyper = hp.extract(args)
+    hyper.only_infer = True
+    network = deform_network(hyper)
+    network.deformation_net.set_aabb([r * 1.2 for r in HEAD_RADII], [-r * 1.2 for r in HEAD_RADII])
+    network = network.to(args.device).eval()
+    if args.int8:
+        network.quantize_for_cpu()
+
+    results, details, failed = {}, {}, False
+    # one set of Gaussians: the network caches its tri-plane features on the first call
+    all_canonical, all_frames = make_inputs(args.points, max(args.batch_sizes), args.device)
+    with torch.no_grad():
+        for batch_size in args.batch_sizes:
+            canonical, frames = [t[:batch_size] for t in all_canonical], [t[:batch_size] for t in all_frames]
+            compiled = CompiledDeformation(network, batch_size, args.backend)
+            start = time.perf_counter()
+            compiled(*canonical, *frames)
+            build_ms = 1000 * (time.perf_counter() - start)
+
+            # a full batch and, for batch sizes above one, the last batch of a clip padded up to it
+            runs = {"full": batch_size} if batch_size == 1 else {"full": batch_size, "padded": batch_size // 2}
+            for run, count in runs.items():
+                inputs = [t[:count] for t in canonical + frames]
+                difference = compiled_difference(network, compiled, inputs)
+                failed |= max(difference.values()) > args.atol
+                eager = time_ms(lambda: network(*inputs), args.device, args.repeats)
+                graph = time_ms(lambda: compiled(*inputs), args.device, args.repeats)
+                name = "batch{}_{}".format(batch_size, run)
+                results[name] = {"eager_ms": eager, "compiled_ms": graph}
+                details[name] = {"frames": count, "build_ms": build_ms, "max_abs_diff": difference}
+                print("[BENCH batch {} {} ({} frames)] eager {:.2f}ms | {} {:.2f}ms ({:.2f}x) | max diff {:.2e}".format(
+                    batch_size, run, count, eager, args.backend, graph, eager / graph, max(difference.values())))
+
+    report = {
+        "benchmark": "compile",
+        "environment": environment(),
+        "settings": {"device": args.device, "backend": args.backend, "int8": args.int8, "configs": args.configs,
+                     "points": args.points, "repeats": args.repeats},
+        "results": results,
+        "details": details,
+    }
+    if args.output:
+        write_report(report, args.output)
+    if failed:
+        print("[MISMATCH] the compiled deformation differs from the eager forward by more than {}".format(args.atol))
+        sys.exit(1)
+    if args.baseline and not check_baseline(report, args.baseline, args.tolerance, args.update_baseline):
+        sys.exit(1)
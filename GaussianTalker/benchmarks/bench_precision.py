@@ -0,0 +1,209 @@
+"""
+Deformation network precision benchmark and parity check. Renders a reference clip (the validation frames) in
+fp32 and then with each precision of render.py --precision: fp16 / bf16 autocast on the GPU and int8 dynamic
+quantization on the CPU (deform_network.quantize_for_cpu). Reports per precision the PSNR against the ground
+truth, its drop from fp32, the PSNR against the fp32 renders and the deformation time per frame, and exits with
+code 1 when a precision loses more than --max_psnr_drop dB.
+
+Without -s/-m it uses a synthetic avatar like bench_render. That model is untrained, so only the PSNR against the
+fp32 renders means something; pass -s and -m (and the model's --configs) to check a trained model.
+
+    python -m benchmarks.bench_precision -s data/<id> -m output/<model> --configs arguments/64_dim_1_transformer.py
+    python -m benchmarks.bench_precision --device cpu --output bench/precision_cpu.json
+
+The rasterizer only exists as a CUDA kernel, so --device cpu does not render: it runs the fp32 and int8 networks
+on the deformation inputs of the clip and reports the largest difference of every deformed attribute and the
+deformation time per frame. With -m it loads the trained deformation.pth, applied to the scene's initial points.
+benchmarks.check_parity runs that comparison on a tiny network without a scene or a --configs file.
+"""
+import copy
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+
+from arguments import ModelParams, PipelineParams, OptimizationParams, ModelHiddenParams
+from benchmarks.bench_utils import environment, write_report, check_baseline
+from benchmarks.synthetic_scene import make_synthetic_scene
+
+ATTRIBUTES = ("xyz", "scaling", "rotation", "opacity", "shs", "attention")
+
+
+def run_cuda(args, dataset, hyper, pipe):
+    from analyze_static import evaluate
+    from render import PRECISIONS
+    from scene import Scene, GaussianModel
+
+    gaussians = GaussianModel(dataset.sh_degree, hyper)
+    scene = Scene(dataset, gaussians, load_iteration=-1, shuffle=False)
+    gaussians.eval()
+    cameras = scene.getTestCameras()
+    frames = min(args.frames, len(cameras))
+    # untimed pass so CUDA start-up and the cached tri-plane features are not charged to fp32
+    evaluate(gaussians, pipe, cameras, args.batch, min(args.batch, frames))
+
+    runs = {}
+    runs["fp32"], reference = evaluate(gaussians, pipe, cameras, args.batch, frames)
+    # quantization replaces the layers in place, so int8 goes last
+    for precision in sorted(set(args.precisions) - {"fp32"}, key=lambda name: (name == "int8", name)):
+        if precision == "bf16" and not torch.cuda.is_bf16_supported():
+            print("[BENCH] skipping bf16, not supported by this GPU")
+            continue
+        if precision == "int8":
+            gaussians._deformation.quantize_for_cpu()
+            evaluate(gaussians, pipe, cameras, args.batch, min(args.batch, frames), amp_dtype=PRECISIONS[precision])
+        runs[precision], _ = evaluate(gaussians, pipe, cameras, args.batch, frames, reference, PRECISIONS[precision])
+    for run in runs.values():
+        run["psnr_drop"] = runs["fp32"]["psnr"] - run["psnr"]
+    return runs, frames
+
+
+def deform_clip(network, inputs, features, batch_size):
+    """Deforms the canonical `inputs` for every frame of `features`; returns the outputs and the time per frame."""
+    outputs = []
+    start = time.perf_counter()
+    for i in range(0, features[0].shape[0], batch_size):
+        batch = [t[i:i + batch_size] for t in features]
+        count = batch[0].shape[0]
+        outputs.append([t.float() for t in network(*[t[:count] for t in inputs], *batch)])
+    elapsed = time.perf_counter() - start
+    outputs = [torch.cat(tensors, dim=0) for tensors in zip(*outputs)]
+    return outputs, 1000 * elapsed / features[0].shape[0]
+
+
+def compare_quantized(network, inputs, features, batch_size):
+    """
+    Deforms the clip with the fp32 network and an int8 copy of it (quantize_for_cpu). Returns per precision the
+    deformation time per frame and, for int8, the largest difference of every deformed attribute from fp32.
+    """
+    quantized = copy.deepcopy(network)
+    quantized.quantize_for_cpu()
+    runs = {}
+    with torch.no_grad():
+        # untimed passes so the cached tri-plane features are not charged to the first run
+        for model in (network, quantized):
+            deform_clip(model, inputs, [t[:batch_size] for t in features], batch_size)
+        reference, runs["fp32"] = deform_clip(network, inputs, features, batch_size)
+        deformed, runs["int8"] = deform_clip(quantized, inputs, features, batch_size)
+    runs = {name: {"deformation_ms": ms} for name, ms in runs.items()}
+    runs["int8"]["max_abs_diff"] = {name: (a - b).abs().max().item() for name, a, b in zip(ATTRIBUTES, deformed, reference)}
+    return runs
+
+
+def run_cpu(args, dataset, hyper):
+    from scene.talking_dataset_readers import sceneLoadTypeCallbacks2
+    from scene.dataset import FourDGSdataset
+    from scene.deformation import deform_network
+    from utils.camera_utils import camera_features
+    from utils.general_utils import inverse_sigmoid
+    from utils.point_utils import nearest_neighbor_distance
+    from utils.system_utils import searchForMaxIteration
+
+    scene_info = sceneLoadTypeCallbacks2["ER-NeRF"](dataset.source_path, False, dataset.eval)
+    cameras = FourDGSdataset(scene_info.test_cameras, dataset, "ER-NeRF")
+    frames = min(args.frames, len(cameras))
+    points = np.asarray(scene_info.point_cloud.points, dtype=np.float32)
+
+    network = deform_network(hyper)
+    network.deformation_net.set_aabb(points.max(axis=0), points.min(axis=0))
+    if args.trained:
+        iteration = searchForMaxIteration(os.path.join(dataset.model_path, "point_cloud"))
+        path = os.path.join(dataset.model_path, "point_cloud", "iteration_" + str(iteration), "deformation.pth")
+        network.load_state_dict(torch.load(path, map_location="cpu"))
+    network.eval()
+
+    # canonical Gaussians initialized like GaussianModel.create_from_pcd
+    xyz = torch.from_numpy(points)
+    count = xyz.shape[0]
+    canonical = [xyz, torch.log(torch.clamp_min(nearest_neighbor_distance(xyz), 1e-7 ** 0.5))[:, None].repeat(1, 3),
+                 torch.tensor([1.0, 0.0, 0.0, 0.0]).repeat(count, 1), inverse_sigmoid(0.1 * torch.ones((count, 1))),
+                 torch.zeros((count, 16, 3))]
+    inputs = [t.unsqueeze(0).repeat(args.batch, *[1] * t.dim()) for t in canonical]
+    features = [torch.cat(feature, dim=0) for feature in zip(*[camera_features(cameras[i], "cpu") for i in range(frames)])]
+    return compare_quantized(network, inputs, features, args.batch), frames
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Deformation network precision benchmark")
+    lp = ModelParams(parser)
+    op = OptimizationParams(parser)
+    pp = PipelineParams(parser)
+    hp = ModelHiddenParams(parser)
+    parser.add_argument("--configs", type=str, default="arguments/64_dim_1_transformer.py")
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu", choices=["cuda", "cpu"])
+    parser.add_argument("--precisions", nargs="+", default=["fp16", "bf16", "int8"], choices=["fp32", "fp16", "bf16", "int8"])
+    parser.add_argument("--frames", type=int, default=50, help="length of the reference clip")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--max_psnr_drop", type=float, default=0.1, help="largest accepted PSNR loss against fp32 (dB)")
+    parser.add_argument("--scene_dir", type=str, default=os.path.join(tempfile.gettempdir(), "gaussiantalker_precision_scene"))
+    parser.add_argument("--image_size", type=int, default=512)
+    parser.add_argument("--points", type=int, default=34650)
+    parser.add_argument("--output", type=str, default=None, help="write the JSON report here")
+    parser.add_argument("--baseline", type=str, default=None, help="compare with this report (written if missing)")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--update_baseline", action="store_true")
+    args = parser.parse_args(sys.argv[1:])
+    if args.configs:
+        import mmcv
+        from utils.params_utils import merge_hparams
+        config = mmcv.Config.fromfile(args.configs)
+        args = merge_hparams(args, config)
+
+    synthetic = not args.source_path
+    args.trained = bool(args.source_path and args.model_path)
+    temp_dirs = []
+    if synthetic:
+        # the whole validation split is the reference clip
+        args.source_path = make_synthetic_scene(args.scene_dir, 2 * args.frames, args.image_size, args.points, val_fraction=0.5)
+    if args.device == "cuda" and not args.trained:
+        args.model_path = tempfile.mkdtemp(prefix="bench_avatar_")
+        temp_dirs.append(args.model_path)
+
+    dataset, opt, hyper, pipe = lp.extract(args), op.extract(args), hp.extract(args), pp.extract(args)
+    try:
+        if args.device == "cuda":
+            if not args.trained:
+                from benchmarks.bench_render import build_avatar
+                build_avatar(dataset, hyper, opt, 1)
+            hyper.only_infer = True
+            with torch.no_grad():
+                runs, frames = run_cuda(args, dataset, hyper, pipe)
+        else:
+            hyper.only_infer = True
+            runs, frames = run_cpu(args, dataset, hyper)
+    finally:
+        for path in temp_dirs:
+            shutil.rmtree(path, ignore_errors=True)
+
+    failed = []
+    for name, run in runs.items():
+        if "psnr" in run:
+            print("[BENCH {}] PSNR {:.2f} (drop {:+.3f}) | vs fp32 {} | deformation {:.2f}ms/frame".format(
+                name, run["psnr"], run["psnr_drop"],
+                "-" if "psnr_vs_full" not in run else "{:.2f}".format(run["psnr_vs_full"]), run["deformation_ms"]))
+            if run["psnr_drop"] > args.max_psnr_drop:
+                failed.append(name)
+        else:
+            print("[BENCH {}] deformation {:.2f}ms/frame{}".format(name, run["deformation_ms"], "".join(
+                " | {} {:.2e}".format(attribute, diff) for attribute, diff in run.get("max_abs_diff", {}).items())))
+    report = {
+        "benchmark": "precision",
+        "environment": environment(),
+        "settings": {"device": args.device, "configs": args.configs, "frames": frames, "batch": args.batch,
+                     "scene": "synthetic" if synthetic else args.source_path,
+                     "model": args.model_path if args.trained else "untrained"},
+        "results": {name: {"deformation_ms": run["deformation_ms"]} for name, run in runs.items()},
+        "details": runs,
+    }
+    if args.output:
+        write_report(report, args.output)
+    if failed:
+        print("[PSNR DROP] {} lose more than {} dB against fp32".format(", ".join(failed), args.max_psnr_drop))
+        sys.exit(1)
+    if args.baseline and not check_baseline(report, args.baseline, args.tolerance, args.update_baseline):
+        sys.exit(1)
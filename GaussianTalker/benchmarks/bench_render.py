@@ -0,0 +1,186 @@
+"""
+Rendering benchmark. Renders clips of several lengths with several batch sizes through render.render_set and
+reports the wall time of every stage as JSON, plus the fastest batch size per clip length on this machine:
+
+    scene_load     building the model and loading the Gaussians and deformation network
+    feature_load   the dataset reader: transforms, tracking parameters, audio features, action units, landmarks
+    dataloading    waiting for the camera prefetcher
+    camera_setup   rasterizer settings and ground-truth composites in render_from_batch
+    deformation    the deformation network
+    rasterization  rasterizing the frames
+    d2h            copying the rendered frames to the host
+    attention      the attention-map pass of render_set
+    encode         tensor_to_image and writing the videos
+    mux            the ffmpeg audio mux calls
+
+Without -s/-m it renders a synthetic avatar: an untrained model initialized on the synthetic scene of
+benchmarks.synthetic_scene, which has the size and structure of a trained one. With -s and -m it renders
+that dataset and trained model instead (pass the model's --configs).
+
+    python -m benchmarks.bench_render --batch_sizes 1 4 8 16 --clip_lengths 50 150 --output bench/render.json
+"""
+import os
+import shutil
+import sys
+import tempfile
+from argparse import ArgumentParser
+
+import torch
+
+from arguments import ModelParams, PipelineParams, OptimizationParams, ModelHiddenParams
+from benchmarks.bench_utils import environment, max_rss_mb, write_report, check_baseline
+from benchmarks.synthetic_scene import make_synthetic_scene, AUDIO_NAME
+from utils.timer import StageTimer
+
+RENDER_STAGES = ("dataloading", "camera_setup", "deformation", "rasterization", "d2h")
+
+
+def build_avatar(dataset, hyper, opt, iteration):
+    """Initializes Gaussians on the scene point cloud and saves them the way training saves a checkpoint."""
+    from scene import Scene, GaussianModel
+
+    only_infer, hyper.only_infer = hyper.only_infer, False
+    gaussians = GaussianModel(dataset.sh_degree, hyper)
+    scene = Scene(dataset, gaussians, load_coarse=None)
+    gaussians.training_setup(opt)
+    scene.save(iteration, "fine", blocking=True)
+    hyper.only_infer = only_infer
+
+
+def load_avatar(dataset, hyper, timer):
+    """Loads the model like render_sets, splitting the time spent in the dataset reader out as feature_load."""
+    from scene import Scene, GaussianModel
+    from scene.talking_dataset_readers import sceneLoadTypeCallbacks2
+
+    reader = sceneLoadTypeCallbacks2["ER-NeRF"]
+
+    def timed_reader(*args, **kwargs):
+        timer.lap("scene_load")
+        scene_info = reader(*args, **kwargs)
+        timer.lap("feature_load")
+        return scene_info
+
+    sceneLoadTypeCallbacks2["ER-NeRF"] = timed_reader
+    try:
+        timer.start()
+        gaussians = GaussianModel(dataset.sh_degree, hyper)
+        scene = Scene(dataset, gaussians, load_iteration=-1, shuffle=False)
+        gaussians.eval()
+        timer.lap("scene_load")
+    finally:
+        sceneLoadTypeCallbacks2["ER-NeRF"] = reader
+    return scene, gaussians
+
+
+def run_result(timer, frames):
+    stages = {name: 1000 * seconds for name, seconds in timer.summary().items()}
+    total = sum(stages.values())
+    render = sum(stages.get(name, 0.0) for name in RENDER_STAGES)
+    return {
+        "stages_ms": stages,
+        "total_ms": total,
+        "fps": 1000 * frames / total if total > 0 else 0.0,
+        "render_fps": 1000 * frames / render if render > 0 else 0.0,
+        "peak_memory_mb": torch.cuda.max_memory_allocated() / 2 ** 20,
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Rendering benchmark")
+    lp = ModelParams(parser)
+    op = OptimizationParams(parser)
+    pp = PipelineParams(parser)
+    hp = ModelHiddenParams(parser)
+    parser.add_argument("--configs", type=str, default="arguments/64_dim_1_transformer.py")
+    parser.add_argument("--batch_sizes", nargs="+", type=int, default=[1, 4, 8, 16])
+    parser.add_argument("--clip_lengths", nargs="+", type=int, default=[50, 150], help="frames per rendered clip")
+    parser.add_argument("--audio", type=str, default=None, help="wav muxed into the videos (default: the scene's aud.wav)")
+    parser.add_argument("--scene_dir", type=str, default=os.path.join(tempfile.gettempdir(), "gaussiantalker_bench_scene"))
+    parser.add_argument("--image_size", type=int, default=512)
+    parser.add_argument("--points", type=int, default=34650)
+    parser.add_argument("--output", type=str, default=None, help="write the JSON report here")
+    parser.add_argument("--baseline", type=str, default=None, help="compare with this report (written if missing)")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--update_baseline", action="store_true")
+    parser.add_argument("--keep_output", action="store_true", help="keep the rendered videos")
+    parser.add_argument("--export_inference", action="store_true", help="bake the model with export_inference.py before loading it")
+    args = parser.parse_args(sys.argv[1:])
+    if args.configs:
+        import mmcv
+        from utils.params_utils import merge_hparams
+        config = mmcv.Config.fromfile(args.configs)
+        args = merge_hparams(args, config)
+    assert torch.cuda.is_available(), "rendering needs the CUDA rasterizer"
+
+    synthetic = not (args.source_path and args.model_path)
+    temp_dirs = []
+    if synthetic:
+        frames = int(max(args.clip_lengths) / 0.9) + 1  # the reader keeps 10% of the frames for validation
+        args.source_path = make_synthetic_scene(args.scene_dir, frames, args.image_size, args.points)
+        args.model_path = tempfile.mkdtemp(prefix="bench_avatar_")
+        temp_dirs.append(args.model_path)
+    audio = args.audio or os.path.join(args.source_path, AUDIO_NAME)
+    output_dir = tempfile.mkdtemp(prefix="bench_render_")
+    if not args.keep_output:
+        temp_dirs.append(output_dir)
+
+    dataset, opt, hyper, pipe = lp.extract(args), op.extract(args), hp.extract(args), pp.extract(args)
+    try:
+        if synthetic:
+            build_avatar(dataset, hyper, opt, 1)
+        if args.export_inference:
+            from export_inference import export_inference
+            with torch.no_grad():
+                export_inference(dataset, hyper, -1)
+        hyper.only_infer = True
+        load_timer = StageTimer()
+        from render import render_set
+        from scene.dataset import FourDGSdataset
+        with torch.no_grad():
+            scene, gaussians = load_avatar(dataset, hyper, load_timer)
+            train_cameras = scene.getTrainCameras()
+            assert len(train_cameras) >= max(args.clip_lengths), "the scene has only {} frames".format(len(train_cameras))
+
+            # untimed pass so CUDA context, cuDNN, loader start-up and the cached tri-plane features (unless
+            # loaded from an export) are not charged to the first configuration
+            warmup = max(args.batch_sizes)
+            render_set(output_dir, "custom", "warmup", FourDGSdataset(train_cameras.dataset[:warmup], dataset, "ER-NeRF"),
+                       gaussians, pipe, audio, warmup)
+
+            runs = {}
+            for clip in args.clip_lengths:
+                cameras = FourDGSdataset(train_cameras.dataset[:clip], dataset, "ER-NeRF")
+                for batch_size in args.batch_sizes:
+                    torch.cuda.reset_peak_memory_stats()
+                    timer = StageTimer()
+                    render_set(output_dir, "custom", "clip{}_batch{}".format(clip, batch_size), cameras,
+                               gaussians, pipe, audio, batch_size, timer)
+                    runs["clip{}_batch{}".format(clip, batch_size)] = run_result(timer, clip)
+                    timer.report("clip {} batch {}".format(clip, batch_size))
+    finally:
+        for path in temp_dirs:
+            shutil.rmtree(path, ignore_errors=True)
+
+    best = {}
+    for clip in args.clip_lengths:
+        fps = {batch_size: runs["clip{}_batch{}".format(clip, batch_size)]["fps"] for batch_size in args.batch_sizes}
+        best["clip{}".format(clip)] = max(fps, key=fps.get)
+    report = {
+        "benchmark": "render",
+        "environment": environment(),
+        "settings": {"configs": args.configs, "batch_sizes": args.batch_sizes, "clip_lengths": args.clip_lengths,
+                     "scene": "synthetic" if synthetic else args.source_path,
+                     "model": "synthetic" if synthetic else args.model_path,
+                     "image_size": args.image_size, "points": gaussians.get_xyz.shape[0],
+                     "export_inference": args.export_inference},
+        "results": {"load_ms": {name: 1000 * seconds for name, seconds in load_timer.summary().items()},
+                    "runs": runs, "max_rss_mb": max_rss_mb()},
+        "best_batch_size": best,
+    }
+    for name, run in runs.items():
+        print("[BENCH {}] {:.1f} fps end to end, {:.1f} fps render".format(name, run["fps"], run["render_fps"]))
+    print("[BENCH] fastest batch size per clip length: {}".format(best))
+    if args.output:
+        write_report(report, args.output)
+    if args.baseline and not check_baseline(report, args.baseline, args.tolerance, args.update_baseline):
+        sys.exit(1)
@@ -0,0 +1,248 @@
+"""
+Training throughput benchmark. Runs scene_reconstruction for a fixed number of iterations per stage on a
+synthetic talking-head scene (or on a real one given with -s) and reports iterations/s, data-loader wait,
+the forward/backward/densify/optimizer split and peak memory as JSON.
+
+    python -m benchmarks.bench_train --output bench/train.json
+    python -m benchmarks.bench_train --baseline benchmarks/baseline_train.json   # exit code 1 on a regression
+    python -m benchmarks.bench_train --profile bench/trace                       # torch.profiler trace per stage
+    python -m benchmarks.bench_train --device cpu --batch 2 --steps 30            # no GPU needed
+
+Densification starts right after warm-up so its cost shows up in a short run. Every section is timed with a
+CUDA synchronization (see IterationTimer), so absolute it/s is slightly below that of a normal run.
+
+The rasterizer only exists as a CUDA kernel, so --device cpu times everything around it: frame decoding and
+batching, the deformation network forward/backward on the same inputs as training, and the optimizer step.
+The rendered image and photometric loss are replaced by a loss on the deformed attributes, and there is no
+densification (it needs screen-space gradients).
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+
+from arguments import ModelParams, PipelineParams, OptimizationParams, ModelHiddenParams
+from benchmarks.bench_utils import environment, max_rss_mb, write_report, check_baseline, make_profiler
+from benchmarks.synthetic_scene import make_synthetic_scene
+from utils.timer import Timer, IterationTimer
+
+COARSE_TRAIN_L = ["xyz", "deformation", "grid", "f_dc", "f_rest", "opacity", "scaling", "rotation"]
+
+
+class ProfiledTimer(IterationTimer):
+    """IterationTimer that also advances a torch.profiler schedule once per training iteration."""
+    def __init__(self, interval, warmup, profiler):
+        super().__init__(interval, warmup)
+        self.profiler = profiler
+
+    def step(self, iteration):
+        super().step(iteration)
+        self.profiler.step()
+
+
+def make_timer(args, stage):
+    if not args.profile:
+        return IterationTimer(args.print_interval, args.warmup)
+    profiler = make_profiler(os.path.join(args.profile, stage), wait=args.warmup, active=args.profile_steps)
+    profiler.start()
+    return ProfiledTimer(args.print_interval, args.warmup, profiler)
+
+
+def stage_result(timer):
+    summary = timer.summary()
+    mean = summary["mean_ms"]
+    result = {
+        "iterations": summary["iterations"],
+        "it_per_s": summary["it_per_s"],
+        "split_ms": {
+            "data_wait": mean.get("data", 0.0),
+            "forward": mean.get("render", 0.0) + mean.get("deform", 0.0) + mean.get("loss", 0.0),
+            "backward": mean.get("backward", 0.0),
+            "densify": mean.get("densify", 0.0),
+            "optimizer": mean.get("optim", 0.0),
+        },
+        "max_rss_mb": max_rss_mb(),
+    }
+    if summary["peak_memory_mb"] is not None:
+        result["peak_memory_mb"] = summary["peak_memory_mb"]
+    details = {"mean_ms": mean, "max_ms": summary["max_ms"]}
+    return result, details
+
+
+def run_cuda(args, dataset, opt, hyper, pipe):
+    from train import scene_reconstruction
+    from scene import Scene, GaussianModel
+
+    gaussians = GaussianModel(dataset.sh_degree, hyper)
+    scene = Scene(dataset, gaussians, load_coarse=None)
+    timer = Timer()
+    timer.start()
+
+    results, details = {}, {}
+    train_l = opt.train_l
+    for stage in args.stages:
+        opt.train_l = COARSE_TRAIN_L if stage == "coarse" else train_l
+        torch.cuda.reset_peak_memory_stats()
+        iter_timer = make_timer(args, stage)
+        scene_reconstruction(dataset, opt, hyper, pipe, [], [], [], None, -1, gaussians, scene, stage, None,
+                             args.steps, timer, iter_timer=iter_timer)
+        if isinstance(iter_timer, ProfiledTimer):
+            iter_timer.profiler.stop()
+        results[stage], details[stage] = stage_result(iter_timer)
+        details[stage]["gaussians"] = gaussians.get_xyz.shape[0]
+    return results, details
+
+
+def run_cpu(args, dataset, opt, hyper):
+    from scene.talking_dataset_readers import sceneLoadTypeCallbacks2
+    from scene.dataset import FourDGSdataset
+    from scene.deformation import deform_network
+    from utils.camera_utils import camera_features
+    from utils.general_utils import inverse_sigmoid
+    from utils.loader_utils import CameraPrefetcher
+    from utils.point_utils import nearest_neighbor_distance
+
+    scene_info = sceneLoadTypeCallbacks2["ER-NeRF"](dataset.source_path, False, dataset.eval)
+    cameras = FourDGSdataset(scene_info.train_cameras, dataset, "ER-NeRF")
+    points = np.asarray(scene_info.point_cloud.points, dtype=np.float32)
+
+    deformation = deform_network(hyper)
+    deformation.deformation_net.set_aabb(points.max(axis=0), points.min(axis=0))
+    # canonical Gaussians initialized like GaussianModel.create_from_pcd
+    xyz = torch.from_numpy(points)
+    count = xyz.shape[0]
+    dist = torch.clamp_min(nearest_neighbor_distance(xyz), 1e-7 ** 0.5)
+    canonical = {
+        "xyz": torch.nn.Parameter(xyz.clone()),
+        "shs": torch.nn.Parameter(torch.zeros((count, 16, 3))),
+        "scaling": torch.nn.Parameter(torch.log(dist)[:, None].repeat(1, 3)),
+        "rotation": torch.nn.Parameter(torch.tensor([1.0, 0.0, 0.0, 0.0]).repeat(count, 1)),
+        "opacity": torch.nn.Parameter(inverse_sigmoid(0.1 * torch.ones((count, 1)))),
+    }
+
+    results, details = {}, {}
+    for stage in args.stages:
+        batch_size = 1 if stage == "coarse" else opt.batch_size
+        optimizer = torch.optim.Adam([
+            {"params": list(deformation.get_mlp_parameters()), "lr": opt.deformation_lr_init},
+            {"params": list(deformation.get_grid_parameters()), "lr": opt.grid_lr_init},
+            {"params": list(canonical.values()), "lr": opt.position_lr_init},
+        ], lr=0.0, eps=1e-15)
+        loader = CameraPrefetcher(cameras, batch_size=batch_size, shuffle=True, drop_last=True, device="cpu")
+        batches = iter(loader)
+        iter_timer = make_timer(args, stage)
+        for iteration in range(1, args.steps + 1):
+            iter_timer.start()
+            try:
+                viewpoint_cams = next(batches)
+            except StopIteration:
+                batches = iter(loader)
+                viewpoint_cams = next(batches)
+            iter_timer.lap("data")
+
+            inputs = [canonical[name].unsqueeze(0).repeat(batch_size, *[1] * canonical[name].dim())
+                      for name in ("xyz", "scaling", "rotation", "opacity", "shs")]
+            if stage == "coarse":
+                deformed = deformation(*inputs)
+            else:
+                features = [camera_features(cam, "cpu") for cam in viewpoint_cams]
+                aud, eye, cam = [torch.cat(feature, dim=0) for feature in zip(*features)]
+                deformed = deformation(*inputs, aud, eye, cam)
+            iter_timer.lap("deform")
+
+            # stands in for rasterization + photometric loss
+            loss = sum(t.float().abs().mean() for t in deformed[:5])
+            iter_timer.lap("loss")
+            loss.backward()
+            iter_timer.lap("backward")
+            optimizer.step()
+            optimizer.zero_grad(set_to_none=True)
+            iter_timer.lap("optim")
+            iter_timer.step(iteration)
+        if isinstance(iter_timer, ProfiledTimer):
+            iter_timer.profiler.stop()
+        results[stage], details[stage] = stage_result(iter_timer)
+        details[stage]["gaussians"] = count
+    return results, details
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Training throughput benchmark")
+    lp = ModelParams(parser)
+    op = OptimizationParams(parser)
+    pp = PipelineParams(parser)
+    hp = ModelHiddenParams(parser)
+    parser.add_argument("--configs", type=str, default="arguments/64_dim_1_transformer.py")
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu", choices=["cuda", "cpu"])
+    parser.add_argument("--stages", nargs="+", default=["coarse", "fine"], choices=["coarse", "fine"])
+    parser.add_argument("--steps", type=int, default=300, help="iterations per stage")
+    parser.add_argument("--warmup", type=int, default=20, help="iterations per stage left out of the statistics")
+    parser.add_argument("--batch", type=int, default=None, help="fine stage batch size (default: from the config)")
+    parser.add_argument("--print_interval", type=int, default=100)
+    parser.add_argument("--scene_dir", type=str, default=os.path.join(tempfile.gettempdir(), "gaussiantalker_bench_scene"),
+                        help="where the synthetic scene is generated (reused while its parameters match)")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--image_size", type=int, default=512)
+    parser.add_argument("--points", type=int, default=34650)
+    parser.add_argument("--profile", type=str, default=None, help="write torch.profiler traces to this directory")
+    parser.add_argument("--profile_steps", type=int, default=5)
+    parser.add_argument("--output", type=str, default=None, help="write the JSON report here")
+    parser.add_argument("--baseline", type=str, default=None, help="compare with this report (written if missing)")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative slowdown flagged as a regression")
+    parser.add_argument("--update_baseline", action="store_true")
+    parser.add_argument("--keep_output", action="store_true", help="keep the model folder written during the run")
+    args = parser.parse_args(sys.argv[1:])
+    if args.configs:
+        import mmcv
+        from utils.params_utils import merge_hparams
+        config = mmcv.Config.fromfile(args.configs)
+        args = merge_hparams(args, config)
+    assert args.steps > args.warmup, "--steps must be larger than --warmup"
+
+    synthetic = not args.source_path
+    if synthetic:
+        args.source_path = make_synthetic_scene(args.scene_dir, args.frames, args.image_size, args.points)
+    output_dir = args.model_path or tempfile.mkdtemp(prefix="bench_train_")
+    args.model_path = output_dir
+    args.iterations = args.coarse_iterations = args.steps
+    args.densify_from_iter = args.pruning_from_iter = args.warmup
+    if args.batch is not None:
+        args.batch_size = args.batch
+
+    torch.manual_seed(0)
+    np.random.seed(0)
+    random.seed(0)
+    dataset, opt, hyper, pipe = lp.extract(args), op.extract(args), hp.extract(args), pp.extract(args)
+    try:
+        if args.device == "cuda":
+            results, details = run_cuda(args, dataset, opt, hyper, pipe)
+        else:
+            results, details = run_cpu(args, dataset, opt, hyper)
+    finally:
+        if not args.keep_output:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    report = {
+        "benchmark": "train",
+        "environment": environment(),
+        "settings": {"device": args.device, "configs": args.configs, "stages": args.stages, "steps": args.steps,
+                     "warmup": args.warmup, "batch_size": opt.batch_size, "amp": opt.amp,
+                     "scene": "synthetic" if synthetic else args.source_path,
+                     "frames": args.frames, "image_size": args.image_size, "points": args.points},
+        "results": results,
+        "details": details,
+    }
+    for stage, result in results.items():
+        split = " | ".join("{} {:.2f}ms".format(name, value) for name, value in result["split_ms"].items())
+        print("[BENCH {}] {:.2f} it/s | {} | peak mem {}".format(
+            stage, result["it_per_s"], split,
+            "{:.0f}MB".format(result["peak_memory_mb"]) if "peak_memory_mb" in result else "{:.0f}MB RSS".format(result["max_rss_mb"])))
+    if args.output:
+        write_report(report, args.output)
+    if args.baseline and not check_baseline(report, args.baseline, args.tolerance, args.update_baseline):
+        sys.exit(1)
@@ -0,0 +1,131 @@
+import json
+import os
+import platform
+import resource
+import time
+from argparse import ArgumentParser
+
+import torch
+
+from arguments import ModelHiddenParams
+
+# metrics whose name ends with one of these get better when they grow; every other number (times, memory) when it shrinks
+HIGHER_IS_BETTER = ("it_per_s", "fps")
+
+
+def environment():
+    info = {"torch": torch.__version__, "python": platform.python_version(), "cpu": platform.processor() or platform.machine()}
+    if torch.cuda.is_available():
+        info["gpu"] = torch.cuda.get_device_name()
+        info["cuda"] = torch.version.cuda
+    return info
+
+
+def tiny_hidden_params(**overrides):
+    """ModelHiddenParams of a deformation network small enough for CPU checks, without a --configs file (and mmcv)."""
+    parser = ArgumentParser()
+    hyper = ModelHiddenParams(parser).extract(parser.parse_args([]))
+    # the tri-plane feature (output_coordinate_dim per resolution in multires) is what the transformer takes
+    hyper.kplanes_config = {"grid_dimensions": 2, "input_coordinate_dim": 3, "output_coordinate_dim": 8, "resolution": [16, 16, 16]}
+    hyper.multires = [1, 2]
+    hyper.d_model, hyper.n_head, hyper.ffn_hidden, hyper.drop_prob = 16, 2, 32, 0.0
+    hyper.net_width, hyper.defor_depth = 32, 1
+    hyper.no_do, hyper.no_dshs, hyper.train_tri_plane = False, False, True
+    for name, value in overrides.items():
+        setattr(hyper, name, value)
+    return hyper
+
+
+def synchronize(device):
+    if device == "cuda":
+        torch.cuda.synchronize()
+
+
+def time_ms(fn, device, repeats):
+    """Milliseconds per call of fn, after one warm-up call; waits for the GPU so queued kernels are counted."""
+    fn()
+    synchronize(device)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    synchronize(device)
+    return 1000 * (time.perf_counter() - start) / repeats
+
+
+def max_rss_mb():
+    """Peak resident memory of this process (ru_maxrss is in KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_report(report, path):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def flatten_metrics(report, prefix=""):
+    """{"a": {"b": 1.0}} -> {"a.b": 1.0}, numbers only."""
+    flat = {}
+    for key, value in report.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def compare_to_baseline(report, baseline, tolerance=0.1, noise_floor=0.5, sections=("results",)):
+    """
+    Compares the numbers under `sections` of two reports. A metric regresses when it is worse than the baseline by
+    more than `tolerance` (relative) and by more than `noise_floor` (absolute, i.e. ms or MB), so sub-millisecond
+    sections do not flag on jitter. Returns a list of (name, baseline, current, relative change) regressions.
+    """
+    regressions = []
+    for section in sections:
+        current = flatten_metrics(report.get(section, {}), section + ".")
+        previous = flatten_metrics(baseline.get(section, {}), section + ".")
+        for name, base in previous.items():
+            if name not in current or base == 0 or name.endswith(".iterations"):
+                continue
+            value = current[name]
+            change = (value - base) / abs(base)
+            if name.endswith(HIGHER_IS_BETTER):
+                worse = -change > tolerance
+            else:
+                worse = change > tolerance and value - base > noise_floor
+            if worse:
+                regressions.append((name, base, value, change))
+    return regressions
+
+
+def check_baseline(report, baseline_path, tolerance, update=False):
+    """Prints the comparison with the baseline file and returns False on a regression; update=True (re)writes it."""
+    if update or not os.path.exists(baseline_path):
+        write_report(report, baseline_path)
+        print("Baseline written to {}".format(baseline_path))
+        return True
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline.get("environment", {}).get("gpu") != report.get("environment", {}).get("gpu"):
+        print("[WARNING] baseline was recorded on {}, comparing anyway".format(
+            baseline.get("environment", {}).get("gpu", "a CPU-only machine")))
+    regressions = compare_to_baseline(report, baseline, tolerance)
+    for name, base, value, change in regressions:
+        print("[REGRESSION] {}: {:.3f} -> {:.3f} ({:+.1f}%)".format(name, base, value, 100 * change))
+    if not regressions:
+        print("No regression against {} (tolerance {:.0f}%)".format(baseline_path, 100 * tolerance))
+    return not regressions
+
+
+def make_profiler(trace_dir, wait, active):
+    """torch.profiler that skips `wait` steps, records `active` steps and writes a trace viewable in TensorBoard/Perfetto."""
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    return torch.profiler.profile(
+        activities=activities,
+        schedule=torch.profiler.schedule(wait=wait, warmup=1, active=active, repeat=1),
+        on_trace_ready=torch.profiler.tensorboard_trace_handler(trace_dir),
+        record_shapes=True, profile_memory=True)
@@ -0,0 +1,70 @@
+"""
+CPU parity checks of the inference shortcuts against the paths they replace, on a tiny randomly initialized
+network (bench_utils.tiny_hidden_params), so they need neither a GPU nor a --configs file. The benchmarks run the
+same comparisons at full size. Raises AssertionError on a mismatch.
+
+    python -m benchmarks.check_parity
+"""
+import torch
+
+from benchmarks.bench_attention import SOURCE_TOKENS, make_module, max_difference
+from benchmarks.bench_compile import HEAD_RADII, make_inputs, compiled_difference
+from benchmarks.bench_precision import compare_quantized
+from benchmarks.bench_utils import tiny_hidden_params
+
+ATOL = 1e-4  # the benchmarks' default --atol
+INT8_ATOL = 5e-2  # int8 only approximates fp32; this catches a broken quantized path, not a small drift
+
+
+def check_attention():
+    """Few-token attention (shared queries, with and without the cached projection) against the generic path."""
+    for n_layer in (1, 2):
+        torch.manual_seed(0)
+        hyper = tiny_hidden_params(n_layer=n_layer)
+        module, enc_x = make_module(hyper, 200, "cpu")
+        with torch.no_grad():
+            for batch_size in (1, 3):
+                enc_source = torch.randn(batch_size, SOURCE_TOKENS, hyper.d_model)
+                difference = max_difference(module, enc_x, enc_source)
+                assert max(difference.values()) <= ATOL, "{} layer(s), batch {}: {}".format(n_layer, batch_size, difference)
+
+
+def make_network(**overrides):
+    """An untrained tiny deformation network for inference, its bounding box around make_inputs' Gaussians."""
+    from scene.deformation import deform_network
+
+    network = deform_network(tiny_hidden_params(only_infer=True, **overrides))
+    network.deformation_net.set_aabb([r * 1.2 for r in HEAD_RADII], [-r * 1.2 for r in HEAD_RADII])
+    return network.eval()
+
+
+def check_int8():
+    """The int8 network of quantize_for_cpu against the fp32 one, over a clip of two batches."""
+    torch.manual_seed(0)
+    canonical, frames = make_inputs(200, 6, "cpu")
+    runs = compare_quantized(make_network(), [t[:3] for t in canonical], frames, 3)
+    difference = runs["int8"]["max_abs_diff"]
+    assert max(difference.values()) <= INT8_ATOL, difference
+
+
+def check_compile():
+    """The traced CompiledDeformation against the eager forward, for a full batch and one padded up to it."""
+    from scene.deformation import CompiledDeformation
+
+    torch.manual_seed(0)
+    network = make_network()
+    canonical, frames = make_inputs(200, 4, "cpu")
+    compiled = CompiledDeformation(network, 4, "trace")
+    with torch.no_grad():
+        for count in (4, 1):
+            difference = compiled_difference(network, compiled, [t[:count] for t in canonical + frames])
+            assert max(difference.values()) <= ATOL, "{} frames: {}".format(count, difference)
+
+
+if __name__ == "__main__":
+    check_attention()
+    print("[CHECK] few-token attention ok")
+    check_int8()
+    print("[CHECK] int8 deformation ok")
+    check_compile()
+    print("[CHECK] compiled deformation ok")
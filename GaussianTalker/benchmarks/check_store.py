@@ -0,0 +1,52 @@
+"""
+CPU check of scene.gaussian_store.GaussianStore: populates a store, grows it past its capacity through append and
+through sync (what restore / load_ply do on a model that already trained), compacts it, and compares the views
+with the tensors they should hold. Raises AssertionError on a mismatch.
+
+    python -m benchmarks.check_store
+"""
+import torch
+
+from scene.gaussian_store import GaussianStore
+
+
+def check_store():
+    torch.manual_seed(0)
+    store = GaussianStore(growth=1.5)
+    xyz, exp_avg = torch.randn(4, 3), torch.randn(4, 3)
+    store.sync({"xyz": xyz, "exp_avg": exp_avg})
+    assert store.count == 4 and store.capacity == 6
+    assert torch.equal(store.views()["xyz"], xyz) and torch.equal(store.views()["exp_avg"], exp_avg)
+
+    # past the capacity: the active rows are carried over, buffers missing from the rows get zeros
+    added = torch.randn(3, 3)
+    store.append({"xyz": added})
+    assert store.count == 7 and store.capacity > 6
+    assert torch.equal(store.views()["xyz"], torch.cat([xyz, added]))
+    assert torch.equal(store.views()["exp_avg"], torch.cat([exp_avg, torch.zeros(3, 3)]))
+
+    # views synced back keep their buffers
+    pointer = store.buffers["xyz"].data_ptr()
+    store.sync(store.views())
+    assert store.buffers["xyz"].data_ptr() == pointer
+
+    # a populated store synced with replacements larger than its capacity
+    rows = store.capacity + 5
+    replaced = {"xyz": torch.randn(rows, 3), "exp_avg": torch.randn(rows, 3)}
+    store.sync(replaced)
+    assert store.count == rows and store.capacity >= rows
+    for name, tensor in replaced.items():
+        assert torch.equal(store.views()[name], tensor), name
+
+    # and a smaller one, then compaction
+    replaced = {"xyz": torch.randn(5, 3), "exp_avg": torch.randn(5, 3)}
+    store.sync(replaced)
+    keep = torch.tensor([True, False, True, True, False])
+    store.compact(keep)
+    for name, tensor in replaced.items():
+        assert torch.equal(store.views()[name], tensor[keep]), name
+
+
+if __name__ == "__main__":
+    check_store()
+    print("[CHECK] GaussianStore ok")
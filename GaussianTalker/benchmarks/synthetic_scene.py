@@ -0,0 +1,150 @@
+"""
+Synthetic talking-head scene in the layout readTalkingPortraitDatasetInfo expects (track_params.pt,
+transforms_{train,val}.json, ori_imgs/<id>.jpg + .lms, parsing/<id>.png, torso_imgs/<id>.png, bc.jpg,
+aud_ds.npy and au.csv), plus an aud.wav of the same length for muxing rendered videos. The content is a
+drawn face whose mouth follows a fake audio track; it is only meant to exercise the data, training and
+rendering code paths with realistic sizes, not to train a usable model.
+
+    python -m benchmarks.synthetic_scene <out_dir> [--frames 200] [--image_size 512] [--points 34650]
+"""
+import json
+import os
+import wave
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+import torch
+
+SCENE_META = "synthetic.json"
+AUDIO_NAME = "aud.wav"
+FPS = 25
+SAMPLE_RATE = 16000
+FACE_RADII = (0.09, 0.12, 0.09)  # head ellipsoid in world units, centered at the origin
+CAMERA_DISTANCE = 0.6
+
+
+def _landmarks(cx, cy, rx, ry, mouth_open):
+    """68 points in the iBUG order, as (x, y) pixel coordinates like the .lms files of the preprocessing."""
+    angles = np.linspace(np.pi, 0, 17)
+    jaw = np.stack([cx + rx * np.cos(angles), cy + ry * np.sin(angles)], axis=1)
+    brows = np.stack([np.linspace(cx - 0.7 * rx, cx + 0.7 * rx, 10), np.full(10, cy - 0.45 * ry)], axis=1)
+    bridge = np.stack([np.full(4, cx), np.linspace(cy - 0.35 * ry, cy + 0.05 * ry, 4)], axis=1)
+    nostrils = np.stack([np.linspace(cx - 0.2 * rx, cx + 0.2 * rx, 5), np.full(5, cy + 0.15 * ry)], axis=1)
+
+    def ring(center_x, center_y, radius_x, radius_y, count):
+        t = np.linspace(0, 2 * np.pi, count, endpoint=False)
+        return np.stack([center_x + radius_x * np.cos(t), center_y + radius_y * np.sin(t)], axis=1)
+
+    eyes = [ring(cx + side * 0.35 * rx, cy - 0.25 * ry, 0.15 * rx, 0.06 * ry, 6) for side in (-1, 1)]
+    mouth_y = cy + 0.45 * ry
+    lips_outer = ring(cx, mouth_y, 0.3 * rx, (0.05 + 0.1 * mouth_open) * ry, 12)
+    lips_inner = ring(cx, mouth_y, 0.2 * rx, 0.08 * mouth_open * ry + 1, 8)
+    return np.concatenate([jaw, brows, bridge, nostrils] + eyes + [lips_outer, lips_inner]).astype(np.float32)
+
+
+def _background(size, rng):
+    gradient = np.linspace(40, 200, size, dtype=np.float32)
+    image = np.stack([np.tile(gradient, (size, 1)), np.tile(gradient[:, None], (1, size)),
+                      np.full((size, size), 120, np.float32)], axis=-1)
+    image += rng.normal(0, 8, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def make_synthetic_scene(path, frames=200, image_size=512, points=34650, val_fraction=0.1, seed=0):
+    """Writes the scene to `path` unless a scene with the same parameters is already there. Returns path."""
+    params = {"frames": frames, "image_size": image_size, "points": points, "val_fraction": val_fraction, "seed": seed,
+              "audio": AUDIO_NAME}
+    meta_path = os.path.join(path, SCENE_META)
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == params:
+                return path
+
+    rng = np.random.default_rng(seed)
+    for folder in ("ori_imgs", "parsing", "torso_imgs"):
+        os.makedirs(os.path.join(path, folder), exist_ok=True)
+
+    # head motion: small rotations and translations around a camera looking at the origin
+    t = np.arange(frames, dtype=np.float32)
+    euler = np.stack([0.05 * np.sin(t / 23), 0.08 * np.sin(t / 31), 0.03 * np.sin(t / 17)], axis=1)
+    trans = np.stack([0.01 * np.sin(t / 29), 0.01 * np.sin(t / 37), np.full(frames, -CAMERA_DISTANCE)], axis=1)
+    directions = rng.normal(size=(points, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    vertices = directions * np.asarray(FACE_RADII)
+    torch.save({"euler": torch.from_numpy(euler.astype(np.float32)),
+                "trans": torch.from_numpy(trans.astype(np.float32)),
+                "vertices": torch.from_numpy(vertices.astype(np.float32))[None]},
+               os.path.join(path, "track_params.pt"))
+
+    # fake DeepSpeech logits [N, 16, 29] whose energy drives the mouth opening, and blink action units
+    logits = rng.normal(size=(frames, 16, 29)).astype(np.float32)
+    speech = 0.5 + 0.5 * np.sin(t / 3)
+    logits[:, :, 0] += 3 * speech[:, None]
+    np.save(os.path.join(path, "aud_ds.npy"), logits)
+    samples = np.arange(frames * SAMPLE_RATE // FPS) / SAMPLE_RATE
+    tone = 0.2 * np.sin(2 * np.pi * 220 * samples) * np.interp(samples * FPS, t, speech)
+    with wave.open(os.path.join(path, AUDIO_NAME), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((tone * 32767).astype(np.int16).tobytes())
+    blink = np.where(t % 60 < 4, 2.0, 0.1) + rng.uniform(0, 0.1, frames)
+    with open(os.path.join(path, "au.csv"), "w") as f:
+        f.write("frame, AU45_r\n")
+        for i in range(frames):
+            f.write("{}, {:.2f}\n".format(i + 1, blink[i]))
+
+    focal = image_size * 2.2
+    center = image_size // 2
+    background = _background(image_size, rng)
+    cv2.imwrite(os.path.join(path, "bc.jpg"), cv2.cvtColor(background, cv2.COLOR_RGB2BGR))
+
+    rx = int(focal * FACE_RADII[0] / CAMERA_DISTANCE)
+    ry = int(focal * FACE_RADII[1] / CAMERA_DISTANCE)
+    for i in range(frames):
+        cx = center + int(focal * trans[i, 0] / CAMERA_DISTANCE)
+        cy = center + int(focal * trans[i, 1] / CAMERA_DISTANCE)
+        lms = _landmarks(cx, cy, rx, ry, speech[i])
+
+        torso = np.zeros((image_size, image_size, 4), np.uint8)
+        cv2.ellipse(torso, (center, image_size), (int(2.2 * rx), int(1.2 * ry)), 0, 0, 360, (90, 110, 160, 255), -1)
+        image = background.copy()
+        alpha = torso[..., 3:] / 255.0
+        image = (image * (1 - alpha) + torso[..., :3] * alpha).astype(np.uint8)
+        cv2.ellipse(image, (cx, cy), (rx, ry), 0, 0, 360, (225, 185, 160), -1)
+        for eye in (lms[36:42], lms[42:48]):
+            cv2.fillPoly(image, [eye.astype(np.int32)], (60, 40, 30) if blink[i] < 1 else (200, 160, 140))
+        cv2.fillPoly(image, [lms[48:60].astype(np.int32)], (170, 60, 70))
+        cv2.fillPoly(image, [lms[60:68].astype(np.int32)], (50, 20, 20))
+        cv2.imwrite(os.path.join(path, "ori_imgs", "{}.jpg".format(i)), cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+        np.savetxt(os.path.join(path, "ori_imgs", "{}.lms".format(i)), lms, "%f")
+
+        # head is pure blue in the BGR parsing maps, the torso is left to torso_imgs
+        parsing = np.full((image_size, image_size, 3), 255, np.uint8)
+        cv2.ellipse(parsing, (cx, cy), (rx, ry), 0, 0, 360, (255, 0, 0), -1)
+        cv2.imwrite(os.path.join(path, "parsing", "{}.png".format(i)), parsing)
+        cv2.imwrite(os.path.join(path, "torso_imgs", "{}.png".format(i)), cv2.cvtColor(torso, cv2.COLOR_RGBA2BGRA))
+
+    val_count = max(1, int(frames * val_fraction))
+    for name, ids in (("transforms_train.json", range(frames - val_count)),
+                      ("transforms_val.json", range(frames - val_count, frames))):
+        transforms = {"focal_len": focal, "cx": center, "cy": center,
+                      "frames": [{"img_id": i, "aud_id": i} for i in ids]}
+        with open(os.path.join(path, name), "w") as f:
+            json.dump(transforms, f)
+
+    with open(meta_path, "w") as f:
+        json.dump(params, f)
+    return path
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Generate a synthetic talking-head scene")
+    parser.add_argument("path", type=str)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--image_size", type=int, default=512)
+    parser.add_argument("--points", type=int, default=34650)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(make_synthetic_scene(args.path, args.frames, args.image_size, args.points, seed=args.seed))
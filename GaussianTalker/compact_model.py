@@ -0,0 +1,133 @@
+#
+# Shrinks a trained model for deployment. Renders the training frames once to measure the blending weight every
+# Gaussian gets (the sum over pixels of its alpha times the transmittance in front of it, taken as the gradient
+# of the image with respect to precomputed colors), prunes the Gaussians whose weight stays below --min_weight
+# pixels in every frame, optionally drops the SH coefficients above --sh_degree (the camera barely moves), and
+# writes the result as a new model folder with the same iteration, renderable with render.py -m <output>.
+# Reports the point count, the file sizes, and render FPS and PSNR on the validation frames before and after.
+#
+#     python compact_model.py -s data/<id> -m output/<model> --configs arguments/64_dim_1_transformer.py \
+#         --output output/<model>_compact --sh_degree 1 --compact
+#
+import json
+import os
+import shutil
+from argparse import ArgumentParser
+
+import torch
+
+from analyze_static import evaluate
+from arguments import ModelParams, PipelineParams, get_combined_args, ModelHiddenParams
+from gaussian_renderer import make_rasterizer
+from scene import Scene
+from scene.gaussian_model import GaussianModel
+from utils.camera_utils import camera_features
+from utils.compact_utils import COMPACT_NAME
+from utils.loader_utils import CameraPrefetcher
+
+
+def blending_weights(gaussians, cameras, batch_size, stride=1):
+    """Largest per-frame blending weight (in pixels) of every Gaussian over `cameras`, and the frames it is visible in."""
+    canonical = [gaussians.get_xyz, gaussians._scaling, gaussians._rotation, gaussians._opacity, gaussians.get_features]
+    num_points = gaussians.get_xyz.shape[0]
+    weight = torch.zeros(num_points, device="cuda")
+    visible = torch.zeros(num_points, dtype=torch.int32, device="cuda")
+    for viewpoint_cams in CameraPrefetcher(cameras, batch_size=batch_size, shuffle=False):
+        viewpoint_cams = viewpoint_cams[::stride]
+        B = len(viewpoint_cams)
+        aud, eye, cam = [torch.cat(feature, dim=0) for feature in zip(*[camera_features(c, "cuda") for c in viewpoint_cams])]
+        with torch.no_grad():
+            inputs = [t.detach().unsqueeze(0).repeat(B, *[1] * t.dim()) for t in canonical]
+            xyz, scales, rotations, opacity = [t.float() for t in gaussians._deformation(*inputs, aud, eye, cam)[:4]]
+            scales = gaussians.scaling_activation(scales)
+            rotations = torch.nn.functional.normalize(rotations, dim=2)
+            opacity = gaussians.opacity_activation(opacity)
+        for i, camera in enumerate(viewpoint_cams):
+            # with zero colors the image is the background; d(red channel sum) / d(red of a Gaussian) is its weight
+            colors = torch.zeros((num_points, 3), device="cuda", requires_grad=True)
+            rasterizer = make_rasterizer(camera, camera.bg_w_torso.to("cuda"), sh_degree=gaussians.active_sh_degree)
+            image, radii, _ = rasterizer(means3D=xyz[i], means2D=torch.zeros_like(xyz[i]), shs=None, colors_precomp=colors,
+                                         opacities=opacity[i], scales=scales[i], rotations=rotations[i], cov3D_precomp=None)
+            image[0].sum().backward()
+            weight = torch.maximum(weight, colors.grad[:, 0])
+            visible += (radii > 0).int()
+    return weight, visible
+
+
+def file_sizes(path):
+    sizes = {}
+    for name in (COMPACT_NAME, "point_cloud.ply", "deformation.pth"):
+        if os.path.exists(os.path.join(path, name)):
+            sizes[name] = os.path.getsize(os.path.join(path, name)) / 2 ** 20
+    return sizes
+
+
+def save(gaussians, model_path, output, iteration, sh_degree, compact):
+    path = os.path.join(output, "point_cloud", "iteration_" + str(iteration))
+    os.makedirs(path, exist_ok=True)
+    shutil.copy(os.path.join(model_path, "cfg_args"), os.path.join(output, "cfg_args"))
+    if compact:
+        gaussians.save_compact(os.path.join(path, COMPACT_NAME), sh_degree)
+    else:
+        gaussians.save_ply(os.path.join(path, "point_cloud.ply"), sh_degree)
+    gaussians.write_deformation(path, gaussians.capture_for_save())
+    return path
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Prune and compact a trained model")
+    model = ModelParams(parser, sentinel=True)
+    pipeline = PipelineParams(parser)
+    hyperparam = ModelHiddenParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--configs", type=str)
+    parser.add_argument("--output", type=str, required=True, help="folder of the compacted model")
+    parser.add_argument("--min_weight", type=float, default=0.5,
+                        help="prune the Gaussians whose blending weight stays below this many pixels in every training frame")
+    parser.add_argument("--sh_degree", type=int, default=None, help="keep the SH coefficients up to this degree")
+    parser.add_argument("--compact", action="store_true", help="write point_cloud.safetensors (fp16 SH, int16 rotations) instead of a PLY")
+    parser.add_argument("--stride", type=int, default=1, help="measure the weights on every n-th training frame")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--frames", type=int, default=None, help="validation frames rendered before and after (default: all)")
+    args = get_combined_args(parser)
+    if args.configs:
+        import mmcv
+        from utils.params_utils import merge_hparams
+        config = mmcv.Config.fromfile(args.configs)
+        args = merge_hparams(args, config)
+    args.only_infer = True
+    dataset, hyper, pipe = model.extract(args), hyperparam.extract(args), pipeline.extract(args)
+    assert os.path.abspath(args.output) != os.path.abspath(dataset.model_path), "--output must be a new folder"
+
+    gaussians = GaussianModel(dataset.sh_degree, hyper)
+    scene = Scene(dataset, gaussians, load_iteration=args.iteration, shuffle=False)
+    gaussians.eval()
+    source_path = os.path.join(dataset.model_path, "point_cloud", "iteration_" + str(scene.loaded_iter))
+    cameras = scene.getTestCameras()
+    frames = min(args.frames or len(cameras), len(cameras))
+    with torch.no_grad():
+        before, reference = evaluate(gaussians, pipe, cameras, args.batch, frames)
+    before.update(points=gaussians.get_xyz.shape[0], sh_degree=gaussians.active_sh_degree, files_mb=file_sizes(source_path))
+
+    weight, visible = blending_weights(gaussians, scene.getTrainCameras(), args.batch, args.stride)
+    keep = weight >= args.min_weight
+    print("Pruning {} of {} Gaussians ({} never visible)".format(
+        (~keep).sum().item(), keep.shape[0], (visible == 0).sum().item()))
+    gaussians.select_points(keep)
+    if args.sh_degree is not None:
+        gaussians.reduce_sh_degree(args.sh_degree)
+
+    with torch.no_grad():
+        after, _ = evaluate(gaussians, pipe, cameras, args.batch, frames, reference)
+    output_path = save(gaussians, dataset.model_path, args.output, scene.loaded_iter, args.sh_degree, args.compact)
+    after.update(points=gaussians.get_xyz.shape[0], sh_degree=gaussians.active_sh_degree, files_mb=file_sizes(output_path))
+
+    print("{:>8} {:>10} {:>4} {:>10} {:>8} {:>10} {:>8}".format("", "points", "SH", "files MB", "PSNR", "vs before", "fps"))
+    for name, run in (("before", before), ("after", after)):
+        print("{:>8} {:>10} {:>4} {:10.1f} {:8.2f} {:>10} {:8.1f}".format(
+            name, run["points"], run["sh_degree"], sum(run["files_mb"].values()), run["psnr"],
+            "-" if "psnr_vs_full" not in run else "{:.2f}".format(run["psnr_vs_full"]), run["render_fps"]))
+    with open(os.path.join(args.output, "compact_report.json"), "w") as f:
+        json.dump({"model": dataset.model_path, "iteration": scene.loaded_iter, "frames": frames,
+                   "min_weight": args.min_weight, "before": before, "after": after}, f, indent=2)
+    print("Render with: python render.py -s {} -m {} ...".format(dataset.source_path, args.output))
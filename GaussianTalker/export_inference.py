@@ -0,0 +1,52 @@
+#
+# Bakes the frame-independent part of the deformation network of a trained model into
+# point_cloud/iteration_<n>/inference.pth: the tri-plane (HexPlane) features of the canonical Gaussians
+# and the query projections of the first spatial-audio attention layer. render.py (only_infer) loads
+# them instead of sampling the grids; the file is ignored once it is older than deformation.pth or
+# the number of Gaussians changes.
+#
+#     python export_inference.py -m output/<model> --configs arguments/64_dim_1_transformer.py
+#
+import os
+from argparse import ArgumentParser
+
+import torch
+
+from arguments import ModelParams, get_combined_args, ModelHiddenParams
+from scene.gaussian_model import GaussianModel, INFERENCE_NAME
+from utils.compact_utils import COMPACT_NAME
+from utils.system_utils import searchForMaxIteration
+
+
+def export_inference(dataset : ModelParams, hyperparam, iteration : int):
+    if iteration == -1:
+        iteration = searchForMaxIteration(os.path.join(dataset.model_path, "point_cloud"))
+    path = os.path.join(dataset.model_path, "point_cloud", "iteration_" + str(iteration))
+    only_infer, hyperparam.only_infer = hyperparam.only_infer, False
+    gaussians = GaussianModel(dataset.sh_degree, hyperparam)
+    hyperparam.only_infer = only_infer
+    if os.path.exists(os.path.join(path, COMPACT_NAME)):
+        gaussians.load_compact(os.path.join(path, COMPACT_NAME))
+    else:
+        gaussians.load_ply(os.path.join(path, "point_cloud.ply"))
+    gaussians.load_model(path)
+    gaussians.eval()
+    gaussians.save_inference(path)
+    print("Exported {} Gaussians to {}".format(gaussians.get_xyz.shape[0], os.path.join(path, INFERENCE_NAME)))
+    return path
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Export a trained model for inference")
+    model = ModelParams(parser, sentinel=True)
+    hyperparam = ModelHiddenParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--configs", type=str)
+    args = get_combined_args(parser)
+    if args.configs:
+        import mmcv
+        from utils.params_utils import merge_hparams
+        config = mmcv.Config.fromfile(args.configs)
+        args = merge_hparams(args, config)
+    with torch.no_grad():
+        export_inference(model.extract(args), hyperparam.extract(args), args.iteration)
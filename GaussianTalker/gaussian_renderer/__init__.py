@@ -12,19 +12,80 @@ import numpy as np
 import torch
 import math
 from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianRasterizer
-from scene.gaussian_model import GaussianModel
+from scene.gaussian_model import GaussianModel, STATIC_ATTRIBUTES
+from utils.camera_utils import camera_features
+from utils.render_utils import conditioning_keys, conditioning_widths, projected_bounds, grow_face_rect, crop_window, crop_camera
 from time import time 
     
     
-def render_from_batch(viewpoint_cameras, pc : GaussianModel, pipe, random_color= False, scaling_modifier = 1.0, stage="fine", batch_size=1, visualize_attention=False, only_infer = False, canonical_tri_plane_factor_list = None, iteration=None):
+def append_static(deformed, static):
+    """
+    Deformed [B, N_dynamic, ...] attributes (attention [B, layer, N_dynamic, 4]) followed by the cached ones of
+    the static Gaussians, broadcast over the batch. The rasterizer does not depend on the order of the Gaussians.
+    """
+    batch_size = deformed[0].shape[0]
+    merged = []
+    for name, tensor in zip(STATIC_ATTRIBUTES, deformed):
+        cached = static[name].to(tensor.dtype)
+        if name == "attention":
+            cached = cached.transpose(0, 1) # [layer, N_static, 4]
+            merged.append(torch.cat([tensor, cached.unsqueeze(0).expand(batch_size, *cached.shape)], dim=2))
+        else:
+            merged.append(torch.cat([tensor, cached.unsqueeze(0).expand(batch_size, *cached.shape)], dim=1))
+    return merged
+    
+def make_rasterizer(viewpoint_camera, bg_image, scaling_modifier=1.0, sh_degree=3, debug=False):
+    tanfovx = math.tan(viewpoint_camera.FoVx * 0.5)
+    tanfovy = math.tan(viewpoint_camera.FoVy * 0.5)
+        
+    raster_settings = GaussianRasterizationSettings(
+        image_height=int(viewpoint_camera.image_height),
+        image_width=int(viewpoint_camera.image_width),
+        tanfovx= tanfovx,
+        tanfovy= tanfovy,
+        bg=bg_image,
+        scale_modifier=scaling_modifier,
+        viewmatrix=viewpoint_camera.world_view_transform.cuda(),
+        projmatrix=viewpoint_camera.full_proj_transform.cuda(),
+        sh_degree=sh_degree,
+        campos=viewpoint_camera.camera_center.cuda(),
+        prefiltered=False,
+        debug=debug
+    )
+    return GaussianRasterizer(raster_settings=raster_settings)
+
+def paste(image, canvas, window):
+    """image rendered in the crop `window` (top, left, height, width) of crop_camera, written into a copy of the full-frame canvas."""
+    if window is None:
+        return image
+    top, left, height, width = window
+    canvas = canvas.clone()
+    canvas[:, top:top + height, left:left + width] = image
+    return canvas
+    
+def render_from_batch(viewpoint_cameras, pc : GaussianModel, pipe, random_color= False, scaling_modifier = 1.0, stage="fine", batch_size=1, visualize_attention=False, only_infer = False, canonical_tri_plane_factor_list = None, iteration=None, amp_dtype=None, timer=None):
+    # with keyframe interpolation (render.py --keyframe_stride / --fps_multiplier) only keyframes are deformed
+    # and in-between output frames may be added
+    keyframes = pc.keyframes if only_infer and stage == "fine" else None
     if only_infer:
         time1 = time()
         batch_size = len(viewpoint_cameras)
-    means3D = pc.get_xyz.unsqueeze(0).repeat(batch_size, 1, 1) # [B, N, 3]
-    opacity = pc._opacity.unsqueeze(0).repeat(batch_size, 1, 1) # [B, N, 1]
-    shs = pc.get_features.unsqueeze(0).repeat(batch_size, 1, 1, 1) # [B, N, 16, 3]
-    scales = pc._scaling.unsqueeze(0).repeat(batch_size, 1, 1) # [B, N, 3]
-    rotations = pc._rotation.unsqueeze(0).repeat(batch_size, 1, 1) # [B, N, 4] 
+    if keyframes is not None:
+        viewpoint_cameras, times = keyframes.expand_cameras(viewpoint_cameras)
+        # output positions of the input frames
+        inputs = [i for i, t in enumerate(times) if t == int(t) and t >= 0]
+    else:
+        inputs = list(range(len(viewpoint_cameras)))
+    xyz, opacity, features, scaling, rotation = pc.get_xyz, pc._opacity, pc.get_features, pc._scaling, pc._rotation
+    # with a static partition (GaussianModel.partition_static) only the dynamic Gaussians are deformed
+    partition = pc.static_partition if only_infer and stage == "fine" else None
+    if partition is not None:
+        xyz, opacity, features, scaling, rotation = [t[partition["dynamic"]] for t in (xyz, opacity, features, scaling, rotation)]
+    means3D = xyz.unsqueeze(0).repeat(batch_size, 1, 1) # [B, N, 3]
+    opacity = opacity.unsqueeze(0).repeat(batch_size, 1, 1) # [B, N, 1]
+    shs = features.unsqueeze(0).repeat(batch_size, 1, 1, 1) # [B, N, 16, 3]
+    scales = scaling.unsqueeze(0).repeat(batch_size, 1, 1) # [B, N, 3]
+    rotations = rotation.unsqueeze(0).repeat(batch_size, 1, 1) # [B, N, 4] 
     attention = None
     colors_precomp = None
     cov3D_precomp = None
@@ -37,6 +98,7 @@ def render_from_batch(viewpoint_cameras, pc : GaussianModel, pipe, random_color=
     means2Ds = []
     lips_list = []
     bg_w_torso_list = []
+    backgrounds = []
     gt_masks = []
     gt_w_bg = []
     cam_features = []
@@ -60,34 +122,19 @@ def render_from_batch(viewpoint_cameras, pc : GaussianModel, pipe, random_color=
             background = torch.full((3,), white_or_black, dtype=torch.float32, device="cuda")
             bg_image = background[:, None, None] * torch.ones((1, viewpoint_camera.image_height, viewpoint_camera.image_width), device=background.device)
         
-        aud_features.append(viewpoint_camera.aud_f.unsqueeze(0).to(means3D.device))
-        eye_features.append(torch.from_numpy(np.array([viewpoint_camera.eye_f])).unsqueeze(0).to(means3D.device))
-        cam_features.append(torch.from_numpy(np.concatenate((viewpoint_camera.R.reshape(-1), viewpoint_camera.T.reshape(-1))).reshape(1,-1)).to(means3D.device))
+        aud_feature, eye_feature, cam_feature = camera_features(viewpoint_camera, means3D.device)
+        aud_features.append(aud_feature)
+        eye_features.append(eye_feature)
+        cam_features.append(cam_feature)
         bg_w_torso_list.append(viewpoint_camera.bg_w_torso.cpu())
         
         bg_image = viewpoint_camera.bg_w_torso.to('cuda')
+        backgrounds.append(bg_image)
         
-        tanfovx = math.tan(viewpoint_camera.FoVx * 0.5)
-        tanfovy = math.tan(viewpoint_camera.FoVy * 0.5)
-            
-        raster_settings = GaussianRasterizationSettings(
-            image_height=int(viewpoint_camera.image_height),
-            image_width=int(viewpoint_camera.image_width),
-            tanfovx= tanfovx,
-            tanfovy= tanfovy,
-            bg=bg_image,
-            scale_modifier=scaling_modifier,
-            viewmatrix=viewpoint_camera.world_view_transform.cuda(),
-            projmatrix=viewpoint_camera.full_proj_transform.cuda(),
-            sh_degree=pc.active_sh_degree,
-            campos=viewpoint_camera.camera_center.cuda(),
-            prefiltered=False,
-            debug=pipe.debug
-        )
-        rasterizers.append(GaussianRasterizer(raster_settings=raster_settings))
+        rasterizers.append(make_rasterizer(viewpoint_camera, bg_image, scaling_modifier, pc.active_sh_degree, pipe.debug))
 
         bg_mask = viewpoint_camera.head_mask 
-        bg_mask = torch.from_numpy(bg_mask).to("cuda")
+        bg_mask = torch.as_tensor(bg_mask, device="cuda")
         gt_image = viewpoint_camera.original_image.cuda()
         gt_w_bg.append(gt_image.unsqueeze(0))
         gt_image = gt_image * bg_mask + bg_image * (~ bg_mask)
@@ -96,9 +143,15 @@ def render_from_batch(viewpoint_cameras, pc : GaussianModel, pipe, random_color=
         bg_mask = bg_mask.to(torch.float).unsqueeze(0).unsqueeze(0)
         gt_masks.append(bg_mask)
     
+    if timer is not None:
+        timer.lap("camera_setup")
+
     if stage == "coarse":
         aud_features, eye_features, cam_features = None, None, None 
-        means3D_final, scales_temp, rotations_temp, opacity_temp, shs_temp = pc._deformation(means3D, scales, rotations, opacity, shs, aud_features, eye_features, cam_features)
+        with torch.autocast("cuda", dtype=amp_dtype or torch.float16, enabled=amp_dtype is not None):
+            deformed = pc._deformation(means3D, scales, rotations, opacity, shs, aud_features, eye_features, cam_features)
+        # the rasterizer only takes fp32 inputs
+        means3D_final, scales_temp, rotations_temp, opacity_temp, shs_temp = [t.float() for t in deformed]
         if "scales" in canonical_tri_plane_factor_list:
             scales_temp = scales_temp-2
             scales_final = scales_temp
@@ -131,12 +184,41 @@ def render_from_batch(viewpoint_cameras, pc : GaussianModel, pipe, random_color=
         aud_features = torch.cat(aud_features,dim=0)
         eye_features = torch.cat(eye_features,dim=0)
         cam_features = torch.cat(cam_features,dim=0)
-        means3D_final, scales_final, rotations_final, opacity_final, shs_final, attention = pc._deformation(means3D, scales, rotations, opacity, shs, aud_features, eye_features,cam_features)
+        # with a compiled deformation (GaussianModel.compile_deformation) every batch runs the same graph
+        deformation = pc.compiled_deformation if only_infer and pc.compiled_deformation is not None else pc._deformation
+        def deform(frames):
+            # frames index the input frames; the canonical inputs are the same for every frame of the batch
+            count = len(frames)
+            positions = [inputs[f] for f in frames]
+            with torch.autocast("cuda", dtype=amp_dtype or torch.float16, enabled=amp_dtype is not None):
+                deformed = deformation(means3D[:count], scales[:count], rotations[:count], opacity[:count], shs[:count],
+                                           aud_features[positions], eye_features[positions], cam_features[positions])
+            # the rasterizer only takes fp32 inputs
+            return [t.float() for t in deformed[:5]] + [deformed[5]]
+        # with a deformation cache (render.py --reuse_tolerance) frames conditioned like an earlier one reuse its result
+        cache = pc.deformation_cache if only_infer else None
+        keys = None
+        if cache is not None or keyframes is not None:
+            keys = conditioning_keys(aud_features[inputs], eye_features[inputs], cam_features[inputs])
+        compute = deform
+        if cache is not None:
+            widths = conditioning_widths(aud_features, eye_features, cam_features)
+            compute = lambda frames: cache.deform(keys[frames], lambda subset: deform([frames[i] for i in subset]), widths)
+        if keyframes is not None:
+            deformed = keyframes.deform(keys, times, compute)
+        else:
+            deformed = compute(list(range(len(inputs))))
+        means3D_final, scales_final, rotations_final, opacity_final, shs_final, attention = deformed
+        if partition is not None:
+            means3D_final, scales_final, rotations_final, opacity_final, shs_final, attention = append_static(
+                [means3D_final, scales_final, rotations_final, opacity_final, shs_final, attention], partition["static"])
                                                                                                     
         scales_final = pc.scaling_activation(scales_final)
         rotations_final = torch.nn.functional.normalize(rotations_final,dim=2) 
         opacity_final = pc.opacity_activation(opacity_final)
         
+    if timer is not None:
+        timer.lap("deformation")
     
     rendered_image_list = []
     radii_list = []
@@ -148,6 +230,22 @@ def render_from_batch(viewpoint_cameras, pc : GaussianModel, pipe, random_color=
     null_image_list = []
     rendered_lips = []
     gt_lips = []
+
+    # with pipe.crop only a window holding the head is rasterized, then pasted into bg_w_torso: "bounds" fits every
+    # pixel the Gaussians can reach, "face" the tracked face_rect grown to the forehead and hair (approximate)
+    windows = [None] * len(rasterizers)
+    if only_infer and pipe.crop:
+        assert pipe.crop in ("bounds", "face"), "unknown crop mode {}".format(pipe.crop)
+        if pipe.crop == "face":
+            bounds = [grow_face_rect(camera.face_rect) for camera in viewpoint_cameras]
+        else:
+            bounds = projected_bounds(viewpoint_cameras, means3D_final, scales_final, opacity_final)
+        for idx, camera in enumerate(viewpoint_cameras):
+            center = [camera.image_height / 2, camera.image_height / 2, camera.image_width / 2, camera.image_width / 2]
+            windows[idx] = crop_window(bounds[idx] or center, camera.image_width, camera.image_height, pipe.crop_margin)
+            top, left, height, width = windows[idx]
+            rasterizers[idx] = make_rasterizer(crop_camera(camera, windows[idx]), backgrounds[idx][:, top:top + height, left:left + width].contiguous(),
+                                               scaling_modifier, pc.active_sh_degree, pipe.debug)
     
     for idx, rasterizer in enumerate(rasterizers):
         colors_precomp = None
@@ -160,6 +258,8 @@ def render_from_batch(viewpoint_cameras, pc : GaussianModel, pipe, random_color=
             scales = scales_final[idx],
             rotations = rotations_final[idx],
             cov3D_precomp = cov3D_precomp,)
+        rendered_image = paste(rendered_image, backgrounds[idx], windows[idx])
+        depth = paste(depth, torch.zeros_like(backgrounds[idx][:1]), windows[idx])
 
         rendered_image_list.append(rendered_image.unsqueeze(0))
         radii_list.append(radii.unsqueeze(0))
@@ -235,6 +335,8 @@ def render_from_batch(viewpoint_cameras, pc : GaussianModel, pipe, random_color=
                 rotations = rotations_final[idx],
                 cov3D_precomp = cov3D_precomp,)
 
+            audio_image, eye_image, cam_image, null_image = [paste(image, backgrounds[idx], windows[idx])
+                                                              for image in (audio_image, eye_image, cam_image, null_image)]
             audio_image_list.append(audio_image.unsqueeze(dim=0))
             eye_image_list.append(eye_image.unsqueeze(dim=0))
             cam_image_list.append(cam_image.unsqueeze(dim=0))
@@ -263,6 +365,8 @@ def render_from_batch(viewpoint_cameras, pc : GaussianModel, pipe, random_color=
         gt_lips_tensor = torch.cat(gt_lips,0)
     if only_infer:
         inference_time = time()-time1
+    if timer is not None:
+        timer.lap("rasterization")
         
         
     return {"rendered_image_tensor": rendered_image_tensor,
@@ -23,7 +23,9 @@ from argparse import ArgumentParser
 from arguments import ModelParams, PipelineParams, get_combined_args, ModelHiddenParams
 from gaussian_renderer import GaussianModel
 import concurrent.futures
-from torch.utils.data import DataLoader
+from utils.loader_utils import CameraPrefetcher
+from utils.timer import StageTimer
+from utils.render_utils import DeformationCache, KeyframeInterpolator
 
 def multithread_write(image_list, path):
     executor = concurrent.futures.ThreadPoolExecutor(max_workers=None)
@@ -42,10 +44,23 @@ def multithread_write(image_list, path):
         if status == False:
             write_image(image_list[index], index, path)
     
+# deformation network precision: autocast dtype on the GPU, or int8 on the CPU (deform_network.quantize_for_cpu)
+PRECISIONS = {"fp32": None, "fp16": torch.float16, "bf16": torch.bfloat16, "int8": None}
+
 to8b = lambda x : (255*np.clip(x.cpu().numpy(),0,1)).astype(np.uint8)
 
 
-def render_set(model_path, name, iteration, scene, gaussians, pipeline,audio_dir, batch_size):
+def trim_frames(frames, count, fps_multiplier):
+    """The first `count` input frames of a render with fps_multiplier - 1 interpolated frames after each of them."""
+    frames = frames[:(count - 1) * fps_multiplier + 1]
+    # the last input frame has nothing to interpolate towards
+    return torch.cat([frames] + [frames[-1:]] * (fps_multiplier - 1))
+
+
+def render_set(model_path, name, iteration, scene, gaussians, pipeline,audio_dir, batch_size, timer=None, amp_dtype=None):
+    # timer: StageTimer collecting dataloading / deformation / rasterization / d2h / collect / encode / mux times
+    if timer is None:
+        timer = StageTimer(enabled=False)
     render_path = os.path.join(model_path, name, "ours_{}".format(iteration), "renders")
     gts_path = os.path.join(model_path, name, "ours_{}".format(iteration), "gt")
     inf_audio_dir = audio_dir
@@ -55,7 +70,7 @@ def render_set(model_path, name, iteration, scene, gaussians, pipeline,audio_dir
         makedirs(gts_path, exist_ok=True)
     
     viewpoint_stack = scene
-    viewpoint_stack_loader = DataLoader(viewpoint_stack, batch_size=batch_size,shuffle=False,num_workers=32,collate_fn=list)
+    viewpoint_stack_loader = CameraPrefetcher(viewpoint_stack, batch_size=batch_size, shuffle=False)
     
     loader = iter(viewpoint_stack_loader)
     
@@ -70,6 +85,8 @@ def render_set(model_path, name, iteration, scene, gaussians, pipeline,audio_dir
         print("        test set rendering  :   {}  frames  ".format(process_until))
         print(" -------------------------------------------------") 
     print("point nums:",gaussians._xyz.shape[0])
+    # --fps_multiplier renders interpolated frames between the input frames
+    fps_multiplier = gaussians.keyframes.fps_multiplier if gaussians.keyframes is not None else 1
     image = []
     gt = []
     audio_attention = []
@@ -81,36 +98,45 @@ def render_set(model_path, name, iteration, scene, gaussians, pipeline,audio_dir
     if process_until % batch_size != 0:
         iterations += 1
     total_time = 0
+    timer.start()
+    if gaussians.keyframes is not None:
+        gaussians.keyframes.reset()
     #render image
     for idx in tqdm(range(iterations), desc="Rendering progress",total = iterations):
 
         viewpoint_cams = next(loader)
+        timer.lap("dataloading")
         try:
             output = render_from_batch(viewpoint_cams, gaussians, pipeline, 
                                 random_color= False, stage='fine',
-                                batch_size=batch_size, visualize_attention=False, only_infer=True)
+                                batch_size=batch_size, visualize_attention=False, only_infer=True, amp_dtype=amp_dtype, timer=timer)
         except:
             break
         total_time += output["inference_time"]
         image.append(output["rendered_image_tensor"].cpu())
         gt.append(output["gt_tensor"].cpu())
+        timer.lap("d2h")
         
-    image_tensor = torch.cat(image,dim=0)[:process_until]
-    gt_image_tensor = torch.cat(gt,dim=0)[:process_until]
+    image_tensor = trim_frames(torch.cat(image,dim=0), process_until, fps_multiplier)
+    gt_image_tensor = torch.cat(gt,dim=0)[::fps_multiplier][:process_until]
     
     print("total frame:",(image_tensor.shape[0]))
     print("FPS:",(torch.cat(image,dim=0).shape[0])/(total_time))
+    timer.lap("collect")
     
     
     #render attention
+    # a second pass over the frames, not part of rendering: its data loading is timed as "attention" as well
     loader = iter(viewpoint_stack_loader)
+    if gaussians.keyframes is not None:
+        gaussians.keyframes.reset()
     for idx in range(iterations):
 
         viewpoint_cams = next(loader)
         try:
             output = render_from_batch(viewpoint_cams, gaussians, pipeline, 
                                 random_color= False, stage='fine',
-                                batch_size=batch_size, visualize_attention=True, only_infer=True) 
+                                batch_size=batch_size, visualize_attention=True, only_infer=True, amp_dtype=amp_dtype)
         except:
             break
         total_time += output["inference_time"]
@@ -118,20 +144,24 @@ def render_set(model_path, name, iteration, scene, gaussians, pipeline,audio_dir
         eye_attention.append(output["eye_attention"].cpu())
         cam_attention.append(output["cam_attention"].cpu())
         null_attention.append(output["null_attention"].cpu())
+        timer.lap("attention")
         
         
-    audio_tensor = torch.cat(audio_attention,0)[:process_until]
-    eye_tensor = torch.cat(eye_attention,0)[:process_until]
-    cam_tensor = torch.cat(cam_attention,0)[:process_until]
-    null_tensor = torch.cat(null_attention,0)[:process_until]
+    audio_tensor = trim_frames(torch.cat(audio_attention,0), process_until, fps_multiplier)
+    eye_tensor = trim_frames(torch.cat(eye_attention,0), process_until, fps_multiplier)
+    cam_tensor = trim_frames(torch.cat(cam_attention,0), process_until, fps_multiplier)
+    null_tensor = trim_frames(torch.cat(null_attention,0), process_until, fps_multiplier)
+    fps = 25 * fps_multiplier
+    timer.lap("collect")
     
     if name != 'custom':
         write_frames_to_video(tensor_to_image(gt_image_tensor),gts_path+f'/gt', use_imageio = True)
-    write_frames_to_video(tensor_to_image(image_tensor),render_path+'/renders', use_imageio = True)
-    write_frames_to_video(tensor_to_image(audio_tensor),render_path+'/audio', use_imageio = False)
-    write_frames_to_video(tensor_to_image(eye_tensor),render_path+'/eye', use_imageio = False)
-    write_frames_to_video(tensor_to_image(null_tensor),render_path+'/null', use_imageio = False)
-    write_frames_to_video(tensor_to_image(cam_tensor),render_path+'/cam', use_imageio = False)
+    write_frames_to_video(tensor_to_image(image_tensor),render_path+'/renders', fps=fps, use_imageio = True)
+    write_frames_to_video(tensor_to_image(audio_tensor),render_path+'/audio', fps=fps, use_imageio = False)
+    write_frames_to_video(tensor_to_image(eye_tensor),render_path+'/eye', fps=fps, use_imageio = False)
+    write_frames_to_video(tensor_to_image(null_tensor),render_path+'/null', fps=fps, use_imageio = False)
+    write_frames_to_video(tensor_to_image(cam_tensor),render_path+'/cam', fps=fps, use_imageio = False)
+    timer.lap("encode")
 
     if name != 'custom':
         cmd = f'ffmpeg -loglevel quiet -y -i {gts_path}/gt.mp4 -i {inf_audio_dir} -c:v copy -c:a aac {gts_path}/{model_path.split("/")[-2]}_{name}_{iteration}iter_gt.mov'
@@ -154,28 +184,55 @@ def render_set(model_path, name, iteration, scene, gaussians, pipeline,audio_dir
     os.remove(f"{render_path}/eye.mp4")
     os.remove(f"{render_path}/null.mp4")
     os.remove(f"{render_path}/cam.mp4")
+    timer.lap("mux")
     
 def render_sets(dataset : ModelParams, hyperparam, iteration : int, pipeline : PipelineParams, args):
     skip_train, skip_test, skip_video, batch_size= args.skip_train, args.skip_test, args.skip_video, args.batch
+    timer = StageTimer(enabled=args.timing)
     
     with torch.no_grad():
+        timer.start()
         data_dir = dataset.source_path
         gaussians = GaussianModel(dataset.sh_degree, hyperparam)
         scene = Scene(dataset, gaussians, load_iteration=iteration, shuffle=False, custom_aud=args.custom_aud)
         
         gaussians.eval()
+        if pipeline.crop == "face":
+            print("[WARNING] --crop face keeps the grown face rect only, Gaussians outside it are replaced by the background; --crop bounds is exact")
+        if args.static_threshold is not None:
+            print("Static Gaussians (not deformed): {:.1%}".format(gaussians.partition_static(args.static_threshold)))
+        if args.reuse_tolerance is not None:
+            gaussians.deformation_cache = DeformationCache((args.reuse_tolerance, args.reuse_eye_tolerance, args.reuse_camera_tolerance),
+                                                          args.reuse_cache_size, args.reuse_cache_mb * 2 ** 20)
+        if args.keyframe_stride > 1 or args.keyframe_threshold is not None or args.fps_multiplier > 1:
+            gaussians.keyframes = KeyframeInterpolator(args.keyframe_stride, args.keyframe_threshold, args.fps_multiplier)
+            if batch_size % args.keyframe_stride != 0:
+                # the last frame of a batch always is a keyframe, so only a multiple of the stride keeps it
+                batch_size = -(-batch_size // args.keyframe_stride) * args.keyframe_stride
+                print("[WARNING] --batch rounded up to {}, a multiple of --keyframe_stride {}".format(batch_size, args.keyframe_stride))
+        if args.precision == "int8":
+            gaussians._deformation.quantize_for_cpu()
+        amp_dtype = PRECISIONS[args.precision]
+        if args.compile_deformation is not None:
+            gaussians.compile_deformation(batch_size, args.compile_deformation)
+        timer.lap("scene_load")
         
         if args.custom_aud != '':
             audio_dir = os.path.join(data_dir, args.custom_wav)
-            render_set(dataset.model_path, "custom", scene.loaded_iter, scene.getCustomCameras(), gaussians, pipeline, audio_dir, batch_size)
+            render_set(dataset.model_path, "custom", scene.loaded_iter, scene.getCustomCameras(), gaussians, pipeline, audio_dir, batch_size, timer, amp_dtype)
         
         if not skip_train:
             audio_dir = os.path.join(data_dir, "aud_train.wav")
-            render_set(dataset.model_path, "train", scene.loaded_iter, scene.getTrainCameras(), gaussians, pipeline, audio_dir, batch_size)
+            render_set(dataset.model_path, "train", scene.loaded_iter, scene.getTrainCameras(), gaussians, pipeline, audio_dir, batch_size, timer, amp_dtype)
 
         if not skip_test:
             audio_dir = os.path.join(data_dir, "aud_novel.wav")
-            render_set(dataset.model_path, "test",iteration, scene.getTestCameras(), gaussians, pipeline, audio_dir, batch_size)
+            render_set(dataset.model_path, "test",iteration, scene.getTestCameras(), gaussians, pipeline, audio_dir, batch_size, timer, amp_dtype)
+    timer.report("RENDER TIMING")
+    if gaussians.deformation_cache is not None:
+        gaussians.deformation_cache.report()
+    if gaussians.keyframes is not None:
+        gaussians.keyframes.report()
 
 def write_frames_to_video(frames, path, codec='mp4v', fps=25, use_imageio=False):
     if use_imageio:
@@ -220,6 +277,26 @@ if __name__ == "__main__":
     parser.add_argument("--batch", type=int, required=True)
     parser.add_argument("--custom_aud", type=str, default='')
     parser.add_argument("--custom_wav", type=str, default='')
+    parser.add_argument("--timing", action="store_true", help="print the wall time of every render stage (synchronizes CUDA)")
+    parser.add_argument("--reuse_tolerance", type=float, default=None,
+                        help="reuse the deformation of a frame whose DeepSpeech features differ by at most this (0: identical), "
+                             "and whose eye and camera features are within --reuse_eye_tolerance / --reuse_camera_tolerance")
+    parser.add_argument("--reuse_eye_tolerance", type=float, default=0.01, help="eye feature (in [0, 1]) tolerance of --reuse_tolerance")
+    parser.add_argument("--reuse_camera_tolerance", type=float, default=1e-4,
+                        help="camera rotation / translation tolerance of --reuse_tolerance")
+    parser.add_argument("--reuse_cache_size", type=int, default=None,
+                        help="deformed frames kept for --reuse_tolerance (default: as many as fit in --reuse_cache_mb)")
+    parser.add_argument("--reuse_cache_mb", type=int, default=256,
+                        help="GPU memory for --reuse_tolerance; a frame takes about 130 bytes per Gaussian (13 MB for 100k)")
+    parser.add_argument("--keyframe_stride", type=int, default=1, help="deform every n-th frame and interpolate the others (the last frame of a batch always is a keyframe, so --batch is rounded up to a multiple of it)")
+    parser.add_argument("--keyframe_threshold", type=float, default=None,
+                        help="also make a keyframe once the audio/eye/camera features moved by more than this")
+    parser.add_argument("--fps_multiplier", type=int, default=1, help="render interpolated frames in between, e.g. 2 for 50 fps")
+    parser.add_argument("--static_threshold", type=float, default=None, help="skip deforming the Gaussians analyze_static.py scored at most this (1: every attribute within its tolerance)")
+    parser.add_argument("--precision", type=str, default="fp32", choices=list(PRECISIONS),
+                        help="deformation network precision: fp16 / bf16 autocast on the GPU, or int8 on the CPU")
+    parser.add_argument("--compile_deformation", type=str, default=None, choices=["trace", "compile"],
+                        help="run the deformation network as one TorchScript (trace) or torch.compile graph")
     # parser.add_argument("--audio_dir", type=str)
     args = get_combined_args(parser)
     print("Rendering " , args.model_path)
@@ -228,6 +305,8 @@ if __name__ == "__main__":
         from utils.params_utils import merge_hparams
         config = mmcv.Config.fromfile(args.configs)
         args = merge_hparams(args, config)
+    if args.compile_deformation is not None and PRECISIONS[args.precision] is not None:
+        parser.error("--compile_deformation traces the network in fp32 or int8, not under {} autocast".format(args.precision))
     # Initialize system state (RNG)
     safe_state(args.quiet)
     args.only_infer = True
@@ -15,7 +15,7 @@ import json
 from utils.system_utils import searchForMaxIteration
 # from scene.dataset_readers import sceneLoadTypeCallbacks
 from scene.talking_dataset_readers import sceneLoadTypeCallbacks2
-from scene.gaussian_model import GaussianModel
+from scene.gaussian_model import GaussianModel, INFERENCE_NAME
 from scene.dataset import FourDGSdataset
 from arguments import ModelParams
 from utils.camera_utils import cameraList_from_camInfos, camera_to_JSON
@@ -23,6 +23,8 @@ from torch.utils.data import Dataset
 from scene.dataset_readers import add_points
 
 from torchvision.utils import save_image
+from utils.checkpoint_utils import AsyncWriter
+from utils.compact_utils import COMPACT_NAME, compact_arrays, write_compact
 class Scene:
 
     gaussians : GaussianModel
@@ -33,8 +35,10 @@ class Scene:
         :param path: Path to colmap scene main folder.
         """
         self.model_path = args.model_path
+        self.compact_checkpoint = getattr(args, "compact_checkpoint", False)
         self.loaded_iter = None
         self.gaussians = gaussians
+        self.writer = AsyncWriter()
         
         if load_iteration:
             if load_iteration == -1:
@@ -72,7 +76,11 @@ class Scene:
             scene_info = scene_info._replace(point_cloud=add_points(scene_info.point_cloud, xyz_max=xyz_max, xyz_min=xyz_min))
         self.gaussians._deformation.deformation_net.set_aabb(xyz_max,xyz_min)
         if self.loaded_iter:
-            self.gaussians.load_ply(os.path.join(self.model_path,
+            compact_path = os.path.join(self.model_path, "point_cloud", "iteration_" + str(self.loaded_iter), COMPACT_NAME)
+            if os.path.exists(compact_path):
+                self.gaussians.load_compact(compact_path)
+            else:
+                self.gaussians.load_ply(os.path.join(self.model_path,
                                                            "point_cloud",
                                                            "iteration_" + str(self.loaded_iter),
                                                            "point_cloud.ply"))
@@ -83,17 +91,41 @@ class Scene:
         else:
             self.gaussians.create_from_pcd(scene_info.point_cloud, self.cameras_extent, self.maxtime)
 
-    def save(self, iteration, stage, image=None, image_idx = None):
+    def save(self, iteration, stage, image=None, image_idx = None, blocking=False):
+        """
+        Queues copies of the Gaussians, the deformation network and the preview image to pinned host memory
+        and writes them from a background thread; only waits if the previous save is still being written.
+        """
         if stage == "coarse":
             point_cloud_path = os.path.join(self.model_path, "point_cloud/coarse_iteration_{}".format(iteration))
 
         else:
             point_cloud_path = os.path.join(self.model_path, "point_cloud/iteration_{}".format(iteration))
-        self.gaussians.save_ply(os.path.join(point_cloud_path, "point_cloud.ply"))
-        self.gaussians.save_deformation(point_cloud_path)
-        
+        state = self.gaussians.capture_for_save()
         if image is not None:
-            save_image(image, os.path.join(point_cloud_path, str(image_idx) + ".png"))
+            state["image"] = image.detach()
+
+        def write(snapshot):
+            GaussianModel.write_ply(os.path.join(point_cloud_path, "point_cloud.ply"), snapshot)
+            GaussianModel.write_deformation(point_cloud_path, snapshot)
+            compact_path = os.path.join(point_cloud_path, COMPACT_NAME)
+            if self.compact_checkpoint:
+                write_compact(compact_path, compact_arrays(*[snapshot[key].numpy() for key in ("xyz", "f_dc", "f_rest", "opacity", "scaling", "rotation")]))
+            elif os.path.exists(compact_path):
+                # a compact file left from an earlier run would shadow the new PLY when loading
+                os.remove(compact_path)
+            if os.path.exists(os.path.join(point_cloud_path, INFERENCE_NAME)):
+                # baked for the previous weights
+                os.remove(os.path.join(point_cloud_path, INFERENCE_NAME))
+            if image is not None:
+                save_image(snapshot["image"], os.path.join(point_cloud_path, str(image_idx) + ".png"))
+
+        self.writer.submit(write, state)
+        if blocking:
+            self.writer.wait()
+
+    def wait_for_save(self):
+        self.writer.wait()
         
     def getTrainCameras(self, scale=1.0):
         return self.train_camera
@@ -18,6 +18,15 @@ def create_transformation_matrix(R, T):
     return T_homogeneous
 
 
+def to_uint8(image):
+    """Preloaded images are stored as floats in [0, 1]; they were decoded from 8 bit files so this is lossless."""
+    if isinstance(image, np.ndarray):
+        image = torch.from_numpy(image)
+    if image.dtype == torch.uint8:
+        return image
+    return (image * 255).round().to(torch.uint8)
+
+
 class FourDGSdataset(Dataset):
     def __init__(
         self,
@@ -31,57 +40,67 @@ class FourDGSdataset(Dataset):
         self.dataset_type=dataset_type
     def __getitem__(self, index):
         if self.dataset_type != "PanopticSports":
-
-            caminfo = self.dataset[index]
-            R = caminfo.R  # (3, 3)
-            T = caminfo.T
-            FovX = caminfo.FovX
-            FovY = caminfo.FovY
-            trans = caminfo.trans.cpu().numpy()
-
-            mask = caminfo.mask
-            
-            full_image = caminfo.full_image
-            if full_image is None:
-                full_image = cv2.imread(caminfo.full_image_path, cv2.IMREAD_UNCHANGED)
-                full_image = cv2.cvtColor(full_image, cv2.COLOR_BGR2RGB)
-                full_image = torch.from_numpy(full_image).permute(2,0,1).float() / 255.0
-                
-            torso_image = caminfo.torso_image
-            if torso_image is None:
-                torso_image = cv2.imread(caminfo.torso_image_path, cv2.IMREAD_UNCHANGED) # [H, W, 4]
-                torso_image = cv2.cvtColor(torso_image, cv2.COLOR_BGRA2RGBA)
-                torso_image = torso_image.astype(np.float32) / 255 # [H, W, 3/4]
-                torso_image = torch.from_numpy(torso_image) # [3/4, H, W]
-                torso_image = torso_image.permute(2, 0, 1)
-
-                
-            bg_image = caminfo.bg_image
-            if bg_image is None:
-                bg_img = cv2.imread(caminfo.bg_image_path, cv2.IMREAD_UNCHANGED) # [H, W, 3]
-                if bg_img.shape[0] != caminfo.height or bg_img.shape[1] != caminfo.width:
-                    bg_img = cv2.resize(bg_img, (caminfo.width, caminfo.height), interpolation=cv2.INTER_AREA)
-                bg_img = cv2.cvtColor(bg_img, cv2.COLOR_BGR2RGB)
-                bg_image = torch.from_numpy(bg_img).permute(2,0,1).float() / 255.0
-            
-            seg = caminfo.mask
-            if seg is None:
-                seg = cv2.imread(caminfo.mask_path)
-            head_mask = (seg[..., 0] == 255) & (seg[..., 1] == 0) & (seg[..., 2] == 0)
-            bg_w_torso = torso_image[:3,...] * torso_image[3:,...] + bg_image * (1-torso_image[3:,...])
-                        
-            face_rect = caminfo.face_rect
-            lhalf_rect = caminfo.lhalf_rect
-            eye_rect = caminfo.eye_rect
-            lips_rect = caminfo.lips_rect
-            
-            return Camera(colmap_id=index,R=R,T=T,FoVx=FovX,FoVy=FovY,gt_image=full_image, head_mask=head_mask, bg_image = bg_image,
-                    image_name=f"{index}",uid=index,data_device=torch.device("cuda"), #trans=trans,
-                    aud_f = caminfo.aud_f, eye_f = caminfo.eye_f,
-                    face_rect=face_rect, lhalf_rect=lhalf_rect, eye_rect=eye_rect, lips_rect=lips_rect, bg_w_torso = bg_w_torso)
-            
+            return self.make_camera(self.load_frame(index))
         else:
             return self.dataset[index]
+
+    def load_frame(self, index):
+        """
+        Decodes the images of one frame as uint8 tensors (8 bits per channel instead of 32) so they are
+        cheap to move between loader workers and to the GPU; make_camera turns the record into a Camera.
+        """
+        caminfo = self.dataset[index]
+
+        full_image = caminfo.full_image
+        if full_image is None:
+            full_image = cv2.imread(caminfo.full_image_path, cv2.IMREAD_UNCHANGED)
+            full_image = cv2.cvtColor(full_image, cv2.COLOR_BGR2RGB)
+            full_image = torch.from_numpy(full_image).permute(2,0,1)
+        else:
+            full_image = to_uint8(full_image)
+
+        torso_image = caminfo.torso_image
+        if torso_image is None:
+            torso_image = cv2.imread(caminfo.torso_image_path, cv2.IMREAD_UNCHANGED) # [H, W, 4]
+            torso_image = cv2.cvtColor(torso_image, cv2.COLOR_BGRA2RGBA)
+            torso_image = torch.from_numpy(torso_image).permute(2, 0, 1) # [4, H, W]
+        else:
+            torso_image = to_uint8(torso_image).permute(2, 0, 1)
+
+        bg_image = caminfo.bg_image
+        if bg_image is None:
+            bg_img = cv2.imread(caminfo.bg_image_path, cv2.IMREAD_UNCHANGED) # [H, W, 3]
+            if bg_img.shape[0] != caminfo.height or bg_img.shape[1] != caminfo.width:
+                bg_img = cv2.resize(bg_img, (caminfo.width, caminfo.height), interpolation=cv2.INTER_AREA)
+            bg_img = cv2.cvtColor(bg_img, cv2.COLOR_BGR2RGB)
+            bg_image = torch.from_numpy(bg_img).permute(2,0,1)
+        else:
+            bg_image = to_uint8(bg_image)
+
+        seg = caminfo.mask
+        if seg is None:
+            seg = cv2.imread(caminfo.mask_path)
+        head_mask = (seg[..., 0] == 255) & (seg[..., 1] == 0) & (seg[..., 2] == 0)
+
+        return {"index": index, "image": full_image.contiguous(), "torso": torso_image.contiguous(),
+                "bg": bg_image.contiguous(), "head_mask": torch.from_numpy(head_mask)}
+
+    def make_camera(self, frame):
+        """Builds the Camera for a record from load_frame; the image tensors may already live on the GPU."""
+        index = frame["index"]
+        caminfo = self.dataset[index]
+        full_image = frame["image"].float() / 255.0
+        torso_image = frame["torso"].float() / 255.0
+        bg_image = frame["bg"].float() / 255.0
+        bg_w_torso = torso_image[:3,...] * torso_image[3:,...] + bg_image * (1-torso_image[3:,...])
+        head_mask = frame["head_mask"]
+        if not head_mask.is_cuda:
+            head_mask = head_mask.numpy()
+
+        return Camera(colmap_id=index,R=caminfo.R,T=caminfo.T,FoVx=caminfo.FovX,FoVy=caminfo.FovY,gt_image=full_image, head_mask=head_mask, bg_image = bg_image,
+                image_name=f"{index}",uid=index,data_device=torch.device("cuda"), #trans=trans,
+                aud_f = caminfo.aud_f, eye_f = caminfo.eye_f,
+                face_rect=caminfo.face_rect, lhalf_rect=caminfo.lhalf_rect, eye_rect=caminfo.eye_rect, lips_rect=caminfo.lips_rect, bg_w_torso = bg_w_torso)
     
     def __len__(self):
         
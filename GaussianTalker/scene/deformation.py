@@ -37,6 +37,7 @@ class Deformation(nn.Module):
         self.args = args
         self.only_infer = args.only_infer
         self.enc_x = None
+        self.enc_q = None
         self.aud_ch_att = None
         
         # self.args.empty_voxel=True
@@ -65,7 +66,7 @@ class Deformation(nn.Module):
         
     @property
     def get_aabb(self):
-        return self.grid.get_aabb
+        return self.tri_plane.grid.get_aabb
     def set_aabb(self, xyz_max, xyz_min):
         print("Deformation Net Set aabb",xyz_max, xyz_min)
         self.tri_plane.grid.set_aabb(xyz_max, xyz_min)
@@ -102,12 +103,13 @@ class Deformation(nn.Module):
         
     def eye_encoding(self,value, d_model=32):
         batch_size, _ = value.shape  
-        value = value.to('cuda')
+        device = self.null_vector.device
+        value = value.to(device)
 
-        positions = torch.arange(d_model, device='cuda').float()
+        positions = torch.arange(d_model, device=device).float()
         div_term = torch.pow(10000, (2 * (positions // 2)) / d_model)
 
-        encoded_vec = torch.zeros(batch_size, d_model, device='cuda')
+        encoded_vec = torch.zeros(batch_size, d_model, device=device)
         encoded_vec[:, 0::2] = torch.sin(value * div_term[::2])  
         encoded_vec[:, 1::2] = torch.cos(value * div_term[1::2])
 
@@ -147,22 +149,28 @@ class Deformation(nn.Module):
         # audio_features [B, 8, 29, 16]) 
         B, _, _, _= audio_features.shape
         
+        # the tri-plane feature does not depend on the frame, so it is computed once ([N, dim]) and shared by the batch
         if self.only_infer: #cashing
-            if self.enc_x == None:
-                self.enc_x = self.tri_plane(rays_pts_emb,only_feature = True, train_tri_plane = self.args.train_tri_plane)
-            enc_x = self.enc_x[:B]
+            if self.enc_x is None:
+                self.enc_x = self.tri_plane(rays_pts_emb[:1],only_feature = True, train_tri_plane = self.args.train_tri_plane)[0]
+                self.enc_q = self.transformer.project_query(self.enc_x)
+            enc_x = self.enc_x
+            enc_q = self.enc_q
         
         else:
             # audio_features [B, 8, 29, 16]) 
-            enc_x = self.tri_plane(rays_pts_emb,only_feature = True, train_tri_plane = self.args.train_tri_plane)
+            enc_x = self.tri_plane(rays_pts_emb[:1],only_feature = True, train_tri_plane = self.args.train_tri_plane)[0]
+            enc_q = None
             
-        enc_a_list= []
-        for i in range(B):
-            enc_a = self.audio_net(audio_features[i])   # 8 32
-            enc_a = self.audio_att_net(enc_a.unsqueeze(0))  # 1 32 
-            enc_a_list.append(enc_a.unsqueeze(0))
-        
-        enc_a = torch.cat(enc_a_list,dim=0) # B, 1, 32
+        enc_source = self.encode_sources(audio_features, eye_features, cam_features)
+        x, attention = self.transformer(enc_x, enc_source, query=enc_q) # B, N, dim
+        return x, attention
+
+    def encode_sources(self, audio_features, eye_features, cam_features):
+        # the audio, eye, cam and null tokens the Gaussians attend to: B, 4, dim
+        B, seq_len, _, _ = audio_features.shape
+        enc_a = self.audio_net(audio_features.flatten(0, 1)).view(B, seq_len, -1) # B, 8, 32
+        enc_a = self.audio_att_net(enc_a).unsqueeze(1) # B, 1, 32
         enc_eye = self.eye_encoding(eye_features).unsqueeze(1) # B, 1, 32
         enc_cam = self.cam_mlp(cam_features).unsqueeze(1)
         
@@ -170,9 +178,7 @@ class Deformation(nn.Module):
             enc_a = self.audio_mlp(enc_a) # B, 1, dim
             enc_eye = self.eye_mlp(enc_eye) # B, 1, dim
         
-        enc_source = torch.cat([enc_a,enc_eye, enc_cam, self.null_vector.repeat(B,1,1)],dim = 1) # B, 3, dim
-        x, attention = self.transformer(enc_x, enc_source)
-        return x, attention
+        return torch.cat([enc_a,enc_eye, enc_cam, self.null_vector.repeat(B,1,1)],dim = 1)
     
     def attention_query_audio(self, rays_pts_emb, scales_emb, rotations_emb, audio_features, eye_features):
         # audio_features [1, 8, 29, 16])
@@ -232,7 +238,6 @@ class Deformation(nn.Module):
             pts = rays_pts_emb[:,:3]
         else:
             dx = self.pos_deform(hidden)
-            pts = torch.zeros_like(rays_pts_emb[:,:3])
             pts = rays_pts_emb[:,:3]*mask + dx
         if self.args.no_ds :
             
@@ -240,7 +245,6 @@ class Deformation(nn.Module):
         else:
             ds = self.scales_deform(hidden)
 
-            scales = torch.zeros_like(scales_emb[:,:3])
             scales = scales_emb[:,:3]*mask + ds
             
         if self.args.no_dr :
@@ -248,7 +252,6 @@ class Deformation(nn.Module):
         else:
             dr = self.rotations_deform(hidden)
 
-            rotations = torch.zeros_like(rotations_emb[:,:4])
             if self.args.apply_rotation:
                 rotations = batch_quaternion_multiply(rotations_emb, dr)
             else:
@@ -259,69 +262,80 @@ class Deformation(nn.Module):
         else:
             do = self.opacity_deform(hidden) 
           
-            opacity = torch.zeros_like(opacity_emb[:,:1])
             opacity = opacity_emb[:,:1]*mask + do
         if self.args.no_dshs:
             shs = shs_emb
         else:
             dshs = self.shs_deform(hidden).reshape([shs_emb.shape[0],16,3])
 
-            shs = torch.zeros_like(shs_emb)
             shs = shs_emb*mask.unsqueeze(-1) + dshs
             
         return pts, scales, rotations, opacity, shs, attention
     
     def forward_dynamic_batch(self,rays_pts_emb, scales_emb, rotations_emb, opacity_emb, shs_emb, audio_features, eye_features, cam_features):
         hidden, attention = self.attention_query_audio_batch(rays_pts_emb, scales_emb, rotations_emb, audio_features, eye_features, cam_features)
-        B, _, _, _ = audio_features.shape
+        return self.deform_canonical(hidden, attention, rays_pts_emb, scales_emb, rotations_emb, opacity_emb, shs_emb)
+
+    def deform_canonical(self, hidden, attention, rays_pts_emb, scales_emb, rotations_emb, opacity_emb, shs_emb):
+        # hidden: [B, N, dim] attention output; the canonical attributes are [B, N, ...] (expanded views are fine)
+        B = hidden.shape[0]
         if self.args.static_mlp:
             mask = self.static_mlp(hidden)
         elif self.args.empty_voxel:
             mask = self.empty_voxel(rays_pts_emb[:,:3])
         else:
-            mask = torch.ones_like(opacity_emb[:,:,0]).unsqueeze(-1)
+            mask = None # all ones
+        deltas = dict(zip(self.deform_head_names(), self.deform_heads(hidden)))
+
         if self.args.no_dx:
             pts = rays_pts_emb[:,:,:3]
         else:
-            dx = self.pos_deform(hidden)
-            pts = torch.zeros_like(rays_pts_emb[:,:,:3])
-            pts = rays_pts_emb[:B,:,:3]*mask + dx
+            pts = add_canonical(deltas["pos_deform"], rays_pts_emb[:B,:,:3], mask)
         if self.args.no_ds :
-            
             scales = scales_emb[:,:,:3]
         else:
-            ds = self.scales_deform(hidden)
+            scales = add_canonical(deltas["scales_deform"], scales_emb[:B,:,:3], mask)
 
-            scales = torch.zeros_like(scales_emb[:,:,:3])
-            scales = scales_emb[:B,:,:3]*mask + ds
-            
         if self.args.no_dr :
             rotations = rotations_emb[:,:,:4]
+        elif self.args.apply_rotation:
+            rotations = batch_quaternion_multiply(rotations_emb, deltas["rotations_deform"])
         else:
-            dr = self.rotations_deform(hidden)
-
-            rotations = torch.zeros_like(rotations_emb[:,:,:4])
-            if self.args.apply_rotation:
-                rotations = batch_quaternion_multiply(rotations_emb, dr)
-            else:
-                rotations = rotations_emb[:B,:,:4] + dr
+            rotations = add_canonical(deltas["rotations_deform"], rotations_emb[:B,:,:4], None)
 
         if self.args.no_do :
             opacity = opacity_emb[:,:,:1] 
         else:
-            do = self.opacity_deform(hidden) 
-          
-            opacity = torch.zeros_like(opacity_emb[:,:,:1])
-            opacity = opacity_emb[:B,:,:1]*mask + do
+            opacity = add_canonical(deltas["opacity_deform"], opacity_emb[:B,:,:1], mask)
         if self.args.no_dshs:
             shs = shs_emb
         else:
-            dshs = self.shs_deform(hidden).reshape([shs_emb.shape[0],shs_emb.shape[1],16,3])
-
-            shs = torch.zeros_like(shs_emb)
-            shs = shs_emb[:B]*mask.unsqueeze(-1) + dshs
+            dshs = deltas["shs_deform"].reshape([B,shs_emb.shape[1],16,3])
+            shs = add_canonical(dshs, shs_emb[:B], None if mask is None else mask.unsqueeze(-1))
         
         return pts, scales, rotations, opacity, shs, attention
+
+    def deform_head_names(self):
+        flags = (("pos_deform", self.args.no_dx), ("scales_deform", self.args.no_ds), ("rotations_deform", self.args.no_dr),
+                 ("opacity_deform", self.args.no_do), ("shs_deform", self.args.no_dshs))
+        return [name for name, disabled in flags if not disabled]
+
+    def deform_heads(self, hidden):
+        """
+        Runs the enabled deformation heads (ReLU, Linear(d_model, W), ReLU, Linear(W, out)) as one: hidden is read
+        once, the first layers are concatenated into a single matmul and every second layer reads its W-wide slice
+        of the shared activations. Returns the deltas in the order of deform_head_names().
+        """
+        heads = [getattr(self, name) for name in self.deform_head_names()]
+        if not heads:
+            return []
+        if not isinstance(heads[0][1], nn.Linear):
+            # quantized (deform_network.quantize_for_cpu) layers have no float weights to concatenate
+            return [head(hidden) for head in heads]
+        weight = torch.cat([head[1].weight for head in heads], dim=0)
+        bias = torch.cat([head[1].bias for head in heads], dim=0)
+        x = F.relu(F.linear(F.relu(hidden), weight, bias), inplace=True)
+        return [F.linear(x[..., i*self.W:(i+1)*self.W], head[3].weight, head[3].bias) for i, head in enumerate(heads)]
     
     def get_mlp_parameters(self):
         parameter_list = []
@@ -347,18 +361,20 @@ class deform_network(nn.Module):
         
         self.deformation_net = Deformation(W=net_width, D=defor_depth, input_ch=(3)+(3*(posbase_pe))*2, grid_pe=grid_pe, args=args)
         self.only_infer = args.only_infer
+        self.quantized = False
         self.register_buffer('pos_poc', torch.FloatTensor([(2**i) for i in range(posbase_pe)]))
         self.register_buffer('rotation_scaling_poc', torch.FloatTensor([(2**i) for i in range(scale_rotation_pe)]))
         self.register_buffer('opacity_poc', torch.FloatTensor([(2**i) for i in range(opacity_pe)]))
         self.apply(initialize_weights)
         self.deformation_net.mlp_init_zeros()
         
-        self.point_emb = None
-        self.scales_emb = None
-        self.rotations_emb = None
         # print(self)
 
     def forward(self, point, scales=None, rotations=None, opacity=None, shs=None, audio_features = None, eye_features=None, cam_features =None):
+        if self.quantized and point.device.type != "cpu":
+            # the quantized network runs on the CPU, its outputs go back to the device of the inputs
+            inputs = [None if t is None else t.cpu() for t in (point, scales, rotations, opacity, shs, audio_features, eye_features, cam_features)]
+            return tuple(t.to(point.device) for t in self.forward(*inputs))
         if audio_features is not None:
             return self.forward_dynamic(point, scales, rotations, opacity, shs, audio_features, eye_features, cam_features)
         else:
@@ -375,35 +391,38 @@ class deform_network(nn.Module):
         points = self.deformation_net(points)
         return points
     def forward_dynamic(self, point, scales=None, rotations=None, opacity=None, shs=None, audio_features=None, eye_features=None, cam_features=None):
-        if self.only_infer:
-            if self.point_emb == None:
-                self.point_emb = poc_fre(point,self.pos_poc)         # #, 3 -> #, 63
-                self.scales_emb = poc_fre(scales,self.rotation_scaling_poc)
-                self.rotations_emb = poc_fre(rotations,self.rotation_scaling_poc)
-                
-            point_emb = self.point_emb
-            scales_emb = self.scales_emb
-            rotations_emb = self.rotations_emb
-
-            means3D, scales, rotations, opacity, shs, attention = self.deformation_net(point_emb,
-                                                    scales_emb,
-                                                    rotations_emb,
-                                                    opacity,
-                                                    shs,
-                                                    audio_features, eye_features, cam_features)
-            return means3D, scales, rotations, opacity, shs, attention
-
-        else:
-            point_emb = poc_fre(point,self.pos_poc)         # B, N, 3 -> B, N, 63
-            scales_emb = poc_fre(scales,self.rotation_scaling_poc)
-            rotations_emb = poc_fre(rotations,self.rotation_scaling_poc)
-            means3D, scales, rotations, opacity, shs, attention = self.deformation_net(point_emb,
-                                                    scales_emb,
-                                                    rotations_emb,
-                                                    opacity,
-                                                    shs,
-                                                    audio_features, eye_features, cam_features)
-            return means3D, scales, rotations, opacity, shs, attention
+        # Deformation only reads the raw coordinates poc_fre keeps in front of its sin/cos terms, so the
+        # positional encodings of the B x N repeated points are not computed
+        return self.deformation_net(point, scales, rotations, opacity, shs, audio_features, eye_features, cam_features)
+    def clear_cache(self):
+        """Drops the tri-plane features and query projections cached (or loaded from an export) in only_infer mode."""
+        self.deformation_net.enc_x = None
+        self.deformation_net.enc_q = None
+        self.deformation_net.aud_ch_att = None
+    @torch.no_grad()
+    def export_inference(self, point):
+        """
+        The frame-independent part of the dynamic forward for the canonical positions `point` [N, 3]: the
+        tri-plane (HexPlane) features and the first attention layer's query projections. Given back to
+        load_inference, they replace the grid sampling when rendering.
+        """
+        enc_x = self.deformation_net.tri_plane(point.unsqueeze(0), only_feature=True)[0]
+        return {"num_points": point.shape[0], "enc_x": enc_x, "enc_q": self.deformation_net.transformer.project_query(enc_x)}
+    def load_inference(self, baked):
+        self.deformation_net.enc_x = baked["enc_x"].to(self.pos_poc.device)
+        self.deformation_net.enc_q = baked["enc_q"].to(self.pos_poc.device)
+    def quantize_for_cpu(self):
+        """
+        int8 inference without the GPU: moves the network to the CPU and swaps every Linear layer (feature_out,
+        the deformation heads, audio_net, the MLPs and the attention projections) for a dynamically quantized
+        one, with int8 weights and activations quantized on the fly. forward then accepts inputs on any device.
+        Inference only, the quantized layers cannot be trained or saved as a deformation.pth.
+        """
+        self.cpu()
+        torch.ao.quantization.quantize_dynamic(self.deformation_net, {nn.Linear}, dtype=torch.qint8, inplace=True)
+        net = self.deformation_net
+        net.enc_x, net.enc_q, net.aud_ch_att = [None if t is None else t.cpu() for t in (net.enc_x, net.enc_q, net.aud_ch_att)]
+        self.quantized = True
     def get_mlp_parameters(self):
         return self.deformation_net.get_mlp_parameters() 
     def get_grid_parameters(self):
@@ -411,11 +430,83 @@ class deform_network(nn.Module):
     def mlp2cpu(self):
         self.deformation_net.mlp2cpu()
 
+class InferenceDeformation(nn.Module):
+    """
+    Deformation.forward_dynamic_batch specialized for inference: the tri-plane features and first-layer query
+    projections are buffers instead of a lazily filled cache, the canonical attributes are [N, ...] inputs shared
+    by the batch and the audio windows are encoded in one pass. What is left is tensor code, so traced or compiled
+    for a fixed number of Gaussians and batch size it is a single graph with the config flags (no_dx, static_mlp,
+    apply_rotation, ...) resolved away.
+    """
+    def __init__(self, deformation_net, enc_x, enc_q):
+        super(InferenceDeformation, self).__init__()
+        self.net = deformation_net
+        self.register_buffer("enc_x", enc_x)
+        self.register_buffer("enc_q", enc_q)
+
+    def forward(self, xyz, scales, rotations, opacity, shs, audio_features, eye_features, cam_features):
+        B = audio_features.shape[0]
+        enc_source = self.net.encode_sources(audio_features, eye_features, cam_features)
+        hidden, attention = self.net.transformer(self.enc_x, enc_source, query=self.enc_q)
+        canonical = [t.unsqueeze(0).expand(B, *t.shape) for t in (xyz, scales, rotations, opacity, shs)]
+        return self.net.deform_canonical(hidden, attention, *canonical)
+
+class CompiledDeformation:
+    """
+    The dynamic forward of a deform_network as one graph of InferenceDeformation, built on the first call for a
+    fixed number of Gaussians and `batch_size` frames: "trace" freezes a TorchScript trace, "compile" uses
+    torch.compile (PyTorch 2) without dynamic shapes. Takes and returns what deform_network does; batches of
+    fewer frames are padded with their last frame, so every call hits the same graph. The network must not
+    change afterwards, and a different set of Gaussians needs a new instance.
+    """
+    BACKENDS = ("trace", "compile")
+
+    def __init__(self, network, batch_size, backend="trace"):
+        assert backend in self.BACKENDS, "unknown backend {}".format(backend)
+        assert backend != "compile" or hasattr(torch, "compile"), "torch.compile needs PyTorch 2, use the trace backend"
+        self.network = network
+        self.batch_size = batch_size
+        self.backend = backend
+        # the quantized network (quantize_for_cpu) lives on the CPU
+        self.device = network.pos_poc.device
+        self.graph = None
+
+    @torch.no_grad()
+    def build(self, inputs):
+        net = self.network.deformation_net
+        if net.enc_x is None:
+            baked = self.network.export_inference(inputs[0])
+            net.enc_x, net.enc_q = baked["enc_x"], baked["enc_q"]
+        assert net.enc_x.shape[0] == inputs[0].shape[0], "the cached tri-plane features are for other Gaussians"
+        module = InferenceDeformation(net, net.enc_x, net.enc_q).eval()
+        if self.backend == "compile":
+            return torch.compile(module, fullgraph=True, dynamic=False)
+        return torch.jit.freeze(torch.jit.trace(module, tuple(inputs), check_trace=False))
+
+    def __call__(self, point, scales, rotations, opacity, shs, audio_features, eye_features, cam_features):
+        count = audio_features.shape[0]
+        assert count <= self.batch_size, "compiled for batches of up to {} frames".format(self.batch_size)
+        # the canonical attributes are the same for every frame of the batch
+        inputs = [t[0].to(self.device) for t in (point, scales, rotations, opacity, shs)]
+        inputs += [torch.cat([t, t[-1:].expand(self.batch_size - count, *t.shape[1:])]).to(self.device)
+                   for t in (audio_features, eye_features, cam_features)]
+        if self.graph is None:
+            self.graph = self.build(inputs)
+        return tuple(t[:count].to(point.device) for t in self.graph(*inputs))
+
 def initialize_weights(m):
     if isinstance(m, nn.Linear):
         init.xavier_uniform_(m.weight,gain=1)
         if m.bias is not None:
             init.xavier_uniform_(m.weight,gain=1)
+def add_canonical(delta, canonical, mask=None):
+    """canonical * mask + delta, accumulated into delta (a fresh head output) unless autocast made it lower precision."""
+    if delta.dtype != canonical.dtype:
+        return canonical + delta if mask is None else canonical * mask + delta
+    if mask is None:
+        return delta.add_(canonical)
+    return delta.addcmul_(canonical, mask)
+
 def poc_fre(input_data,poc_buf):
     
     input_data_emb = (input_data.unsqueeze(-1) * poc_buf).flatten(-2)
@@ -16,14 +16,26 @@ from torch import nn
 import os
 import open3d as o3d
 from utils.system_utils import mkdir_p
+from utils.compact_utils import read_compact, write_compact, compact_arrays, dequantize_rotation
+from utils.point_utils import voxel_downsample_indices, nearest_neighbor_distance, combine_pointcloud
 from plyfile import PlyData, PlyElement
 from random import randint
 from utils.sh_utils import RGB2SH
-from simple_knn._C import distCUDA2
 from utils.graphics_utils import BasicPointCloud
 from utils.general_utils import strip_symmetric, build_scaling_rotation
-from scene.deformation import deform_network
+from scene.deformation import deform_network, CompiledDeformation
+from scene.gaussian_store import GaussianStore
 from scene.regulation import compute_plane_smoothness
+# optimizer param group name -> GaussianModel attribute, for the groups holding one per-Gaussian tensor
+GAUSSIAN_PARAM_NAMES = {"xyz": "_xyz", "f_dc": "_features_dc", "f_rest": "_features_rest",
+                        "opacity": "_opacity", "scaling": "_scaling", "rotation": "_rotation"}
+# frame-independent deformation features baked by export_inference.py, next to deformation.pth
+INFERENCE_NAME = "inference.pth"
+# per-Gaussian motion over a validation audio set written by analyze_static.py, next to deformation.pth
+STATIC_NAME = "static.pth"
+# deformed (pre-activation) attributes cached for static Gaussians, in the order the deformation returns them
+STATIC_ATTRIBUTES = ("xyz", "scaling", "rotation", "opacity", "shs", "attention")
+
 class GaussianModel:
 
     def setup_functions(self):
@@ -58,9 +70,16 @@ class GaussianModel:
         self.xyz_gradient_accum = torch.empty(0)
         self.denom = torch.empty(0)
         self.optimizer = None
+        self.store = GaussianStore()
         self.percent_dense = 0
         self.spatial_lr_scale = 0
         self._deformation_table = torch.empty(0)
+        self.inference_baked = None
+        self.static_analysis = None
+        self.static_partition = None
+        self.deformation_cache = None
+        self.keyframes = None
+        self.compiled_deformation = None
         self.setup_functions()
         
     def capture(self):
@@ -84,8 +103,8 @@ class GaussianModel:
     def restore(self, model_args, training_args):
         (self.active_sh_degree, 
         self._xyz, 
+        deformation_state,
         self._deformation_table,
-        self._deformation,
         self._features_dc, 
         self._features_rest,
         self._scaling, 
@@ -96,9 +115,18 @@ class GaussianModel:
         denom,
         opt_dict, 
         self.spatial_lr_scale) = model_args
+        # checkpoints are loaded to the CPU (load_training_state): the Gaussians are moved here, load_state_dict
+        # moves the network weights and the optimizer state to the device of the parameters
+        for name in ("_xyz", "_deformation_table", "_features_dc", "_features_rest", "_scaling", "_rotation", "_opacity", "max_radii2D"):
+            tensor = getattr(self, name)
+            if isinstance(tensor, nn.Parameter):
+                setattr(self, name, nn.Parameter(tensor.detach().cuda(), requires_grad=tensor.requires_grad))
+            else:
+                setattr(self, name, tensor.cuda())
+        self._deformation.load_state_dict(deformation_state)
         self.training_setup(training_args)
-        self.xyz_gradient_accum = xyz_gradient_accum
-        self.denom = denom
+        self.xyz_gradient_accum = xyz_gradient_accum.cuda()
+        self.denom = denom.cuda()
         self.optimizer.load_state_dict(opt_dict)
 
     @property
@@ -141,6 +169,7 @@ class GaussianModel:
 
         print("Number of points at initialisation : ", fused_point_cloud.shape[0])
 
+        from simple_knn._C import distCUDA2
         dist2 = torch.clamp_min(distCUDA2(torch.from_numpy(np.asarray(pcd.points)).float().cuda()), 0.0000001)
         
         scales = torch.log(torch.sqrt(dist2))[...,None].repeat(1, 3)
@@ -214,12 +243,14 @@ class GaussianModel:
                 param_group['lr'] = lr
                 # return lr
 
-    def construct_list_of_attributes(self):
+    def construct_list_of_attributes(self, num_rest=None):
         l = ['x', 'y', 'z', 'nx', 'ny', 'nz']
         # All channels except the 3 DC
         for i in range(self._features_dc.shape[1]*self._features_dc.shape[2]):
             l.append('f_dc_{}'.format(i))
-        for i in range(self._features_rest.shape[1]*self._features_rest.shape[2]):
+        if num_rest is None:
+            num_rest = self._features_rest.shape[1]*self._features_rest.shape[2]
+        for i in range(num_rest):
             l.append('f_rest_{}'.format(i))
         l.append('opacity')
         for i in range(self._scaling.shape[1]):
@@ -245,27 +276,138 @@ class GaussianModel:
         if os.path.exists(os.path.join(path, "deformation_accum.pth")):
             self._deformation_accum = torch.load(os.path.join(path, "deformation_accum.pth"),map_location="cuda")
         self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")
+        if self._deformation.only_infer:
+            self.inference_baked = self._load_baked(path, INFERENCE_NAME)
+            if self.inference_baked is not None:
+                self._deformation.load_inference(self.inference_baked)
+            self.static_analysis = self._load_baked(path, STATIC_NAME)
+
+    def save_inference(self, path):
+        """Bakes the tri-plane features and query projections of the canonical Gaussians for rendering."""
+        torch.save(self._deformation.export_inference(self.get_xyz.detach()), os.path.join(path, INFERENCE_NAME))
+
+    def _load_baked(self, path, name):
+        """Loads a file derived from this checkpoint, unless it predates deformation.pth or has another point count."""
+        baked_path = os.path.join(path, name)
+        if not os.path.exists(baked_path):
+            return None
+        if os.path.getmtime(baked_path) < os.path.getmtime(os.path.join(path, "deformation.pth")):
+            print("Ignoring {}: it is older than the deformation network".format(baked_path))
+            return None
+        baked = torch.load(baked_path, map_location="cuda")
+        if baked["num_points"] != self.get_xyz.shape[0]:
+            print("Ignoring {}: made for {} Gaussians, the model has {}".format(baked_path, baked["num_points"], self.get_xyz.shape[0]))
+            return None
+        print("loading {}".format(baked_path))
+        return baked
+
+    def partition_static(self, threshold):
+        """
+        Splits off the Gaussians whose deformed attributes moved by at most `threshold` times their tolerances over
+        the analysis set of analyze_static.py. render_from_batch (only_infer) then deforms the others only and appends the cached
+        attributes of these. threshold=None deforms every Gaussian again. Returns the fraction of static Gaussians.
+        """
+        self.static_partition = None
+        self.compiled_deformation = None
+        self._deformation.clear_cache()
+        if self.deformation_cache is not None:
+            self.deformation_cache.clear()
+        if self.inference_baked is not None:
+            self._deformation.load_inference(self.inference_baked)
+        if threshold is None:
+            return 0.0
+        assert self.static_analysis is not None, "no {} for this model, run analyze_static.py first".format(STATIC_NAME)
+        assert "ranges" in self.static_analysis, "{} was scored by an older analyze_static.py, run it again".format(STATIC_NAME)
+        static = self.static_analysis["score"] <= threshold
+        dynamic_index = (~static).nonzero().squeeze(1)
+        static_index = static.nonzero().squeeze(1)
+        self.static_partition = {
+            "dynamic": dynamic_index,
+            "static": {name: self.static_analysis[name][static_index] for name in STATIC_ATTRIBUTES},
+        }
+        # the cached tri-plane features must cover the deformed subset only
+        if self.inference_baked is not None:
+            self._deformation.load_inference({name: self.inference_baked[name][dynamic_index] for name in ("enc_x", "enc_q")})
+        return static_index.shape[0] / static.shape[0]
         
+    def select_points(self, mask):
+        """
+        Keeps the Gaussians where mask is True in a loaded model (prune_points is the training counterpart, with
+        the optimizer state). Files baked for the previous point count no longer apply and are dropped.
+        """
+        for name in ("_xyz", "_features_dc", "_features_rest", "_opacity", "_scaling", "_rotation"):
+            setattr(self, name, nn.Parameter(getattr(self, name).detach()[mask].requires_grad_(True)))
+        self._deformation_table = self._deformation_table[mask]
+        self._deformation_accum = self._deformation_accum[mask]
+        self.max_radii2D = self.max_radii2D[mask]
+        self.inference_baked = None
+        self.static_analysis = None
+        self.partition_static(None)
+
+    def reduce_sh_degree(self, sh_degree):
+        """Renders with SH up to sh_degree only; the coefficients above it are zeroed, save_ply(path, sh_degree) drops them."""
+        assert 0 <= sh_degree <= self.max_sh_degree
+        with torch.no_grad():
+            self._features_rest[:, (sh_degree + 1) ** 2 - 1:] = 0
+        self.active_sh_degree = min(self.active_sh_degree, sh_degree)
+
+    def compile_deformation(self, batch_size, backend="trace"):
+        """
+        Makes render_from_batch (only_infer) deform through a CompiledDeformation for batches of up to `batch_size`
+        frames. Compiled for the Gaussians deformed now, so partition_static drops it; call again afterwards.
+        """
+        self.compiled_deformation = CompiledDeformation(self._deformation, batch_size, backend)
+
     def save_deformation(self, path):
-        torch.save(self._deformation.state_dict(),os.path.join(path, "deformation.pth"))
-        torch.save(self._deformation_table,os.path.join(path, "deformation_table.pth"))
-        torch.save(self._deformation_accum,os.path.join(path, "deformation_accum.pth"))
-    def save_ply(self, path):
+        self.write_deformation(path, self.capture_for_save())
+
+    def save_ply(self, path, sh_degree=None):
+        self.write_ply(path, self.capture_for_save(sh_degree))
+
+    def capture_for_save(self, sh_degree=None):
+        """
+        Tensors written by save_ply/save_deformation, laid out as in the files; Scene.save copies them to the host in
+        the background. sh_degree drops the SH coefficients above that degree; loading pads them back with zeros.
+        """
+        features_rest = self._features_rest.detach()
+        if sh_degree is not None:
+            features_rest = features_rest[:, :(sh_degree + 1) ** 2 - 1]
+        return {
+            "xyz": self._xyz.detach(),
+            "f_dc": self._features_dc.detach().transpose(1, 2).flatten(start_dim=1).contiguous(),
+            "f_rest": features_rest.transpose(1, 2).flatten(start_dim=1).contiguous(),
+            "opacity": self._opacity.detach(),
+            "scaling": self._scaling.detach(),
+            "rotation": self._rotation.detach(),
+            "attributes": self.construct_list_of_attributes(features_rest.shape[1] * features_rest.shape[2]),
+            "deformation": self._deformation.state_dict(),
+            "deformation_table": self._deformation_table,
+            "deformation_accum": self._deformation_accum,
+        }
+
+    @staticmethod
+    def write_deformation(path, snapshot):
+        torch.save(snapshot["deformation"],os.path.join(path, "deformation.pth"))
+        torch.save(snapshot["deformation_table"],os.path.join(path, "deformation_table.pth"))
+        torch.save(snapshot["deformation_accum"],os.path.join(path, "deformation_accum.pth"))
+
+    @staticmethod
+    def write_ply(path, snapshot):
         mkdir_p(os.path.dirname(path))
 
-        xyz = self._xyz.detach().cpu().numpy()
+        xyz = snapshot["xyz"].cpu().numpy()
         normals = np.zeros_like(xyz)
-        f_dc = self._features_dc.detach().transpose(1, 2).flatten(start_dim=1).contiguous().cpu().numpy()
-        f_rest = self._features_rest.detach().transpose(1, 2).flatten(start_dim=1).contiguous().cpu().numpy()
-        opacities = self._opacity.detach().cpu().numpy()
-        scale = self._scaling.detach().cpu().numpy()
-        rotation = self._rotation.detach().cpu().numpy()
+        f_dc = snapshot["f_dc"].cpu().numpy()
+        f_rest = snapshot["f_rest"].cpu().numpy()
+        opacities = snapshot["opacity"].cpu().numpy()
+        scale = snapshot["scaling"].cpu().numpy()
+        rotation = snapshot["rotation"].cpu().numpy()
         
-        dtype_full = [(attribute, 'f4') for attribute in self.construct_list_of_attributes()]
+        dtype_full = np.dtype([(attribute, 'f4') for attribute in snapshot["attributes"]])
 
-        elements = np.empty(xyz.shape[0], dtype=dtype_full)
+        # every field is f4, so each row of the float32 matrix already has the layout of one vertex record
         attributes = np.concatenate((xyz, normals, f_dc, f_rest, opacities, scale, rotation), axis=1)
-        elements[:] = list(map(tuple, attributes))
+        elements = np.ascontiguousarray(attributes, dtype=np.float32).view(dtype_full).reshape(-1)
         el = PlyElement.describe(elements, 'vertex')
         PlyData([el]).write(path)
         
@@ -276,45 +418,63 @@ class GaussianModel:
 
     def load_ply(self, path):
         plydata = PlyData.read(path)
+        vertex = plydata.elements[0].data
+        names = list(vertex.dtype.names)
+
+        if all(vertex.dtype[name] == np.float32 for name in names) and vertex.dtype.itemsize == 4 * len(names):
+            # every property is a native f4, so the vertex block is already an [N, P] float32 matrix
+            matrix = vertex.view(np.float32).reshape(vertex.shape[0], len(names))
+        else:
+            matrix = np.stack([np.asarray(vertex[name], dtype=np.float32) for name in names], axis=1)
+        # a single host-to-device copy; the attributes below are column slices of it
+        matrix = torch.from_numpy(np.ascontiguousarray(matrix)).to("cuda")
+
+        def columns(prefix):
+            selected = [name for name in names if name.startswith(prefix)]
+            selected = sorted(selected, key = lambda x: int(x.split('_')[-1]))
+            index = [names.index(name) for name in selected]
+            if index == list(range(index[0], index[0] + len(index))):
+                return matrix[:, index[0]:index[0] + len(index)]
+            return matrix[:, index]
+
+        xyz = matrix[:, [names.index("x"), names.index("y"), names.index("z")]]
+        opacities = matrix[:, names.index("opacity")].unsqueeze(-1)
+        features_dc = columns("f_dc_")
+        features_extra = columns("f_rest_")
+        assert features_extra.shape[1] in [3*(degree + 1) ** 2 - 3 for degree in range(self.max_sh_degree + 1)]
+        scales = columns("scale_")
+        rots = columns("rot")
+        self._set_from_columns(xyz, features_dc, features_extra, opacities, scales, rots)
+
+    def load_compact(self, path):
+        """Loads a point cloud written by save_compact / utils.compact_utils (fp16 SH, int16 rotations)."""
+        tensors = read_compact(path)
+        self._set_from_columns(tensors["xyz"], tensors["f_dc"], tensors["f_rest"], tensors["opacity"],
+                               tensors["scaling"], dequantize_rotation(tensors["rot_q"], tensors["rot_norm"]))
+
+    def save_compact(self, path, sh_degree=None):
+        snapshot = self.capture_for_save(sh_degree)
+        mkdir_p(os.path.dirname(path))
+        write_compact(path, compact_arrays(*[snapshot[key].cpu().numpy() for key in ("xyz", "f_dc", "f_rest", "opacity", "scaling", "rotation")]))
 
-        xyz = np.stack((np.asarray(plydata.elements[0]["x"]),
-                        np.asarray(plydata.elements[0]["y"]),
-                        np.asarray(plydata.elements[0]["z"])),  axis=1)
-        opacities = np.asarray(plydata.elements[0]["opacity"])[..., np.newaxis]
-
-        features_dc = np.zeros((xyz.shape[0], 3, 1))
-        features_dc[:, 0, 0] = np.asarray(plydata.elements[0]["f_dc_0"])
-        features_dc[:, 1, 0] = np.asarray(plydata.elements[0]["f_dc_1"])
-        features_dc[:, 2, 0] = np.asarray(plydata.elements[0]["f_dc_2"])
-
-        extra_f_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("f_rest_")]
-        extra_f_names = sorted(extra_f_names, key = lambda x: int(x.split('_')[-1]))
-        assert len(extra_f_names)==3*(self.max_sh_degree + 1) ** 2 - 3
-        features_extra = np.zeros((xyz.shape[0], len(extra_f_names)))
-        for idx, attr_name in enumerate(extra_f_names):
-            features_extra[:, idx] = np.asarray(plydata.elements[0][attr_name])
+    def _set_from_columns(self, xyz, features_dc, features_extra, opacities, scales, rots):
+        """Sets the parameters from [N, k] CUDA tensors laid out like the PLY columns (f_dc and f_rest channel-major)."""
+        num_points = xyz.shape[0]
         # Reshape (P,F*SH_coeffs) to (P, F, SH_coeffs except DC)
-        features_extra = features_extra.reshape((features_extra.shape[0], 3, (self.max_sh_degree + 1) ** 2 - 1))
-
-        scale_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("scale_")]
-        scale_names = sorted(scale_names, key = lambda x: int(x.split('_')[-1]))
-        scales = np.zeros((xyz.shape[0], len(scale_names)))
-        for idx, attr_name in enumerate(scale_names):
-            scales[:, idx] = np.asarray(plydata.elements[0][attr_name])
-
-        rot_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("rot")]
-        rot_names = sorted(rot_names, key = lambda x: int(x.split('_')[-1]))
-        rots = np.zeros((xyz.shape[0], len(rot_names)))
-        for idx, attr_name in enumerate(rot_names):
-            rots[:, idx] = np.asarray(plydata.elements[0][attr_name])
-
-        self._xyz = nn.Parameter(torch.tensor(xyz, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._features_dc = nn.Parameter(torch.tensor(features_dc, dtype=torch.float, device="cuda").transpose(1, 2).contiguous().requires_grad_(True))
-        self._features_rest = nn.Parameter(torch.tensor(features_extra, dtype=torch.float, device="cuda").transpose(1, 2).contiguous().requires_grad_(True))
-        self._opacity = nn.Parameter(torch.tensor(opacities, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._scaling = nn.Parameter(torch.tensor(scales, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._rotation = nn.Parameter(torch.tensor(rots, dtype=torch.float, device="cuda").requires_grad_(True))
-        self.active_sh_degree = self.max_sh_degree
+        features_dc = features_dc.float().reshape(num_points, 3, 1)
+        num_rest = features_extra.shape[1] // 3
+        features_extra = features_extra.float().reshape(num_points, 3, num_rest)
+        # a checkpoint saved with a lower SH degree (compact_model.py) renders at that degree, the deformation
+        # network still takes every coefficient
+        features_extra = torch.nn.functional.pad(features_extra, (0, (self.max_sh_degree + 1) ** 2 - 1 - num_rest))
+
+        self._xyz = nn.Parameter(xyz.float().contiguous().requires_grad_(True))
+        self._features_dc = nn.Parameter(features_dc.transpose(1, 2).contiguous().requires_grad_(True))
+        self._features_rest = nn.Parameter(features_extra.transpose(1, 2).contiguous().requires_grad_(True))
+        self._opacity = nn.Parameter(opacities.float().contiguous().requires_grad_(True))
+        self._scaling = nn.Parameter(scales.float().contiguous().requires_grad_(True))
+        self._rotation = nn.Parameter(rots.float().contiguous().requires_grad_(True))
+        self.active_sh_degree = int(round((num_rest + 1) ** 0.5)) - 1
 
     def replace_tensor_to_optimizer(self, tensor, name):
         optimizable_tensors = {}
@@ -331,64 +491,46 @@ class GaussianModel:
                 optimizable_tensors[group["name"]] = group["params"][0]
         return optimizable_tensors
 
-    def _prune_optimizer(self, mask):
-        optimizable_tensors = {}
+    def _store_tensors(self):
+        """Every per-Gaussian tensor that densification has to keep row-aligned, by store name."""
+        tensors = {"xyz": self._xyz, "f_dc": self._features_dc, "f_rest": self._features_rest,
+                   "opacity": self._opacity, "scaling": self._scaling, "rotation": self._rotation,
+                   "deformation_table": self._deformation_table, "deformation_accum": self._deformation_accum,
+                   "xyz_gradient_accum": self.xyz_gradient_accum, "denom": self.denom, "max_radii2D": self.max_radii2D}
         for group in self.optimizer.param_groups:
-            if len(group["params"]) > 1:
+            if group["name"] not in GAUSSIAN_PARAM_NAMES:
                 continue
             stored_state = self.optimizer.state.get(group['params'][0], None)
             if stored_state is not None:
-                stored_state["exp_avg"] = stored_state["exp_avg"][mask]
-                stored_state["exp_avg_sq"] = stored_state["exp_avg_sq"][mask]
-
-                del self.optimizer.state[group['params'][0]]
-                group["params"][0] = nn.Parameter((group["params"][0][mask].requires_grad_(True)))
-                self.optimizer.state[group['params'][0]] = stored_state
-
-                optimizable_tensors[group["name"]] = group["params"][0]
-            else:
-                group["params"][0] = nn.Parameter(group["params"][0][mask].requires_grad_(True))
-                optimizable_tensors[group["name"]] = group["params"][0]
-        return optimizable_tensors
-
-    def prune_points(self, mask):
-        valid_points_mask = ~mask
-        optimizable_tensors = self._prune_optimizer(valid_points_mask)
+                tensors[group["name"] + ".exp_avg"] = stored_state["exp_avg"]
+                tensors[group["name"] + ".exp_avg_sq"] = stored_state["exp_avg_sq"]
+        return tensors
 
-        self._xyz = optimizable_tensors["xyz"]
-        self._features_dc = optimizable_tensors["f_dc"]
-        self._features_rest = optimizable_tensors["f_rest"]
-        self._opacity = optimizable_tensors["opacity"]
-        self._scaling = optimizable_tensors["scaling"]
-        self._rotation = optimizable_tensors["rotation"]
-        self._deformation_accum = self._deformation_accum[valid_points_mask]
-        self.xyz_gradient_accum = self.xyz_gradient_accum[valid_points_mask]
-        self._deformation_table = self._deformation_table[valid_points_mask]
-        self.denom = self.denom[valid_points_mask]
-        self.max_radii2D = self.max_radii2D[valid_points_mask]
-
-    def cat_tensors_to_optimizer(self, tensors_dict):
-        optimizable_tensors = {}
+    def _bind_store(self):
+        """Points the parameters, their Adam moments and the statistics at the active rows of the store."""
+        views = self.store.views()
         for group in self.optimizer.param_groups:
-            if len(group["params"])>1:continue
-            assert len(group["params"]) == 1
-            extension_tensor = tensors_dict[group["name"]]
-            stored_state = self.optimizer.state.get(group['params'][0], None)
+            name = group["name"]
+            if name not in GAUSSIAN_PARAM_NAMES:
+                continue
+            stored_state = self.optimizer.state.pop(group['params'][0], None)
+            group["params"][0] = nn.Parameter(views[name])
             if stored_state is not None:
-
-                stored_state["exp_avg"] = torch.cat((stored_state["exp_avg"], torch.zeros_like(extension_tensor)), dim=0)
-                stored_state["exp_avg_sq"] = torch.cat((stored_state["exp_avg_sq"], torch.zeros_like(extension_tensor)), dim=0)
-
-                del self.optimizer.state[group['params'][0]]
-                group["params"][0] = nn.Parameter(torch.cat((group["params"][0], extension_tensor), dim=0).requires_grad_(True))
+                stored_state["exp_avg"] = views[name + ".exp_avg"]
+                stored_state["exp_avg_sq"] = views[name + ".exp_avg_sq"]
                 self.optimizer.state[group['params'][0]] = stored_state
+            setattr(self, GAUSSIAN_PARAM_NAMES[name], group["params"][0])
+        self._deformation_table = views["deformation_table"]
+        self._deformation_accum = views["deformation_accum"]
+        self.xyz_gradient_accum = views["xyz_gradient_accum"]
+        self.denom = views["denom"]
+        self.max_radii2D = views["max_radii2D"]
 
-                optimizable_tensors[group["name"]] = group["params"][0]
-            else:
-                group["params"][0] = nn.Parameter(torch.cat((group["params"][0], extension_tensor), dim=0).requires_grad_(True))
-                optimizable_tensors[group["name"]] = group["params"][0]
-
-        return optimizable_tensors
+    def prune_points(self, mask):
+        valid_points_mask = ~mask
+        self.store.sync(self._store_tensors())
+        self.store.compact(valid_points_mask)
+        self._bind_store()
 
     def densification_postfix(self, new_xyz, new_features_dc, new_features_rest, new_opacities, new_scaling, new_rotation, new_deformation_table):
         d = {"xyz": new_xyz,
@@ -397,21 +539,17 @@ class GaussianModel:
         "opacity": new_opacities,
         "scaling" : new_scaling,
         "rotation" : new_rotation,
+        "deformation_table": new_deformation_table,
        }
 
-        optimizable_tensors = self.cat_tensors_to_optimizer(d)
-        self._xyz = optimizable_tensors["xyz"]
-        self._features_dc = optimizable_tensors["f_dc"]
-        self._features_rest = optimizable_tensors["f_rest"]
-        self._opacity = optimizable_tensors["opacity"]
-        self._scaling = optimizable_tensors["scaling"]
-        self._rotation = optimizable_tensors["rotation"]
-        
-        self._deformation_table = torch.cat([self._deformation_table,new_deformation_table],-1)
-        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self._deformation_accum = torch.zeros((self.get_xyz.shape[0], 3), device="cuda")
-        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")
+        # new rows start with zero Adam moments; the statistics restart from zero for every point
+        self.store.sync(self._store_tensors())
+        self.store.append(d)
+        self._bind_store()
+        self.xyz_gradient_accum.zero_()
+        self._deformation_accum.zero_()
+        self.denom.zero_()
+        self.max_radii2D.zero_()
 
     def densify_and_split(self, grads, grad_threshold, scene_extent, N=2):
         n_init_points = self.get_xyz.shape[0]
@@ -485,50 +623,46 @@ class GaussianModel:
         self.densification_postfix(new_xyz, new_features_dc, new_features_rest, new_opacities, new_scaling, new_rotation, new_deformation_table)
         return selected_xyz, new_xyz
     def downsample_point(self, point_cloud):
+        """Indices of one point per voxel, growing the voxel size by 8 until at most 1000 points remain."""
         if not hasattr(self,"voxel_size"):
             self.voxel_size = 8  
-        point_downsample = point_cloud
+        downsampled_point_index = torch.arange(point_cloud.shape[0], device=point_cloud.device)
         flag = False 
-        while point_downsample.shape[0]>1000:
+        while downsampled_point_index.shape[0]>1000:
             if flag:
                 self.voxel_size+=8
-            point_downsample = downsample_point_cloud_open3d(point_cloud,voxel_size=self.voxel_size)
+            downsampled_point_index = voxel_downsample_indices(point_cloud, self.voxel_size)
             flag = True
-        print("point size:",point_downsample.shape[0])
-        downsampled_point_index = find_indices_in_A(point_cloud, point_downsample)
-        downsampled_point_mask = torch.zeros((point_cloud.shape[0]), dtype=torch.bool).to(point_downsample.device)
-        downsampled_point_mask[downsampled_point_index]=True
-        return downsampled_point_mask
-    def grow(self, density_threshold=20, displacement_scale=20, model_path=None, iteration=None, stage=None):
+        print("point size:",downsampled_point_index.shape[0])
+        return downsampled_point_index
+    @torch.no_grad()
+    def grow(self, density_threshold=20, displacement_scale=20, model_path=None, iteration=None, stage=None, dump_debug=False):
         if not hasattr(self,"voxel_size"):
             self.voxel_size = 8  
         if not hasattr(self,"density_threshold"):
             self.density_threshold = density_threshold
         if not hasattr(self,"displacement_scale"):
             self.displacement_scale = displacement_scale
-        flag = False
-        point_cloud = self.get_xyz.detach().cpu()
-        point_downsample = point_cloud.detach()
-        downsampled_point_index = self.downsample_point(point_downsample)
-
-
-        _, low_density_points, new_points, low_density_index = addpoint(point_cloud[downsampled_point_index],density_threshold=self.density_threshold,displacement_scale=self.displacement_scale,iter_pass=0)
-        if new_points.shape[0] < 100 :
+        point_cloud = self.get_xyz.detach()
+        downsampled_point_index = self.downsample_point(point_cloud)
+
+        # sparse regions: downsampled points whose nearest downsampled neighbour is farther than density_threshold
+        low_density_index = nearest_neighbor_distance(point_cloud[downsampled_point_index]) > self.density_threshold
+        num_new_points = int(low_density_index.sum())
+        print("low_density_points", num_new_points)
+        if num_new_points < 100 :
             self.density_threshold /= 2
             self.displacement_scale /= 2
             print("reduce diplacement_scale to: ",self.displacement_scale)
-
-        elif new_points.shape[0] == 0:
+        if num_new_points == 0:
             print("no point added")
             return
-        global_mask = torch.zeros((point_cloud.shape[0]), dtype=torch.bool)
-
-        global_mask[downsampled_point_index] = low_density_index
-        global_mask
-        selected_xyz, new_xyz = self.add_point_by_mask(global_mask.to(self.get_xyz.device), self.displacement_scale)
-        print("point growing,add point num:",global_mask.sum())
-        if model_path is not None and iteration is not None:
-            point = combine_pointcloud(point_cloud, selected_xyz.detach().cpu().numpy(), new_xyz.detach().cpu().numpy())
+        global_mask = torch.zeros((point_cloud.shape[0]), dtype=torch.bool, device=point_cloud.device)
+        global_mask[downsampled_point_index[low_density_index]] = True
+        selected_xyz, new_xyz = self.add_point_by_mask(global_mask, self.displacement_scale)
+        print("point growing,add point num:",num_new_points)
+        if dump_debug and model_path is not None and iteration is not None:
+            point = combine_pointcloud(point_cloud.cpu().numpy(), selected_xyz.detach().cpu().numpy(), new_xyz.detach().cpu().numpy())
             write_path = os.path.join(model_path,"add_point_cloud")
             os.makedirs(write_path,exist_ok=True)
             o3d.io.write_point_cloud(os.path.join(write_path,f"iteration_{stage}{iteration}.ply"),point)
@@ -0,0 +1,76 @@
+import math
+
+import torch
+
+
+class GaussianStore:
+    """
+    Per-Gaussian tensors (parameters, Adam moments, densification statistics) kept in backing buffers
+    with spare rows. The model works on views of the first `count` rows, so adding points is an in-place
+    write into the spare rows and pruning compacts the buffers in place; only running out of capacity
+    reallocates, and then with `growth` times the needed rows so reallocation is amortized.
+    """
+    def __init__(self, growth=1.5):
+        self.growth = growth
+        self.buffers = {}
+        self.count = 0
+        self.capacity = 0
+
+    def _reserve(self, rows):
+        return max(rows, int(math.ceil(rows * self.growth)))
+
+    def sync(self, tensors):
+        """
+        Adopts {name: [count, ...] tensor}. Tensors that already are views of their buffer are left alone;
+        anything else (a buffer that was replaced elsewhere, Adam moments created lazily) is copied in.
+        """
+        counts = {tensor.shape[0] for tensor in tensors.values()}
+        assert len(counts) == 1, "all per-Gaussian tensors must have the same number of rows"
+        count = counts.pop()
+        if count > self.capacity:
+            # only the rows held so far are carried over, the new rows are copied in below
+            self._resize(self._reserve(count))
+        self.count = count
+        for name, tensor in tensors.items():
+            buffer = self.buffers.get(name)
+            if buffer is not None and buffer.data_ptr() == tensor.data_ptr() and buffer.dtype == tensor.dtype \
+                    and buffer.shape[1:] == tensor.shape[1:]:
+                continue
+            buffer = tensor.new_empty((self.capacity,) + tuple(tensor.shape[1:]))
+            buffer[:self.count] = tensor.detach()
+            self.buffers[name] = buffer
+        for name in list(self.buffers):
+            if name not in tensors:
+                del self.buffers[name]
+
+    def _resize(self, capacity):
+        for name, buffer in self.buffers.items():
+            resized = buffer.new_empty((capacity,) + tuple(buffer.shape[1:]))
+            resized[:self.count] = buffer[:self.count]
+            self.buffers[name] = resized
+        self.capacity = capacity
+
+    def append(self, tensors):
+        """Writes the rows of `tensors` after the active ones; buffers missing from `tensors` get zeros."""
+        added = next(iter(tensors.values())).shape[0]
+        total = self.count + added
+        if total > self.capacity:
+            self._resize(self._reserve(total))
+            print("Gaussian store capacity grown to {}".format(self.capacity))
+        for name, buffer in self.buffers.items():
+            if name in tensors:
+                buffer[self.count:total] = tensors[name].detach()
+            else:
+                buffer[self.count:total].zero_()
+        self.count = total
+
+    def compact(self, keep_mask):
+        """Moves the rows selected by keep_mask to the front, preserving their order."""
+        index = keep_mask.nonzero().squeeze(1)
+        kept = index.shape[0]
+        for buffer in self.buffers.values():
+            buffer[:kept] = buffer[:self.count].index_select(0, index)
+        self.count = kept
+
+    def views(self):
+        return {name: buffer[:self.count] for name, buffer in self.buffers.items()}
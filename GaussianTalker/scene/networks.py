@@ -25,11 +25,11 @@ class AudioAttNet(nn.Module):
         )
 
     def forward(self, x):
-        # x: [1, seq_len, dim_aud]
-        y = x.permute(0, 2, 1)  # [1, dim_aud, seq_len]
+        # x: [B, seq_len, dim_aud]
+        y = x.permute(0, 2, 1)  # [B, dim_aud, seq_len]
         y = self.attentionConvNet(y) 
-        y = self.attentionNet(y.view(1, self.seq_len)).view(1, self.seq_len, 1)
-        return torch.sum(y * x, dim=1) # [1, dim_aud]
+        y = self.attentionNet(y.view(x.shape[0], self.seq_len)).view(x.shape[0], self.seq_len, 1)
+        return torch.sum(y * x, dim=1) # [B, dim_aud]
     
     
 # Audio feature extractor
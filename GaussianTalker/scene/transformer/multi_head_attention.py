@@ -3,6 +3,9 @@
 @when : 2019-10-25
 @homepage : https://github.com/gusdnd852
 """
+import math
+
+import torch
 from torch import nn
 
 from scene.transformer.scale_dot_product_attention import ScaleDotProductAttention
@@ -37,6 +40,54 @@ class MultiHeadAttention(nn.Module):
         # TODO : we should implement visualization
         return out, attention
 
+    def project_query(self, q):
+        """
+        w_q(q) split into heads without transposing
+
+        :param q: [length, d_model] or [batch_size, length, d_model]
+        :return: [length, head, d_tensor] or [batch_size, length, head, d_tensor]
+        """
+        q = self.w_q(q)
+        return q.view(*q.shape[:-1], self.n_head, q.shape[-1] // self.n_head)
+
+    def forward_few_tokens(self, q, k, v, query=None):
+        """
+        same result as forward(q, k, v) when k / v hold only a few tokens (the audio, eye, cam and null tokens)
+
+        q may be [length, d_model] shared by the whole batch, in which case it is not repeated per batch,
+        and `query` may pass a cached project_query(q). Instead of splitting heads with transposes and
+        materializing [batch, head, length, d_tensor] outputs, w_concat is folded into the projected values
+        so every query only contracts its head x token scores with [head x token, d_model] values.
+
+        :param q: [length, d_model] or [batch_size, length, d_model]
+        :param k: [batch_size, tokens, d_model]
+        :param v: [batch_size, tokens, d_model]
+        :return: [batch_size, length, d_model] and the attention [batch_size, head, length, tokens]
+        """
+        if query is None:
+            query = self.project_query(q)
+        batch_size, tokens, d_model = k.size()
+        d_tensor = d_model // self.n_head
+        k = self.w_k(k).view(batch_size, tokens, self.n_head, d_tensor)
+        v = self.w_v(v).view(batch_size, tokens, self.n_head, d_tensor)
+
+        if query.dim() == 3:
+            score = torch.einsum("nhd,bkhd->bnhk", query, k)
+        else:
+            score = torch.einsum("bnhd,bkhd->bnhk", query, k)
+        score = torch.softmax(score / math.sqrt(d_tensor), dim=-1)
+
+        length = score.shape[1]
+        if not isinstance(self.w_concat, nn.Linear):
+            # a quantized w_concat has no float weight to fold, apply it to the concatenated heads
+            out = torch.einsum("bnhk,bkhd->bnhd", score, v).reshape(batch_size, length, d_model)
+            return self.w_concat(out), score.permute(0, 2, 1, 3)
+        w_concat = self.w_concat.weight.view(-1, self.n_head, d_tensor)
+        v = torch.einsum("bkhd,ehd->bhke", v, w_concat).reshape(batch_size, self.n_head * tokens, -1)
+        out = score.reshape(batch_size, length, self.n_head * tokens) @ v
+        out = out + self.w_concat.bias.to(out.dtype)
+        return out, score.permute(0, 2, 1, 3)
+
     def split(self, tensor):
         """
         split tensor by number of head
@@ -18,10 +18,21 @@ class Spatial_Audio_Attention_Layer(nn.Module):
         self.norm2 = LayerNorm(d_model=self.args.d_model)
         self.dropout2 = nn.Dropout(p=self.args.drop_prob)
         
-    def forward(self, x, enc_source):
+    def forward(self, x, enc_source, query=None):
+        # x: [B, N, d_model], or [N, d_model] when every frame of the batch shares the Gaussian features
+        _x = x
+        x, att = self.enc_dec_attention.forward_few_tokens(x, enc_source, enc_source, query=query)
+        return self.feed_forward(x, _x), att
+
+    def forward_generic(self, x, enc_source):
+        # the generic multi-head attention path, kept as the reference for forward
+        if x.dim() == 2:
+            x = x.unsqueeze(0).repeat(enc_source.shape[0], 1, 1)
         _x = x
         x, att = self.enc_dec_attention(q=x, k=enc_source, v=enc_source, mask=None)
-        
+        return self.feed_forward(x, _x), att
+
+    def feed_forward(self, x, _x):
         # 4. add and norm
         x = self.dropout1(x)
         x = self.norm1(x + _x)
@@ -34,7 +45,7 @@ class Spatial_Audio_Attention_Layer(nn.Module):
         x = self.dropout2(x)
         x = self.norm2(x + _x)
 
-        return x, att
+        return x
     
 
 class Spatial_Audio_Attention_Module(nn.Module):
@@ -43,10 +54,18 @@ class Spatial_Audio_Attention_Module(nn.Module):
         self.args = args
         self.layers = nn.ModuleList([Spatial_Audio_Attention_Layer(args) for _ in range(args.n_layer)])
         
-    def forward(self,x, enc_source):
+    def project_query(self, x):
+        """Query projection of the first layer; Gaussian features that do not change can cache it and pass it as `query`."""
+        return self.layers[0].enc_dec_attention.project_query(x)
+
+    def forward(self,x, enc_source, query=None, generic=False):
+        # x: [B, N, d_model] or [N, d_model] shared by the batch; enc_source: [B, tokens, d_model]
         attention = []
-        for layer in self.layers:
-            x,att = layer(x, enc_source)
+        for i, layer in enumerate(self.layers):
+            if generic:
+                x,att = layer.forward_generic(x, enc_source)
+            else:
+                x,att = layer(x, enc_source, query if i == 0 else None)
             attention.append(att.mean(dim=1).unsqueeze(dim=1))
         attention = torch.cat(attention,dim=1) #B, layer, N, 3
         return x, attention
\ No newline at end of file
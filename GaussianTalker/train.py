@@ -13,7 +13,7 @@ import random
 import os, sys
 import torch
 from random import randint
-from utils.loss_utils import l1_loss, ssim
+from utils.loss_utils import l1_loss, ssim, fused_l1_ssim
 from gaussian_renderer import network_gui, render_from_batch
 import sys
 from scene import Scene, GaussianModel
@@ -23,9 +23,10 @@ from tqdm import tqdm
 from utils.image_utils import psnr
 from argparse import ArgumentParser, Namespace
 from arguments import ModelParams, PipelineParams, OptimizationParams, ModelHiddenParams
-from torch.utils.data import DataLoader
-from utils.timer import Timer
-from utils.loader_utils import FineSampler, get_stamp_list
+from utils.timer import Timer, IterationTimer
+from utils.metric_utils import MetricsAccumulator, AsyncNanCheck
+from utils.checkpoint_utils import CheckpointWriter, capture_rng_state, restore_rng_state, checkpoint_path, find_latest_checkpoint, load_training_state
+from utils.loader_utils import FineSampler, CameraPrefetcher, get_stamp_list
 import lpips
 import copy
 import wandb
@@ -42,26 +43,42 @@ from utils.loss_utils import VGGPerceptualLoss
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 vgg_perceptual_loss = VGGPerceptualLoss().to(device)
+
+AMP_DTYPES = {"none": None, "fp16": torch.float16, "bf16": torch.bfloat16}
     
 def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_iterations, 
                          checkpoint_iterations, checkpoint, debug_from,
-                         gaussians, scene, stage, tb_writer, train_iter,timer, use_wandb=False):
+                         gaussians, scene, stage, tb_writer, train_iter,timer, use_wandb=False, iter_timer=None):
     first_iter = 0
     gaussians.training_setup(opt)
-    if checkpoint:
-        (model_params, first_iter) = torch.load(checkpoint)
-        gaussians.restore(model_params, opt)
-
-
-    if stage == "fine" and first_iter == 0:
+    # checkpoint is a state from load_training_state; its stage is None for the old (capture, iteration) format
+    resume = checkpoint is not None and checkpoint["stage"] == stage
+    if stage == "fine" and (not checkpoint or resume):
         gaussians.mlp2cpu()
+    if checkpoint:
+        gaussians.restore(checkpoint["gaussians"], opt)
+        first_iter = checkpoint["iteration"]
         
     iter_start = torch.cuda.Event(enable_timing = True)
     iter_end = torch.cuda.Event(enable_timing = True)
 
+    # mixed precision: the deformation network and VGG run under autocast, the rasterizer and SSIM stay in fp32.
+    # fp16 needs loss scaling, bf16 has the fp32 exponent range and does not.
+    amp_dtype = AMP_DTYPES[opt.amp]
+    scaler = torch.cuda.amp.GradScaler(enabled=amp_dtype == torch.float16)
+    if iter_timer is None:
+        iter_timer = IterationTimer(opt.timing_interval)
+    checkpoint_writer = CheckpointWriter(keep=opt.keep_checkpoints)
+
     viewpoint_stack = None
-    ema_loss_for_log = 0.0
-    ema_psnr_for_log = 0.0
+    # metrics stay on the GPU and are copied to the host once every log_interval iterations
+    metrics = MetricsAccumulator(opt.log_interval)
+    nan_check = AsyncNanCheck()
+
+    def restart_if_nan(wait):
+        if nan_check.poll(wait=wait):
+            print("loss is nan,end training, reexecv program now.")
+            os.execv(sys.executable, [sys.executable] + sys.argv)
 
     final_iter = train_iter
     
@@ -81,10 +98,10 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
         viewpoint_stack = scene.getTrainCameras()
         if opt.custom_sampler is not None:
             sampler = FineSampler(viewpoint_stack)
-            viewpoint_stack_loader = DataLoader(viewpoint_stack, batch_size=batch_size,sampler=sampler,num_workers=32,collate_fn=list, drop_last = True)
+            viewpoint_stack_loader = CameraPrefetcher(viewpoint_stack, batch_size=batch_size, sampler=sampler, drop_last=True)
             random_loader = False
         else:
-            viewpoint_stack_loader = DataLoader(viewpoint_stack, batch_size=batch_size,shuffle=True,num_workers=32,collate_fn=list, drop_last = True)
+            viewpoint_stack_loader = CameraPrefetcher(viewpoint_stack, batch_size=batch_size, shuffle=True, drop_last=True)
             random_loader = True
         loader = iter(viewpoint_stack_loader)
     
@@ -94,6 +111,30 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
         viewpoint_stack = temp_list.copy()
     else:
         load_in_memory = False 
+
+    def training_state(iteration):
+        if opt.dataloader and not load_in_memory:
+            data_state = {"random_loader": random_loader, "loader": viewpoint_stack_loader.state_dict()}
+        else:
+            data_state = {"stack": [cam.uid for cam in viewpoint_stack]}
+        return {"stage": stage, "iteration": iteration, "gaussians": gaussians.capture(),
+                "scaler": scaler.state_dict(), "rng": capture_rng_state(), "data": data_state}
+
+    if resume:
+        # continue with the same data order: the interrupted loader pass, or the remaining camera stack
+        data_state = checkpoint["data"]
+        if opt.dataloader and not load_in_memory:
+            if data_state["random_loader"] and not random_loader:
+                viewpoint_stack_loader = CameraPrefetcher(viewpoint_stack, batch_size=opt.batch_size, shuffle=True)
+                random_loader = True
+            viewpoint_stack_loader.load_state_dict(data_state["loader"])
+            loader = iter(viewpoint_stack_loader)
+        else:
+            cams_by_uid = {cam.uid: cam for cam in temp_list}
+            viewpoint_stack = [cams_by_uid[uid] for uid in data_state["stack"]]
+        scaler.load_state_dict(checkpoint["scaler"])
+        restore_rng_state(checkpoint["rng"])
+        print("Resuming {} stage from iteration {}".format(stage, first_iter))
         
     for iteration in range(first_iter, final_iter+1):   # 여기부터 iteration 시작   
         # if network_gui.conn == None:
@@ -113,6 +154,7 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
         #         network_gui.conn = None
 
         iter_start.record()
+        iter_timer.start()
 
         gaussians.update_learning_rate(iteration)
 
@@ -127,7 +169,7 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
             except StopIteration:
                 print("reset dataloader into random dataloader.")
                 if not random_loader:
-                    viewpoint_stack_loader = DataLoader(viewpoint_stack, batch_size=opt.batch_size,shuffle=True,num_workers=32,collate_fn=list)
+                    viewpoint_stack_loader = CameraPrefetcher(viewpoint_stack, batch_size=opt.batch_size, shuffle=True)
                     random_loader = True
                 loader = iter(viewpoint_stack_loader)
 
@@ -149,8 +191,10 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
             pipe.debug = True
         
         random_color = False
+        iter_timer.lap("data")
         
-        output = render_from_batch(viewpoint_cams, gaussians, pipe, random_color, stage=stage, batch_size=batch_size, canonical_tri_plane_factor_list=opt.canonical_tri_plane_factor_list,iteration=iteration)
+        output = render_from_batch(viewpoint_cams, gaussians, pipe, random_color, stage=stage, batch_size=batch_size, canonical_tri_plane_factor_list=opt.canonical_tri_plane_factor_list,iteration=iteration, amp_dtype=amp_dtype)
+        iter_timer.lap("render")
         
         image_tensor=output["rendered_image_tensor"]
         gt_image_tensor=output["gt_tensor"]
@@ -158,12 +202,12 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
         radii=output["radii"]
         viewspace_point_tensor_list=output["viewspace_point_tensor_list"] 
         viewspace_point_tensor = viewspace_point_tensor_list[0]
-        Ll1 = l1_loss(image_tensor, gt_image_tensor[:,:3,:,:])
+        Ll1, ssim_loss = fused_l1_ssim(image_tensor, gt_image_tensor[:,:3,:,:])
 
-        psnr_ = psnr(image_tensor, gt_image_tensor).mean().double()
-        perceptual_loss = vgg_perceptual_loss(image_tensor, gt_image_tensor[:,:3,:,:])
-    
-        ssim_loss = ssim(image_tensor,gt_image_tensor)
+        psnr_ = psnr(image_tensor, gt_image_tensor).mean()
+        with torch.autocast("cuda", dtype=amp_dtype or torch.float16, enabled=amp_dtype is not None):
+            perceptual_loss = vgg_perceptual_loss(image_tensor, gt_image_tensor[:,:3,:,:])
+        perceptual_loss = perceptual_loss.float()
         
         loss = 0.8 * Ll1 + 0.01* perceptual_loss + 0.2 * (1.0-ssim_loss)
         
@@ -175,43 +219,50 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
             depth_loss = l1_loss(output["gt_masks_tensor"],generated_mask)*0.4
             loss += depth_loss
         
-        loss.backward()
-        if torch.isnan(loss).any():
-            print("loss is nan,end training, reexecv program now.")
-            os.execv(sys.executable, [sys.executable] + sys.argv)
-        viewspace_point_tensor_grad = torch.zeros_like(viewspace_point_tensor)
-        for idx in range(0, len(viewspace_point_tensor_list)):
-            viewspace_point_tensor_grad = viewspace_point_tensor_grad + viewspace_point_tensor_list[idx].grad
+        iter_timer.lap("loss")
+        
+        scaler.scale(loss).backward()
+        # the flag of an earlier iteration is read once its copy has landed, so this never stalls the GPU
+        nan_check.push(loss)
+        restart_if_nan(wait=iteration % opt.log_interval == 0)
+        viewspace_point_tensor_grad = torch.stack([t.grad for t in viewspace_point_tensor_list]).sum(dim=0)
+        if scaler.is_enabled():
+            # densification thresholds are calibrated on unscaled gradients
+            viewspace_point_tensor_grad = viewspace_point_tensor_grad / scaler.get_scale()
         iter_end.record()
+        iter_timer.lap("backward")
         
     
         with torch.no_grad():
-            ema_loss_for_log = 0.4 * loss.item() + 0.6 * ema_loss_for_log
-            ema_psnr_for_log = 0.4 * psnr_ + 0.6 * ema_psnr_for_log
-            total_point = gaussians._xyz.shape[0]
-            
-            if use_wandb:
-                if iteration % 10 == 0:
-                    log_dict = {"Ll1":Ll1.item()*0.8 , "psnr":psnr_, "perceptual_loss":perceptual_loss.item()*0.01, "ssim_loss":0.2*(1-ssim_loss.item()), "loss":loss.item(), 'total_point': total_point}
+            step_metrics = {"Ll1": Ll1 * 0.8, "psnr": psnr_, "perceptual_loss": perceptual_loss * 0.01, "ssim_loss": 0.2 * (1 - ssim_loss), "loss": loss}
+            if opt.lip_fine_tuning:
+                step_metrics["lip_l1_loss"] = lip_l1_loss
+            if opt.depth_fine_tuning:
+                step_metrics["depth_loss"] = depth_loss
+            metrics.add(**step_metrics)
+
+            if metrics.ready(iteration):
+                logged_iters = metrics.count
+                log_dict = metrics.flush()
+                total_point = gaussians._xyz.shape[0]
+                if use_wandb:
+                    log_dict['total_point'] = total_point
                     for i, params in enumerate(opt.train_l): 
-                        log_dict[f'{params}_lr'] = torch.tensor(gaussians.optimizer.param_groups[i]['lr'])
-                    if opt.lip_fine_tuning:
-                        log_dict["lip_l1_loss"] = lip_l1_loss.item()
-                    if opt.depth_fine_tuning:
-                        log_dict["depth_loss"] = depth_loss.item() 
+                        log_dict[f'{params}_lr'] = gaussians.optimizer.param_groups[i]['lr']
                     wandb.log(log_dict)    
-                
-            if iteration % 10 == 0:
-                progress_bar.set_postfix({"Loss": f"{ema_loss_for_log:.{7}f}",
-                                          "psnr": f"{psnr_:.{2}f}",
+                progress_bar.set_postfix({"Loss": f"{log_dict['loss']:.{7}f}",
+                                          "psnr": f"{log_dict['psnr']:.{2}f}",
                                           "point":f"{total_point}"})
-                progress_bar.update(10)
+                progress_bar.update(logged_iters)
             if iteration == opt.iterations:
                 progress_bar.close()
 
             # Log and save
             timer.pause()
+            # the optimizer may already have stepped on a NaN loss whose flag is still in flight: every pending
+            # check is resolved before anything is written, so a restart never resumes from a poisoned state
             if iteration % 500 == 0 or iteration == 1:
+                restart_if_nan(wait=True)
                 print("\n[ITER {}] Saving Gaussians".format(iteration))
                 scene.save(iteration, stage, torch.cat([gt_image_tensor, image_tensor]), viewpoint_cams[0].uid)
                 
@@ -241,21 +292,32 @@ def scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_i
                         
                     # if iteration > opt.densify_from_iter and iteration % opt.densification_interval == 0 :
                     if iteration % opt.densification_interval == 0 and gaussians.get_xyz.shape[0]<50000 and opt.add_point: 
-                        gaussians.grow(5,5,scene.model_path,iteration,stage)
+                        gaussians.grow(5,5,scene.model_path,iteration,stage,dump_debug=opt.debug_point_growth)
                         # torch.cuda.empty_cache()
                     # if stage == 'fine' and iteration % opt.opacity_reset_interval == 0:
                     #     print("reset opacity")
                     #     gaussians.reset_opacity() 
                 
+            iter_timer.lap("densify")
 
             # Optimizer step
             if iteration < opt.iterations:
-                gaussians.optimizer.step()
+                scaler.step(gaussians.optimizer)
+                scaler.update()
                 gaussians.optimizer.zero_grad(set_to_none = True)
+            iter_timer.lap("optim")
+            iter_timer.step(iteration)
 
             if (iteration in checkpoint_iterations):
+                restart_if_nan(wait=True)
                 print("\n[ITER {}] Saving Checkpoint".format(iteration))
-                torch.save((gaussians.capture(), iteration), scene.model_path + "/chkpnt" + str(iteration) + ".pth")
+                checkpoint_writer.save(training_state(iteration), scene.model_path + "/chkpnt" + str(iteration) + ".pth")
+            if opt.checkpoint_interval > 0 and iteration % opt.checkpoint_interval == 0:
+                restart_if_nan(wait=True)
+                checkpoint_writer.save(training_state(iteration), checkpoint_path(scene.model_path, stage, iteration))
+
+    checkpoint_writer.wait()
+    scene.wait_for_save()
                 
                 
 def training(dataset, hyper, opt, pipe, testing_iterations, saving_iterations, checkpoint_iterations, checkpoint, debug_from, expname, use_wandb):
@@ -270,17 +332,24 @@ def training(dataset, hyper, opt, pipe, testing_iterations, saving_iterations, c
     scene = Scene(dataset, gaussians, load_coarse=None)
     timer.start()
 
+    if checkpoint == "latest":
+        checkpoint = find_latest_checkpoint(args.model_path)
+        if checkpoint is None:
+            print("No checkpoint found in {}, training from scratch".format(args.model_path))
+    state = load_training_state(checkpoint) if checkpoint else None
+
     train_l_temp=opt.train_l
-    opt.train_l=["xyz","deformation","grid","f_dc","f_rest","opacity","scaling","rotation"]
-    print(opt.train_l)
-    scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_iterations,
-                             checkpoint_iterations, checkpoint, debug_from,
-                             gaussians, scene, "coarse", tb_writer, opt.coarse_iterations,timer, use_wandb)
+    if state is None or state["stage"] != "fine":
+        opt.train_l=["xyz","deformation","grid","f_dc","f_rest","opacity","scaling","rotation"]
+        print(opt.train_l)
+        scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_iterations,
+                                 checkpoint_iterations, state, debug_from,
+                                 gaussians, scene, "coarse", tb_writer, opt.coarse_iterations,timer, use_wandb)
     
     opt.train_l = train_l_temp
     print(opt.train_l)
     scene_reconstruction(dataset, opt, hyper, pipe, testing_iterations, saving_iterations,
-                         checkpoint_iterations, checkpoint, debug_from,
+                         checkpoint_iterations, state if state is None or state["stage"] != "coarse" else None, debug_from,
                          gaussians, scene, "fine", tb_writer, opt.iterations,timer, use_wandb)
 
 def prepare_output_and_logger(expname):    
@@ -385,7 +454,7 @@ if __name__ == "__main__":
     parser.add_argument("--save_iterations", nargs="+", type=int, default=[1000, 3000, 4000, 5000, 6000, 7_000, 9000, 10000, 12000, 14000, 20000, 30_000, 45000, 60000])
     parser.add_argument("--quiet", action="store_true")
     parser.add_argument("--checkpoint_iterations", nargs="+", type=int, default=[])
-    parser.add_argument("--start_checkpoint", type=str, default = None)
+    parser.add_argument("--start_checkpoint", type=str, default = None, help="checkpoint path, or 'latest' to resume from <model_path>/checkpoints")
     parser.add_argument("--expname", type=str, default = "")
     parser.add_argument("--use_wandb", action="store_true")
     parser.add_argument("--configs", type=str, default = "")
@@ -11,6 +11,7 @@
 
 from scene.cameras import Camera
 import numpy as np
+import torch
 from utils.general_utils import PILtoTorch
 from utils.graphics_utils import fov2focal
 
@@ -54,3 +55,10 @@ def camera_to_JSON(id, camera : Camera):
         'fx' : fov2focal(camera.FovX, camera.width)
     }
     return camera_entry
+
+def camera_features(viewpoint_camera, device):
+    """Audio, eye and camera pose conditioning of one camera for the deformation network, each with a batch dim of 1."""
+    aud_feature = viewpoint_camera.aud_f.unsqueeze(0).to(device)
+    eye_feature = torch.from_numpy(np.array([viewpoint_camera.eye_f])).unsqueeze(0).to(device)
+    cam_feature = torch.from_numpy(np.concatenate((viewpoint_camera.R.reshape(-1), viewpoint_camera.T.reshape(-1))).reshape(1,-1)).to(device)
+    return aud_feature, eye_feature, cam_feature
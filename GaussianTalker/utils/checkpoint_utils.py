@@ -0,0 +1,147 @@
+import os
+import re
+import random
+import threading
+
+import numpy as np
+import torch
+from torch import nn
+
+CHECKPOINT_DIR = "checkpoints"
+_CHECKPOINT_RE = re.compile(r"chkpnt_(coarse|fine)_(\d+)\.pth$")
+
+
+def checkpoint_path(model_path, stage, iteration):
+    return os.path.join(model_path, CHECKPOINT_DIR, "chkpnt_{}_{}.pth".format(stage, iteration))
+
+
+def list_checkpoints(model_path):
+    """Periodic checkpoints of a model, oldest first (every coarse iteration comes before every fine one)."""
+    folder = os.path.join(model_path, CHECKPOINT_DIR)
+    if not os.path.isdir(folder):
+        return []
+    found = []
+    for name in os.listdir(folder):
+        match = _CHECKPOINT_RE.match(name)
+        if match:
+            found.append(((match.group(1) == "fine", int(match.group(2))), os.path.join(folder, name)))
+    return [path for _, path in sorted(found)]
+
+
+def find_latest_checkpoint(model_path):
+    checkpoints = list_checkpoints(model_path)
+    return checkpoints[-1] if checkpoints else None
+
+
+def capture_rng_state():
+    state = {"python": random.getstate(), "numpy": np.random.get_state(), "torch": torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"].cpu())
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all([s.cpu() for s in state["cuda"]])
+
+
+def load_training_state(path):
+    """
+    Loads a checkpoint written by CheckpointWriter. Older checkpoints saved as (gaussians.capture(), iteration)
+    are returned as a state without stage, which scene_reconstruction restores the way it used to. Tensors stay on
+    the CPU; GaussianModel.restore and the load_state_dict calls move them to the device of the model.
+    """
+    state = torch.load(path, map_location="cpu")
+    if isinstance(state, (tuple, list)):
+        model_params, iteration = state
+        state = {"stage": None, "iteration": iteration, "gaussians": model_params}
+    return state
+
+
+def snapshot_to_host(obj):
+    """Host copy of every tensor in a nested dict/list/tuple; CUDA copies are queued without waiting."""
+    if isinstance(obj, torch.Tensor):
+        if obj.is_cuda:
+            # lands in pinned memory; ordered before any later in-place update on the current stream
+            copy = obj.detach().to("cpu", non_blocking=True)
+        else:
+            copy = obj.detach().clone()
+        if isinstance(obj, nn.Parameter):
+            copy = nn.Parameter(copy, requires_grad=obj.requires_grad)
+        return copy
+    if isinstance(obj, dict):
+        return type(obj)((key, snapshot_to_host(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot_to_host(value) for value in obj)
+    return obj
+
+
+class AsyncWriter:
+    """
+    Runs writes on a background thread. submit() only queues device-to-host copies of the state and
+    returns; the thread waits for the copies to land and then calls write_fn(snapshot). At most one
+    write is in flight: submitting another one first waits for the previous.
+    """
+    def __init__(self):
+        self.thread = None
+        self.error = None
+
+    def submit(self, write_fn, state):
+        self.wait()
+        snapshot = snapshot_to_host(state)
+        event = None
+        if torch.cuda.is_available():
+            event = torch.cuda.Event()
+            event.record()
+        self.thread = threading.Thread(target=self._run, args=(write_fn, snapshot, event))
+        self.thread.start()
+
+    def _run(self, write_fn, snapshot, event):
+        try:
+            if event is not None:
+                event.synchronize()
+            write_fn(snapshot)
+        except Exception as e:
+            self.error = e
+
+    def wait(self):
+        """Blocks until the pending write is on disk and re-raises its error, if any."""
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
+class CheckpointWriter(AsyncWriter):
+    """
+    Writes checkpoints to a temporary file renamed into place, so a checkpoint on disk is always complete.
+    Only the newest `keep` periodic checkpoints of a model are kept (keep=0 keeps all of them).
+    """
+    def __init__(self, keep=2):
+        super().__init__()
+        self.keep = keep
+
+    def save(self, state, path):
+        self.submit(lambda snapshot: self._write(snapshot, path), state)
+
+    def _write(self, snapshot, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        torch.save(snapshot, tmp_path)
+        os.replace(tmp_path, path)
+        self._cleanup(path)
+
+    def _cleanup(self, path):
+        folder = os.path.dirname(path)
+        if self.keep <= 0 or os.path.basename(folder) != CHECKPOINT_DIR:
+            return
+        for old in list_checkpoints(os.path.dirname(folder))[:-self.keep]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
@@ -0,0 +1,112 @@
+"""
+Compact point cloud checkpoints in the safetensors layout: an 8 byte little-endian header length, a JSON
+header with {name: {dtype, shape, data_offsets}} and the raw tensor bytes. SH coefficients beyond the DC
+term are stored as fp16 and rotations as int16 unit quaternions plus an fp32 norm, roughly halving the
+file size. Loading maps the file and moves the whole data block to the GPU with one copy.
+
+    python -m utils.compact_utils output/<model>/point_cloud/iteration_10000 [...]
+
+converts the point_cloud.ply of each iteration folder.
+"""
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+import torch
+
+COMPACT_NAME = "point_cloud.safetensors"
+
+_NP_TO_ST = {np.dtype(np.float32): "F32", np.dtype(np.float16): "F16", np.dtype(np.int16): "I16"}
+_ST_TO_TORCH = {"F32": torch.float32, "F16": torch.float16, "I16": torch.int16}
+_ROT_SCALE = 32767.0
+
+
+def quantize_rotation(rotation):
+    """Raw (unnormalized) quaternions -> int16 unit quaternion and fp32 norm; the deformation network sees the raw value."""
+    norm = np.linalg.norm(rotation, axis=1, keepdims=True).astype(np.float32)
+    unit = rotation / np.maximum(norm, 1e-12)
+    return np.round(unit * _ROT_SCALE).astype(np.int16), norm
+
+
+def dequantize_rotation(rot_q, rot_norm):
+    unit = rot_q.float() / _ROT_SCALE
+    return torch.nn.functional.normalize(unit, dim=1) * rot_norm.float()
+
+
+def compact_arrays(xyz, f_dc, f_rest, opacity, scaling, rotation):
+    """Arrays in the column layout of the PLY file (f_dc [N, 3], f_rest [N, 3 * SH]) as stored in the compact file."""
+    rot_q, rot_norm = quantize_rotation(rotation.astype(np.float32))
+    return {
+        "xyz": xyz.astype(np.float32),
+        "f_dc": f_dc.astype(np.float32),
+        "opacity": opacity.astype(np.float32),
+        "scaling": scaling.astype(np.float32),
+        "rot_norm": rot_norm,
+        "f_rest": f_rest.astype(np.float16),
+        "rot_q": rot_q,
+    }
+
+
+def write_compact(path, arrays):
+    # widest dtypes first so every tensor starts at an offset aligned to its element size
+    names = sorted(arrays, key=lambda name: -arrays[name].dtype.itemsize)
+    header, offset = {}, 0
+    for name in names:
+        array = np.ascontiguousarray(arrays[name])
+        header[name] = {"dtype": _NP_TO_ST[array.dtype], "shape": list(array.shape),
+                        "data_offsets": [offset, offset + array.nbytes]}
+        offset += array.nbytes
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    header_bytes += b" " * (-(8 + len(header_bytes)) % 8)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name in names:
+            f.write(np.ascontiguousarray(arrays[name]).tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_compact(path, device="cuda"):
+    """Returns {name: tensor on device}; all tensors are views into one buffer filled by a single host-to-device copy."""
+    with open(path, "rb") as f:
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    header.pop("__metadata__", None)
+
+    data = np.memmap(path, dtype=np.uint8, mode="c", offset=8 + header_len)
+    buffer = torch.from_numpy(data).to(device)
+    tensors = {}
+    for name, info in header.items():
+        start, end = info["data_offsets"]
+        tensors[name] = buffer[start:end].view(_ST_TO_TORCH[info["dtype"]]).reshape(info["shape"])
+    return tensors
+
+
+def ply_to_compact(ply_path, out_path):
+    from plyfile import PlyData
+
+    vertex = PlyData.read(ply_path).elements[0].data
+    names = vertex.dtype.names
+
+    def columns(prefix):
+        selected = [name for name in names if name.startswith(prefix)]
+        selected = sorted(selected, key=lambda x: int(x.split('_')[-1]))
+        return np.stack([np.asarray(vertex[name], dtype=np.float32) for name in selected], axis=1)
+
+    xyz = np.stack([np.asarray(vertex[name], dtype=np.float32) for name in ("x", "y", "z")], axis=1)
+    opacity = np.asarray(vertex["opacity"], dtype=np.float32)[:, None]
+    write_compact(out_path, compact_arrays(xyz, columns("f_dc_"), columns("f_rest_"), opacity,
+                                           columns("scale_"), columns("rot")))
+
+
+if __name__ == "__main__":
+    for folder in sys.argv[1:]:
+        ply_path = os.path.join(folder, "point_cloud.ply")
+        out_path = os.path.join(folder, COMPACT_NAME)
+        ply_to_compact(ply_path, out_path)
+        print("{} -> {} ({:.1f} MB -> {:.1f} MB)".format(ply_path, out_path, os.path.getsize(ply_path) / 2 ** 20,
+                                                         os.path.getsize(out_path) / 2 ** 20))
@@ -39,10 +39,155 @@ class FineSampler(Sampler):
             sample_list += now_list
             
         self.sample_list = sample_list
+        self.start = 0
+        self.pass_start = 0
         print("one epoch containing:",len(self.sample_list))
     def __iter__(self):
-
-        return iter(self.sample_list)
+        self.pass_start, self.start = self.start, 0
+        return iter(self.sample_list[self.pass_start:])
     
     def __len__(self):
         return len(self.sample_list)
+
+    def state_dict(self):
+        return {"sample_list": self.sample_list, "start": self.pass_start}
+
+    def load_state_dict(self, state):
+        self.sample_list = state["sample_list"]
+        self.start = state["start"]
+
+
+class ResumableRandomSampler(Sampler):
+    """
+    Random permutation sampler whose order depends only on (seed, epoch), so a resumed run can replay
+    the interrupted epoch from the same position.
+    """
+    def __init__(self, data_source, seed=None):
+        self.num_samples = len(data_source)
+        self.seed = int(torch.randint(0, 2 ** 31 - 1, (1,)).item()) if seed is None else seed
+        self.epoch = 0
+        self.start = 0
+        self.pass_epoch = 0
+        self.pass_start = 0
+
+    def __iter__(self):
+        self.pass_epoch, self.pass_start = self.epoch, self.start
+        self.epoch += 1
+        self.start = 0
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.pass_epoch)
+        return iter(torch.randperm(self.num_samples, generator=generator).tolist()[self.pass_start:])
+
+    def __len__(self):
+        return self.num_samples
+
+    def state_dict(self):
+        return {"seed": self.seed, "epoch": self.pass_epoch, "start": self.pass_start}
+
+    def load_state_dict(self, state):
+        self.seed = state["seed"]
+        self.epoch = state["epoch"]
+        self.start = state["start"]
+
+
+def default_num_workers(max_workers=8):
+    """Loader workers sized to the CPUs this process may use, leaving one for the training loop."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    return max(0, min(max_workers, cpus - 1))
+
+
+class _FrameDataset(Dataset):
+    def __init__(self, cameras):
+        self.cameras = cameras
+
+    def __getitem__(self, index):
+        return self.cameras.load_frame(index)
+
+    def __len__(self):
+        return len(self.cameras)
+
+
+def collate_frames(frames):
+    """Stacks uint8 frame records into batch tensors so a batch crosses process boundaries as a few shared buffers."""
+    return {"index": [frame["index"] for frame in frames],
+            "image": torch.stack([frame["image"] for frame in frames]),
+            "torso": torch.stack([frame["torso"] for frame in frames]),
+            "bg": torch.stack([frame["bg"] for frame in frames]),
+            "head_mask": torch.stack([frame["head_mask"] for frame in frames])}
+
+
+class CameraPrefetcher:
+    """
+    Replacement for DataLoader(cameras, collate_fn=list) that yields lists of Camera objects whose images
+    already live on the GPU. Workers decode uint8 frames into shared memory, the loader pins the collated
+    batch, and the host-to-device copy of the next batch runs on a side stream while the current one is used.
+    """
+    def __init__(self, cameras, batch_size=1, shuffle=False, sampler=None, drop_last=False,
+                 num_workers=None, prefetch_factor=2, device="cuda"):
+        self.cameras = cameras
+        self.device = torch.device(device)
+        self.use_cuda = self.device.type == "cuda" and torch.cuda.is_available()
+        if num_workers is None:
+            num_workers = default_num_workers()
+        if shuffle and sampler is None:
+            sampler, shuffle = ResumableRandomSampler(cameras), False
+        self.sampler = sampler
+        self.batch_size = batch_size
+        self.consumed = 0
+        loader_kwargs = {"prefetch_factor": prefetch_factor, "persistent_workers": True} if num_workers > 0 else {}
+        self.loader = DataLoader(_FrameDataset(cameras), batch_size=batch_size, shuffle=shuffle, sampler=sampler,
+                                 num_workers=num_workers, collate_fn=collate_frames, drop_last=drop_last,
+                                 pin_memory=self.use_cuda, **loader_kwargs)
+        self.stream = torch.cuda.Stream() if self.use_cuda else None
+
+    def __len__(self):
+        return len(self.loader)
+
+    def state_dict(self):
+        """Position in the current pass, in samples handed out to the caller (not merely prefetched)."""
+        if not hasattr(self.sampler, "state_dict"):
+            return None
+        state = dict(self.sampler.state_dict())
+        state["start"] += self.consumed * self.batch_size
+        return state
+
+    def load_state_dict(self, state):
+        """The next pass over the prefetcher continues the saved pass."""
+        if state is not None:
+            self.sampler.load_state_dict(state)
+
+    def _to_device(self, batch):
+        if not self.use_cuda:
+            return batch
+        with torch.cuda.stream(self.stream):
+            return {key: value.to(self.device, non_blocking=True) if torch.is_tensor(value) else value
+                    for key, value in batch.items()}
+
+    def _to_cameras(self, batch):
+        if self.use_cuda:
+            current = torch.cuda.current_stream()
+            current.wait_stream(self.stream)
+            for value in batch.values():
+                if torch.is_tensor(value):
+                    # the tensors were allocated on the side stream but are consumed on the current one
+                    value.record_stream(current)
+        return [self.cameras.make_camera({key: value[i] for key, value in batch.items()})
+                for i in range(len(batch["index"]))]
+
+    def __iter__(self):
+        self.consumed = 0
+        batches = iter(self.loader)
+        try:
+            pending = self._to_device(next(batches))
+        except StopIteration:
+            return
+        for batch in batches:
+            upcoming = self._to_device(batch)
+            self.consumed += 1
+            yield self._to_cameras(pending)
+            pending = upcoming
+        self.consumed += 1
+        yield self._to_cameras(pending)
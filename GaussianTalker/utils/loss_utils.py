@@ -11,8 +11,6 @@
 
 import torch
 import torch.nn.functional as F
-from torch.autograd import Variable
-from math import exp
 import lpips
 import torchvision
 
@@ -26,22 +24,26 @@ def l2_loss(network_output, gt):
     return ((network_output - gt) ** 2).mean()
 
 def gaussian(window_size, sigma):
-    gauss = torch.Tensor([exp(-(x - window_size // 2) ** 2 / float(2 * sigma ** 2)) for x in range(window_size)])
+    x = torch.arange(window_size, dtype=torch.float32) - window_size // 2
+    gauss = torch.exp(-x ** 2 / float(2 * sigma ** 2))
     return gauss / gauss.sum()
 
-def create_window(window_size, channel):
-    _1D_window = gaussian(window_size, 1.5).unsqueeze(1)
-    _2D_window = _1D_window.mm(_1D_window.t()).float().unsqueeze(0).unsqueeze(0)
-    window = Variable(_2D_window.expand(channel, 1, window_size, window_size).contiguous())
+_window_cache = {}
+
+def create_window(window_size, channel, device=None, dtype=torch.float32):
+    # the window only depends on (size, channel, device, dtype), so build and upload it once
+    key = (window_size, channel, str(device), dtype)
+    window = _window_cache.get(key)
+    if window is None:
+        _1D_window = gaussian(window_size, 1.5).unsqueeze(1)
+        _2D_window = _1D_window.mm(_1D_window.t()).float().unsqueeze(0).unsqueeze(0)
+        window = _2D_window.expand(channel, 1, window_size, window_size).contiguous().to(device=device, dtype=dtype)
+        _window_cache[key] = window
     return window
 
 def ssim(img1, img2, window_size=11, size_average=True):
     channel = img1.size(-3)
-    window = create_window(window_size, channel)
-
-    if img1.is_cuda:
-        window = window.cuda(img1.get_device())
-    window = window.type_as(img1)
+    window = create_window(window_size, channel, img1.device, img1.dtype)
 
     return _ssim(img1, img2, window, window_size, channel, size_average)
 
@@ -49,17 +51,20 @@ def _ssim(img1, img2, window, window_size, channel, size_average=True):
     mu1 = F.conv2d(img1, window, padding=window_size // 2, groups=channel)
     mu2 = F.conv2d(img2, window, padding=window_size // 2, groups=channel)
 
-    mu1_sq = mu1.pow(2)
-    mu2_sq = mu2.pow(2)
-    mu1_mu2 = mu1 * mu2
+    sigma1_sq = F.conv2d(img1 * img1, window, padding=window_size // 2, groups=channel) - mu1.pow(2)
+    sigma2_sq = F.conv2d(img2 * img2, window, padding=window_size // 2, groups=channel) - mu2.pow(2)
+    sigma12 = F.conv2d(img1 * img2, window, padding=window_size // 2, groups=channel) - mu1 * mu2
 
-    sigma1_sq = F.conv2d(img1 * img1, window, padding=window_size // 2, groups=channel) - mu1_sq
-    sigma2_sq = F.conv2d(img2 * img2, window, padding=window_size // 2, groups=channel) - mu2_sq
-    sigma12 = F.conv2d(img1 * img2, window, padding=window_size // 2, groups=channel) - mu1_mu2
+    return _ssim_from_moments(mu1, mu2, sigma1_sq, sigma2_sq, sigma12, size_average)
 
+def _ssim_from_moments(mu1, mu2, sigma1_sq, sigma2_sq, sigma12, size_average=True):
     C1 = 0.01 ** 2
     C2 = 0.03 ** 2
 
+    mu1_sq = mu1.pow(2)
+    mu2_sq = mu2.pow(2)
+    mu1_mu2 = mu1 * mu2
+
     ssim_map = ((2 * mu1_mu2 + C1) * (2 * sigma12 + C2)) / ((mu1_sq + mu2_sq + C1) * (sigma1_sq + sigma2_sq + C2))
 
     if size_average:
@@ -67,6 +72,27 @@ def _ssim(img1, img2, window, window_size, channel, size_average=True):
     else:
         return ssim_map.mean(1).mean(1).mean(1)
 
+def fused_l1_ssim(img1, img2, window_size=11, size_average=True):
+    """
+    L1 and SSIM of the same image pair in one go. The five Gaussian-filtered
+    moments (x, y, x^2, y^2, xy) are stacked along the channel axis and filtered
+    with a single grouped conv instead of five separate ones.
+    Returns (l1, ssim).
+    """
+    channel = img1.size(-3)
+    window = create_window(window_size, 5 * channel, img1.device, img1.dtype)
+
+    stacked = torch.cat([img1, img2, img1 * img1, img2 * img2, img1 * img2], dim=-3)
+    moments = F.conv2d(stacked, window, padding=window_size // 2, groups=5 * channel)
+    mu1, mu2, e11, e22, e12 = moments.split(channel, dim=-3)
+
+    sigma1_sq = e11 - mu1.pow(2)
+    sigma2_sq = e22 - mu2.pow(2)
+    sigma12 = e12 - mu1 * mu2
+
+    l1 = torch.abs(img1 - img2).mean()
+    return l1, _ssim_from_moments(mu1, mu2, sigma1_sq, sigma2_sq, sigma12, size_average)
+
 class VGGPerceptualLoss(torch.nn.Module):
     def __init__(self, resize=True):
         super(VGGPerceptualLoss, self).__init__()
@@ -0,0 +1,72 @@
+import collections
+
+import torch
+
+
+class MetricsAccumulator:
+    """
+    Sums scalar training metrics on the device and only copies them to the host
+    every `interval` iterations, so logging does not force a GPU->CPU sync per step.
+    """
+    def __init__(self, interval=10):
+        self.interval = interval
+        self.sums = {}
+        self.count = 0
+
+    @torch.no_grad()
+    def add(self, **metrics):
+        for name, value in metrics.items():
+            value = value.detach().float() if torch.is_tensor(value) else torch.tensor(float(value))
+            if name in self.sums:
+                self.sums[name] += value
+            else:
+                self.sums[name] = value.clone()
+        self.count += 1
+
+    def ready(self, iteration):
+        return self.count > 0 and iteration % self.interval == 0
+
+    def flush(self):
+        """Returns the mean of every metric since the last flush (one host sync for all of them)."""
+        if self.count == 0:
+            return {}
+        names = list(self.sums.keys())
+        device = next(iter(self.sums.values())).device
+        values = torch.stack([self.sums[name].to(device) for name in names]).div_(self.count).tolist()
+        self.sums = {}
+        self.count = 0
+        return dict(zip(names, values))
+
+
+class AsyncNanCheck:
+    """
+    Copies the "loss is NaN" flag into pinned host memory without blocking and
+    reads it back on a later iteration, once the copy has landed.
+    """
+    def __init__(self):
+        self.pending = collections.deque()
+
+    def push(self, loss):
+        is_nan = torch.isnan(loss.detach()).any()
+        if not is_nan.is_cuda:
+            self.pending.append((is_nan, None))
+            return
+        flag = torch.empty((), dtype=torch.bool, pin_memory=True)
+        flag.copy_(is_nan, non_blocking=True)
+        event = torch.cuda.Event()
+        event.record()
+        self.pending.append((flag, event))
+
+    def poll(self, wait=False):
+        """True if any loss pushed so far (and already copied back) was NaN."""
+        while self.pending:
+            flag, event = self.pending[0]
+            if event is not None:
+                if wait:
+                    event.synchronize()
+                elif not event.query():
+                    return False
+            self.pending.popleft()
+            if bool(flag):
+                return True
+        return False
@@ -5,7 +5,6 @@ from torch.utils.data import TensorDataset, random_split
 from tqdm import tqdm
 import open3d as o3d
 import numpy as np
-from torch_cluster import grid_cluster
 def voxel_down_sample_custom(points, voxel_size):
     # 将点云归一化到体素网格
     voxel_grid = torch.floor(points / voxel_size)
@@ -49,18 +48,42 @@ def downsample_point_cloud_open3d(points, voxel_size):
     return torch.tensor(downsampled_points)
 def downsample_point_cloud_cluster(points, voxel_size):
     # 创建一个点云对象
+    from torch_cluster import grid_cluster
     cluster = grid_cluster(points, size=torch.tensor([1,1,1]))
 
     # 获取下采样后的点云矩阵
     # downsampled_points = np.asarray(downsampled_pcd.points)
 
     return cluster, points
-import torch
-from sklearn.neighbors import NearestNeighbors
+def voxel_downsample_indices(points, voxel_size):
+    """
+    每个体素保留一个点（该体素中下标最小的点），返回保留点在 points 中的下标。
+    全程在 points 所在设备上完成，直接得到下标，不需要再回原点云里逐点查找。
+    """
+    voxel = torch.floor(points / voxel_size).long()
+    voxel = voxel - voxel.min(dim=0).values
+    dims = voxel.max(dim=0).values + 1
+    # 体素坐标线性化成一个整数键（体素哈希）
+    keys = (voxel[:, 0] * dims[1] + voxel[:, 1]) * dims[2] + voxel[:, 2]
+    unique_keys, inverse = torch.unique(keys, return_inverse=True)
+    index = torch.arange(points.shape[0], device=points.device)
+    first = torch.full((unique_keys.shape[0],), points.shape[0], dtype=torch.long, device=points.device)
+    return first.scatter_reduce_(0, inverse, index, reduce="amin")
+
+def nearest_neighbor_distance(points, chunk_size=4096):
+    """每个点到最近的另一个点的距离（分块 cdist，显存占用为 chunk_size x N）"""
+    distances = []
+    for start in range(0, points.shape[0], chunk_size):
+        block = torch.cdist(points[start:start + chunk_size], points)
+        rows = torch.arange(block.shape[0], device=points.device)
+        block[rows, rows + start] = float("inf")
+        distances.append(block.min(dim=1).values)
+    return torch.cat(distances)
 
 def upsample_point_cloud(points, density_threshold, displacement_scale, iter_pass):
     # 计算每个点的密度
     # breakpoint()
+    from sklearn.neighbors import NearestNeighbors
     try:
         nbrs = NearestNeighbors(n_neighbors=2+iter_pass, algorithm='ball_tree').fit(points)
         distances, indices = nbrs.kneighbors(points)
@@ -1,4 +1,14 @@
+import bisect
+import copy
+import math
+
+import numpy as np
 import torch
+import torch.nn.functional as F
+
+from utils.graphics_utils import getWorld2View2, getProjectionMatrix
+
+
 @torch.no_grad()
 def get_state_at_time(pc,viewpoint_camera):    
     means3D = pc.get_xyz
@@ -18,4 +28,323 @@ def get_state_at_time(pc,viewpoint_camera):
     scales_final = pc.scaling_activation(scales_final)
     rotations_final = pc.rotation_activation(rotations_final)
     opacity = pc.opacity_activation(opacity_final)
-    return means3D_final, scales_final, rotations_final, opacity, shs
\ No newline at end of file
+    return means3D_final, scales_final, rotations_final, opacity, shs
+
+def conditioning_keys(aud_features, eye_features, cam_features):
+    """[B, D] per-frame conditioning of the deformation network: the DeepSpeech window, eye and camera features."""
+    return torch.cat([aud_features.flatten(1), eye_features.flatten(1), cam_features.flatten(1)], dim=1).float()
+
+
+def conditioning_widths(aud_features, eye_features, cam_features):
+    """Widths of the audio, eye and camera groups in conditioning_keys."""
+    return [t[0].numel() for t in (aud_features, eye_features, cam_features)]
+
+
+class DeformationCache:
+    """
+    Deformed Gaussians of already rendered frames, keyed by the frame's conditioning (DeepSpeech window, eye and
+    camera features, see conditioning_keys). The groups have unrelated scales (DeepSpeech logits, an eye opening
+    in [0, 1], camera rotation and translation), so `tolerance` holds one value per group: a frame whose every
+    group is within its tolerance (largest absolute difference) of a cached key reuses that entry instead of
+    running the deformation network, so silent or steady stretches of audio are deformed once. Frames of one batch that match each other are deformed once as well. Holds at most
+    `max_entries` frames, by default as many as fit in `max_bytes` (an entry holds every deformed attribute of
+    every Gaussian), and evicts the least recently used. Positions keep their precision, the other attributes
+    are stored in half precision.
+    """
+    def __init__(self, tolerance=(0.0, 0.0, 0.0), max_entries=None, max_bytes=256 * 2 ** 20):
+        self.tolerance = tuple(tolerance)
+        self.entry_limit = max_entries
+        self.max_bytes = max_bytes
+        self.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.keys = None
+        self.values = []
+        self.dtypes = None
+        self.last_used = []
+        self.clock = 0
+        # sized again from the first entry: partition_static changes the number of deformed Gaussians
+        self.max_entries = self.entry_limit
+        self.entry_bytes = 0
+
+    def _excess(self, a, b, widths):
+        """[A, B] largest amount by which a group of a differs from b beyond its tolerance; <= 0 is a match."""
+        difference = (a[:, None] - b[None]).abs()
+        return torch.stack([group.amax(dim=-1) - tolerance for group, tolerance
+                            in zip(difference.split(widths, dim=-1), self.tolerance)]).amax(dim=0)
+
+    def deform(self, keys, compute, widths):
+        """
+        keys: [B, D] from conditioning_keys, widths: its groups from conditioning_widths. compute(frames) deforms the
+        frames at the given batch positions and returns a list of [len(frames), ...] tensors. Returns the same list
+        for the whole batch.
+        """
+        batch_size = keys.shape[0]
+        self.clock += 1
+        reused = {}     # frame -> cached value, taken before inserting can evict it
+        if self.keys is not None:
+            excess, index = self._excess(keys, self.keys, widths).min(dim=1)
+            for frame, (hit, cached) in enumerate(zip((excess <= 0).tolist(), index.tolist())):
+                if hit:
+                    reused[frame] = [t.to(dtype) for t, dtype in zip(self.values[cached], self.dtypes)]
+                    self.last_used[cached] = self.clock
+
+        misses = [frame for frame in range(batch_size) if frame not in reused]
+        owner, computed, frames = {}, None, []
+        if misses:
+            close = (self._excess(keys[misses], keys[misses], widths) <= 0).cpu()
+            for i, frame in enumerate(misses):
+                match = next((k for k, other in enumerate(frames) if close[i, misses.index(other)]), None)
+                if match is None:
+                    frames.append(frame)
+                    match = len(frames) - 1
+                owner[frame] = match
+            computed = compute(frames)
+            for k, frame in enumerate(frames):
+                self._insert(keys[frame], [t[k].clone() for t in computed])
+        self.misses += len(frames)
+        self.hits += batch_size - len(frames)
+
+        def value(frame, a):
+            return computed[a][owner[frame]] if frame in owner else reused[frame][a]
+        count = len(computed) if computed is not None else len(next(iter(reused.values())))
+        return [torch.stack([value(frame, a) for frame in range(batch_size)]) for a in range(count)]
+
+    def _insert(self, key, value):
+        self.dtypes = [t.dtype for t in value]
+        value = [t if i == 0 or not t.is_floating_point() else t.half() for i, t in enumerate(value)]
+        if not self.entry_bytes:
+            self.entry_bytes = sum(t.numel() * t.element_size() for t in value)
+        if self.max_entries is None:
+            self.max_entries = self.max_bytes // self.entry_bytes
+        if self.max_entries <= 0:
+            return
+        if len(self.values) < self.max_entries:
+            self.keys = key[None] if self.keys is None else torch.cat([self.keys, key[None]])
+            self.values.append(value)
+            self.last_used.append(self.clock)
+        else:
+            oldest = min(range(len(self.last_used)), key=self.last_used.__getitem__)
+            self.keys[oldest] = key
+            self.values[oldest] = value
+            self.last_used[oldest] = self.clock
+
+    def report(self, title="DEFORMATION CACHE"):
+        total = self.hits + self.misses
+        if total == 0:
+            return
+        print("[{}] {} of {} frames reused ({:.1%} hit rate), tolerance {}, {} entries cached ({:.0f} MB)".format(
+            title, self.hits, total, self.hits / total, self.tolerance, len(self.values),
+            len(self.values) * self.entry_bytes / 2 ** 20))
+
+
+def slerp(q0, q1, weight):
+    """Spherical interpolation of raw (unnormalized) quaternions [..., 4]; weight broadcasts against [..., 1]."""
+    q0 = F.normalize(q0, dim=-1)
+    q1 = F.normalize(q1, dim=-1)
+    dot = (q0 * q1).sum(dim=-1, keepdim=True)
+    q1 = torch.where(dot < 0, -q1, q1)
+    theta = torch.acos(dot.abs().clamp(max=1.0))
+    sin = torch.sin(theta)
+    # nearly parallel quaternions fall back to linear interpolation
+    linear = sin < 1e-6
+    sin = torch.where(linear, torch.ones_like(sin), sin)
+    w0 = torch.where(linear, 1 - weight, torch.sin((1 - weight) * theta) / sin)
+    w1 = torch.where(linear, weight * torch.ones_like(sin), torch.sin(weight * theta) / sin)
+    return w0 * q0 + w1 * q1
+
+
+def interpolate_camera(camera, next_camera, weight):
+    """
+    Camera at `weight` between two consecutive frames: the rotation is the blend of the two projected back onto
+    SO(3), the translation linear. Images, background and features stay those of `camera`.
+    """
+    interpolated = copy.copy(camera)
+    blend = (1 - weight) * camera.R + weight * next_camera.R
+    u, _, vt = np.linalg.svd(blend)
+    interpolated.R = u @ np.diag([1.0, 1.0, np.linalg.det(u @ vt)]) @ vt
+    interpolated.T = (1 - weight) * camera.T + weight * next_camera.T
+    device = camera.world_view_transform.device
+    interpolated.world_view_transform = torch.tensor(getWorld2View2(interpolated.R, interpolated.T, camera.trans, camera.scale)).transpose(0, 1).to(device)
+    interpolated.full_proj_transform = (interpolated.world_view_transform.unsqueeze(0).bmm(camera.projection_matrix.to(device).unsqueeze(0))).squeeze(0)
+    interpolated.camera_center = interpolated.world_view_transform.inverse()[3, :3]
+    return interpolated
+
+
+class KeyframeInterpolator:
+    """
+    Runs the deformation network on keyframes only and interpolates the deformed Gaussians of the frames in
+    between: slerp for rotations, linear for everything else (positions, log-scales, opacity logits, SH and
+    attention). A frame is a keyframe every `stride` frames, or earlier once its conditioning moved by more
+    than `threshold` (largest absolute difference) since the previous keyframe; the last frame of a batch
+    always is one (it is the right end of the batch's last interpolation), so the stride holds only for batches
+    of a multiple of it, and render.py rounds --batch up accordingly. With fps_multiplier m, m - 1 frames interpolated between consecutive input frames (deformed
+    Gaussians and camera pose) are rendered before each of them, e.g. 50 fps output from 25 fps audio features.
+    The last frame of a batch is kept for the next one, so call reset() before every clip.
+    """
+    def __init__(self, stride=1, threshold=None, fps_multiplier=1):
+        self.stride = stride
+        self.threshold = threshold
+        self.fps_multiplier = fps_multiplier
+        self.keyframes = 0
+        self.frames = 0
+        self.reset()
+
+    def reset(self):
+        self.previous = None
+        self.since_keyframe = 0
+
+    def expand_cameras(self, cameras):
+        """Output cameras for a batch of consecutive input cameras and their times (input frames, 0 = cameras[0])."""
+        outputs, times = [], []
+        for i, camera in enumerate(cameras):
+            left = cameras[i - 1] if i > 0 else (self.previous["camera"] if self.previous is not None else None)
+            if left is not None:
+                for j in range(1, self.fps_multiplier):
+                    outputs.append(interpolate_camera(left, camera, j / self.fps_multiplier))
+                    times.append(i - 1 + j / self.fps_multiplier)
+            outputs.append(camera)
+            times.append(float(i))
+        self.last_camera = cameras[-1]
+        return outputs, times
+
+    def select(self, keys):
+        keys = keys.cpu()
+        last = self.previous["key"] if self.previous is not None else None
+        selected = []
+        for i in range(keys.shape[0]):
+            self.since_keyframe += 1
+            if last is None or i == keys.shape[0] - 1 or self.since_keyframe >= self.stride or \
+                    (self.threshold is not None and (keys[i] - last).abs().max().item() > self.threshold):
+                selected.append(i)
+                last = keys[i]
+                self.since_keyframe = 0
+        return selected
+
+    def deform(self, keys, times, compute):
+        """
+        keys: [B, D] conditioning of the input frames, times: output frame times from expand_cameras, compute(frames)
+        deforms the given input frames into a list of [len(frames), ...] tensors. Returns the list for the output frames.
+        """
+        keyframes = self.select(keys)
+        computed = compute(keyframes)
+        self.keyframes += len(keyframes)
+        self.frames += keys.shape[0]
+
+        anchors = [float(k) for k in keyframes]
+        if self.previous is not None:
+            anchors = [-1.0] + anchors
+            computed = [torch.cat([previous, values]) for previous, values in zip(self.previous["values"], computed)]
+        right = [min(bisect.bisect_left(anchors, t), len(anchors) - 1) for t in times]
+        left = [r if anchors[r] == t or r == 0 else r - 1 for r, t in zip(right, times)]
+        weight = [0.0 if l == r else (t - anchors[l]) / (anchors[r] - anchors[l]) for l, r, t in zip(left, right, times)]
+        device = computed[0].device
+        left, right = torch.tensor(left, device=device), torch.tensor(right, device=device)
+        weight = torch.tensor(weight, device=device)
+
+        outputs = []
+        for a, values in enumerate(computed):
+            w = weight.view(-1, *[1] * (values.dim() - 1)).to(values.dtype)
+            if a == 2:  # rotations, in the order the deformation network returns its outputs
+                outputs.append(slerp(values[left], values[right], w))
+            else:
+                outputs.append(torch.lerp(values[left], values[right], w))
+        self.previous = {"camera": self.last_camera, "key": keys[-1].cpu(), "values": [values[-1:] for values in computed]}
+        return outputs
+
+    def report(self, title="KEYFRAMES"):
+        if self.frames == 0:
+            return
+        print("[{}] deformed {} of {} input frames ({:.1%}), stride {}, threshold {}, {}x frame rate".format(
+            title, self.keyframes, self.frames, self.keyframes / self.frames, self.stride, self.threshold, self.fps_multiplier))
+
+
+def projected_bounds(cameras, xyz, scales, opacity):
+    """
+    Pixel bounds (row_min, row_max, col_min, col_max) the rasterizer can draw the Gaussians into, per camera: the
+    distance at which a Gaussian's alpha drops under the rasterizer's 1/255 cutoff, along the largest axis of its
+    projected footprint. xyz, scales (activated) [B, N, 3] and opacity (activated) [B, N, 1]; None for a camera
+    with no Gaussian beyond the 0.2 near plane.
+    """
+    device = xyz.device
+    full_proj = torch.stack([camera.full_proj_transform for camera in cameras]).to(device)
+    clip = torch.bmm(F.pad(xyz, (0, 1), value=1.0), full_proj) # B, N, 4, w is the view depth
+    depth = clip[..., 3].clamp(min=1e-6)
+    width, height, tan_x, tan_y = [torch.tensor(values, dtype=xyz.dtype, device=device)[:, None] for values in zip(
+        *[(camera.image_width, camera.image_height, math.tan(camera.FoVx / 2), math.tan(camera.FoVy / 2)) for camera in cameras])]
+    ndc_x, ndc_y = clip[..., 0] / depth, clip[..., 1] / depth
+    col = ((ndc_x + 1) * width - 1) / 2
+    row = ((ndc_y + 1) * height - 1) / 2
+
+    # largest singular value of the projection Jacobian times the largest scale, with the 0.3 pixel low-pass
+    focal = torch.maximum(width / (2 * tan_x), height / (2 * tan_y))
+    stretch = torch.sqrt(1 + (ndc_x * tan_x) ** 2 + (ndc_y * tan_y) ** 2)
+    sigma = torch.sqrt((scales.amax(dim=-1) * focal * stretch / depth) ** 2 + 0.3)
+    radius = torch.ceil(sigma * torch.sqrt(2 * torch.log((255 * opacity[..., 0]).clamp(min=1.0)))) + 1
+    valid = (clip[..., 3] > 0.2) & (opacity[..., 0] >= 1 / 255)
+
+    inf = torch.tensor(float("inf"), dtype=xyz.dtype, device=device)
+    bounds = torch.stack([torch.where(valid, row - radius, inf).amin(dim=1), torch.where(valid, row + radius, -inf).amax(dim=1),
+                          torch.where(valid, col - radius, inf).amin(dim=1), torch.where(valid, col + radius, -inf).amax(dim=1)], dim=1)
+    return [b if all(math.isfinite(v) for v in b) else None for b in bounds.tolist()]
+
+
+# the rasterizer clamps the perspective Jacobian at 1.3 tan(fov / 2) of the window: a window reaching u pixels from
+# the principal point on one side must reach at least CLAMP_BALANCE * u on the other to rasterize like the full frame
+CLAMP_BALANCE = 0.35 / 0.65
+# "face" crops: face_rect (the 68 landmarks, brows to jaw) grown by these fractions of its height / width to hold
+# the forehead, hair and ears: top, bottom, left, right
+FACE_GROWTH = (0.6, 0.15, 0.25, 0.25)
+
+
+def grow_face_rect(face_rect):
+    row_min, row_max, col_min, col_max = face_rect
+    height, width = row_max - row_min, col_max - col_min
+    top, bottom, left, right = FACE_GROWTH
+    return [row_min - top * height, row_max + bottom * height, col_min - left * width, col_max + right * width]
+
+
+def _window_extent(low, high, size):
+    """Pixel range [start, stop) along one axis holding [low, high] that rasterizes like the full frame (see CLAMP_BALANCE)."""
+    center = size / 2
+    before, after = center - low, high + 1 - center
+    before, after = max(before, CLAMP_BALANCE * after), max(after, CLAMP_BALANCE * before)
+    start = min(max(0, math.floor(center - before)), size - 1)
+    stop = max(min(size, math.ceil(center + after)), start + 1)
+    return start, stop
+
+
+def crop_window(bounds, width, height, margin=0):
+    """
+    (top, left, crop height, crop width) of the window holding the pixel `bounds` (row_min, row_max, col_min,
+    col_max) grown by `margin`. The window follows the head instead of the image center, but extends to the other
+    side of the principal point by CLAMP_BALANCE of its far side, so crop_camera renders the pixels of the full frame.
+    """
+    row_min, row_max, col_min, col_max = bounds
+    top, bottom = _window_extent(row_min - margin, row_max + margin, height)
+    left, right = _window_extent(col_min - margin, col_max + margin, width)
+    return top, left, bottom - top, right - left
+
+
+def crop_camera(camera, window):
+    """
+    `camera` cut to the pixel `window` (top, left, crop height, crop width): same pose and focal length, the
+    field of view of the window (tan = size / (2 focal)) and the principal point shifted to the window.
+    """
+    top, left, height, width = window
+    cropped = copy.copy(camera)
+    cropped.image_height, cropped.image_width = height, width
+    focal_x = camera.image_width / (2 * math.tan(camera.FoVx / 2))
+    focal_y = camera.image_height / (2 * math.tan(camera.FoVy / 2))
+    cropped.FoVx = 2 * math.atan(width / (2 * focal_x))
+    cropped.FoVy = 2 * math.atan(height / (2 * focal_y))
+    projection = getProjectionMatrix(znear=camera.znear, zfar=camera.zfar, fovX=cropped.FoVx, fovY=cropped.FoVy)
+    # ndc offset of the full-frame principal point in the window
+    projection[0, 2] = (camera.image_width - 2 * left - width) / width
+    projection[1, 2] = (camera.image_height - 2 * top - height) / height
+    device = camera.world_view_transform.device
+    cropped.projection_matrix = projection.transpose(0, 1).to(device)
+    cropped.full_proj_transform = (camera.world_view_transform.unsqueeze(0).bmm(cropped.projection_matrix.unsqueeze(0))).squeeze(0)
+    return cropped
@@ -21,4 +21,137 @@ class Timer:
         if self.paused:
             return self.elapsed
         else:
-            return time.time() - self.start_time
\ No newline at end of file
+            return time.time() - self.start_time
+
+class IterationTimer:
+    """
+    Accumulates wall time per training-step section (data, render, loss, ...)
+    and prints the per-iteration average, the slowest iteration of each section
+    (densification spikes) and the peak CUDA memory every `interval` iterations.
+    CUDA is synchronized at every lap so the numbers reflect GPU work; this
+    costs throughput, so the timer is a no-op when interval is 0.
+    summary() returns the same statistics over the whole run, leaving out the
+    first `warmup` iterations (allocator, cuDNN autotuning, loader start-up).
+    """
+    def __init__(self, interval=0, warmup=0):
+        self.interval = interval
+        self.enabled = interval > 0
+        self.warmup = warmup
+        self.current = {}
+        self.totals = {}
+        self.maxima = {}
+        self.count = 0
+        self.run_totals = {}
+        self.run_maxima = {}
+        self.run_count = 0
+        self.steps = 0
+        self.peak_memory = 0
+        self.last = None
+
+    def _now(self):
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def start(self):
+        if self.enabled:
+            self.last = self._now()
+
+    def lap(self, name):
+        if not self.enabled:
+            return
+        now = self._now()
+        self.current[name] = self.current.get(name, 0.0) + now - self.last
+        self.last = now
+
+    @staticmethod
+    def _accumulate(totals, maxima, current):
+        for name, elapsed in current.items():
+            totals[name] = totals.get(name, 0.0) + elapsed
+            maxima[name] = max(maxima.get(name, 0.0), elapsed)
+
+    def step(self, iteration):
+        if not self.enabled:
+            return
+        current, self.current = self.current, {}
+        self.steps += 1
+        self._accumulate(self.totals, self.maxima, current)
+        self.count += 1
+        if self.steps > self.warmup:
+            self._accumulate(self.run_totals, self.run_maxima, current)
+            self.run_count += 1
+        if self.count % self.interval != 0:
+            return
+        import torch
+        parts = ["{} {:.2f}ms (max {:.2f})".format(name, 1000 * total / self.count, 1000 * self.maxima[name])
+                 for name, total in self.totals.items()]
+        total_ms = 1000 * sum(self.totals.values()) / self.count
+        memory = ""
+        if torch.cuda.is_available():
+            peak = torch.cuda.max_memory_allocated()
+            self.peak_memory = max(self.peak_memory, peak)
+            memory = " | peak mem {:.0f}MB".format(peak / 2 ** 20)
+            torch.cuda.reset_peak_memory_stats()
+        print("\n[TIMER ITER {}] {} | total {:.2f}ms/it ({:.2f} it/s){}".format(
+            iteration, " | ".join(parts), total_ms, 1000 / max(total_ms, 1e-9), memory))
+        self.totals = {}
+        self.maxima = {}
+        self.count = 0
+
+    def summary(self):
+        """{"iterations", "it_per_s", "mean_ms": {section: ms}, "max_ms": {...}, "peak_memory_mb"} over the run after warm-up."""
+        import torch
+        count = max(self.run_count, 1)
+        total_ms = 1000 * sum(self.run_totals.values()) / count
+        peak_memory = self.peak_memory
+        if torch.cuda.is_available():
+            peak_memory = max(peak_memory, torch.cuda.max_memory_allocated())
+        return {"iterations": self.run_count,
+                "it_per_s": 1000 / total_ms if total_ms > 0 else 0.0,
+                "mean_ms": {name: 1000 * total / count for name, total in self.run_totals.items()},
+                "max_ms": {name: 1000 * value for name, value in self.run_maxima.items()},
+                "peak_memory_mb": peak_memory / 2 ** 20 if torch.cuda.is_available() else None}
+
+
+class StageTimer:
+    """
+    Wall time per stage of a whole run (scene load, data loading, deformation, rasterization, encoding, ...),
+    for the render path where stages are not per iteration. lap(name) adds the time since the previous
+    lap or start() to `name`. CUDA is synchronized at every lap, so it is disabled unless asked for.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.totals = {}
+        self.counts = {}
+        self.last = None
+
+    def _now(self):
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def start(self):
+        if self.enabled:
+            self.last = self._now()
+
+    def lap(self, name):
+        if not self.enabled:
+            return
+        now = self._now()
+        self.totals[name] = self.totals.get(name, 0.0) + now - self.last
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.last = now
+
+    def summary(self):
+        """{stage: seconds} in the order the stages first ran."""
+        return dict(self.totals)
+
+    def report(self, title="TIMING"):
+        if not self.enabled or not self.totals:
+            return
+        total = sum(self.totals.values())
+        print("[{}] total {:.2f}s".format(title, total))
+        for name, seconds in self.totals.items():
+            print("    {:<16} {:8.3f}s {:5.1f}%  ({} calls)".format(name, seconds, 100 * seconds / max(total, 1e-9), self.counts[name]))
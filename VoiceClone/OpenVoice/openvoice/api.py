@@ -55,12 +55,7 @@ class BaseSpeakerTTS(OpenVoiceBaseClass):
 
     @staticmethod
     def audio_numpy_concat(segment_data_list, sr, speed=1.):
-        audio_segments = []
-        for segment_data in segment_data_list:
-            audio_segments += segment_data.reshape(-1).tolist()
-            audio_segments += [0] * int((sr * 0.05)/speed)
-        audio_segments = np.array(audio_segments).astype(np.float32)
-        return audio_segments
+        return utils.concat_audio_segments(segment_data_list, pad_len=int((sr * 0.05)/speed))
 
     @staticmethod
     def split_sentences_into_pieces(text, language_str):
@@ -70,27 +65,49 @@ class BaseSpeakerTTS(OpenVoiceBaseClass):
         print(" > ===========================")
         return texts
 
-    def tts(self, text, output_path, speaker, language='English', speed=1.0):
+    def prepare_text(self, text, mark):
+        text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text)
+        text = f'[{mark}]{text}[{mark}]'
+        return self.get_text(text, self.hps, False)
+
+    def infer_batch(self, texts, speaker, mark, speed=1.0):
+        """
+        把多句文本 padding 成一个 batch，一次前向完成合成。
+        返回每句去掉 padding 后的音频（float32 numpy 数组）。
+        """
+        device = self.device
+        seqs = [self.prepare_text(t, mark) for t in texts]
+        x_lengths = torch.LongTensor([seq.size(0) for seq in seqs])
+        x = torch.zeros(len(seqs), int(x_lengths.max()), dtype=torch.long)
+        for i, seq in enumerate(seqs):
+            x[i, :seq.size(0)] = seq
+        sid = torch.LongTensor([self.hps.speakers[speaker]] * len(seqs)).to(device)
+        with torch.no_grad():
+            o, _, y_mask, _ = self.model.infer(x.to(device), x_lengths.to(device), sid=sid, noise_scale=0.667,
+                                               noise_scale_w=0.6, length_scale=1.0 / speed)
+        # 解码器把每个隐变量帧上采样为 hop 个采样点
+        hop = o.size(-1) // y_mask.size(-1)
+        y_lengths = (y_mask.sum(dim=(1, 2)).long() * hop).tolist()
+        o = o[:, 0].data.cpu().float().numpy()
+        return [o[i, :y_lengths[i]] for i in range(len(seqs))]
+
+    def tts_stream(self, text, speaker, language='English', speed=1.0, batch_size=4):
+        """
+        按句切分并按 batch_size 句一组合成，每句合成完毕立即 yield（句尾已补静音），
+        调用方可以边合成边播放或写文件。
+        """
         mark = self.language_marks.get(language.lower(), None)
         assert mark is not None, f"language {language} is not supported"
 
         texts = self.split_sentences_into_pieces(text, mark)
-
-        audio_list = []
-        for t in texts:
-            t = re.sub(r'([a-z])([A-Z])', r'\1 \2', t)
-            t = f'[{mark}]{t}[{mark}]'
-            stn_tst = self.get_text(t, self.hps, False)
-            device = self.device
-            speaker_id = self.hps.speakers[speaker]
-            with torch.no_grad():
-                x_tst = stn_tst.unsqueeze(0).to(device)
-                x_tst_lengths = torch.LongTensor([stn_tst.size(0)]).to(device)
-                sid = torch.LongTensor([speaker_id]).to(device)
-                audio = self.model.infer(x_tst, x_tst_lengths, sid=sid, noise_scale=0.667, noise_scale_w=0.6,
-                                    length_scale=1.0 / speed)[0][0, 0].data.cpu().float().numpy()
-            audio_list.append(audio)
-        audio = self.audio_numpy_concat(audio_list, sr=self.hps.data.sampling_rate, speed=speed)
+        pad_len = int((self.hps.data.sampling_rate * 0.05) / speed)
+        for start in range(0, len(texts), batch_size):
+            for audio in self.infer_batch(texts[start:start + batch_size], speaker, mark, speed):
+                yield utils.concat_audio_segments([audio], pad_len=pad_len)
+
+    def tts(self, text, output_path, speaker, language='English', speed=1.0, batch_size=4):
+        audio_list = list(self.tts_stream(text, speaker, language=language, speed=speed, batch_size=batch_size))
+        audio = utils.concat_audio_segments(audio_list)
 
         if output_path is None:
             return audio
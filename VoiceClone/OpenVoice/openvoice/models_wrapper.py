@@ -75,11 +75,7 @@ class BaseSpeakerTTS:
 
     @staticmethod
     def audio_numpy_concat(segment_data_list, sr, speed=1.):
-        audio_segments = []
-        for segment_data in segment_data_list:
-            audio_segments += segment_data.reshape(-1).tolist()
-            audio_segments += [0] * int((sr * 0.05)/speed)
-        return np.array(audio_segments).astype(np.float32)
+        return utils.concat_audio_segments(segment_data_list, pad_len=int((sr * 0.05)/speed))
 
     def tts(self, text, output_path, speaker, language='English', speed=1.0):
         if output_path is None:
@@ -71,8 +71,88 @@ def split_sentence(text, min_len=10, language_str='[EN]'):
     else:
         return split_sentences_zh(text, min_len)
 
-# 省略 split_sentences_latin, merge_short_sentences_latin, split_sentences_zh, merge_short_sentences_zh
-# 可以沿用你原来的代码
+def split_sentences_latin(text, min_len=10):
+    text = re.sub('[。！？；]', '.', text)
+    text = re.sub('[，]', ',', text)
+    text = re.sub('[“”]', '"', text)
+    text = re.sub('[‘’]', "'", text)
+    text = re.sub(r"[\<\>\(\)\[\]\"\«\»]+", "", text)
+    text = re.sub('[\n\t ]+', ' ', text)
+    text = re.sub('([,.!?;])', r'\1 $#!', text)
+    sentences = [s.strip() for s in text.split('$#!')]
+    if len(sentences[-1]) == 0:
+        del sentences[-1]
+
+    new_sentences = []
+    new_sent = []
+    count_len = 0
+    for ind, sent in enumerate(sentences):
+        new_sent.append(sent)
+        count_len += len(sent.split(" "))
+        if count_len > min_len or ind == len(sentences) - 1:
+            count_len = 0
+            new_sentences.append(' '.join(new_sent))
+            new_sent = []
+    return merge_short_sentences_latin(new_sentences)
+
+def merge_short_sentences_latin(sens):
+    sens_out = []
+    for s in sens:
+        if len(sens_out) > 0 and len(sens_out[-1].split(" ")) <= 2:
+            sens_out[-1] = sens_out[-1] + " " + s
+        else:
+            sens_out.append(s)
+    if len(sens_out) > 1 and len(sens_out[-1].split(" ")) <= 2:
+        sens_out[-2] = sens_out[-2] + " " + sens_out[-1]
+        sens_out.pop(-1)
+    return sens_out
+
+def split_sentences_zh(text, min_len=10):
+    text = re.sub('[。！？；]', '.', text)
+    text = re.sub('[，]', ',', text)
+    text = re.sub('[\n\t ]+', ' ', text)
+    text = re.sub('([,.!?;])', r'\1 $#!', text)
+    sentences = [s.strip() for s in text.split('$#!')]
+    if len(sentences[-1]) == 0:
+        del sentences[-1]
+
+    new_sentences = []
+    new_sent = []
+    count_len = 0
+    for ind, sent in enumerate(sentences):
+        new_sent.append(sent)
+        count_len += len(sent)
+        if count_len > min_len or ind == len(sentences) - 1:
+            count_len = 0
+            new_sentences.append(' '.join(new_sent))
+            new_sent = []
+    return merge_short_sentences_zh(new_sentences)
+
+def merge_short_sentences_zh(sens):
+    sens_out = []
+    for s in sens:
+        if len(sens_out) > 0 and len(sens_out[-1]) <= 2:
+            sens_out[-1] = sens_out[-1] + " " + s
+        else:
+            sens_out.append(s)
+    if len(sens_out) > 1 and len(sens_out[-1]) <= 2:
+        sens_out[-2] = sens_out[-2] + " " + sens_out[-1]
+        sens_out.pop(-1)
+    return sens_out
+
+def concat_audio_segments(segment_data_list, pad_len=0, dtype=np.float32):
+    """
+    把若干段音频拼接成一维数组，每段之后补 pad_len 个静音采样。
+    先按总长度一次性分配输出缓冲区再逐段写入，避免 list 反复扩容。
+    """
+    segments = [np.asarray(s).reshape(-1) for s in segment_data_list]
+    total = sum(s.shape[0] for s in segments) + pad_len * len(segments)
+    out = np.zeros(total, dtype=dtype)
+    offset = 0
+    for s in segments:
+        out[offset:offset + s.shape[0]] = s
+        offset += s.shape[0] + pad_len
+    return out
 
 # ==========================
 # text_to_sequence
@@ -92,6 +92,10 @@ def video_generation_stream():
         "ssh_password": request.form.get('ssh_password', '83WncIL5CoYB'),
     }
     
+    # 前端断开 SSE 连接时通知后台终止渲染子进程
+    cancel_event = threading.Event()
+    data['cancel_event'] = cancel_event
+    
     progress_queue = queue.Queue()
     
     def progress_callback(step, message, extra_data=None):
@@ -136,14 +140,20 @@ def video_generation_stream():
         thread = threading.Thread(target=run_generation, daemon=True)
         thread.start()
         
-        while True:
-            try:
-                progress = progress_queue.get(timeout=300)  # 5分钟超时
-                yield f"data: {json.dumps(progress, ensure_ascii=False)}\n\n"
-                if progress['step'] in ('complete', 'error'):
-                    break
-            except queue.Empty:
-                yield f"data: {json.dumps({'step': 'heartbeat', 'message': '生成中...'})}\n\n"
+        finished = False
+        try:
+            while True:
+                try:
+                    progress = progress_queue.get(timeout=300)  # 5分钟超时
+                    yield f"data: {json.dumps(progress, ensure_ascii=False)}\n\n"
+                    if progress['step'] in ('complete', 'error'):
+                        finished = True
+                        break
+                except queue.Empty:
+                    yield f"data: {json.dumps({'step': 'heartbeat', 'message': '生成中...'})}\n\n"
+        finally:
+            if not finished:
+                cancel_event.set()
     
     return Response(
         generate(),
@@ -211,6 +221,7 @@ def model_training_stream():
         "config": request.form.get('config', 'arguments/64_dim_1_transformer.py'),
         "skip_preprocess": request.form.get('skip_preprocess') == '1',
         "model_name": request.form.get('model_name', ''),
+        "resume": request.form.get('resume') == '1',
         "ssh_port": request.form.get('ssh_port', 40258),
         "ssh_password": request.form.get('ssh_password', '83WncIL5CoYB'),
     }
@@ -224,6 +235,10 @@ def model_training_stream():
             au_csv_file.save(au_csv_path)
             data['au_csv'] = au_csv_path
     
+    # 前端断开 SSE 连接时通知后台终止训练子进程
+    cancel_event = threading.Event()
+    data['cancel_event'] = cancel_event
+    
     progress_queue = queue.Queue()
     
     def progress_callback(step, message, extra_data=None):
@@ -252,14 +267,20 @@ def model_training_stream():
         thread = threading.Thread(target=run_training, daemon=True)
         thread.start()
         
-        while True:
-            try:
-                progress = progress_queue.get(timeout=300)  # 5分钟超时
-                yield f"data: {json.dumps(progress, ensure_ascii=False)}\n\n"
-                if progress['step'] in ('complete', 'error'):
-                    break
-            except queue.Empty:
-                yield f"data: {json.dumps({'step': 'heartbeat', 'message': '训练中...'})}\n\n"
+        finished = False
+        try:
+            while True:
+                try:
+                    progress = progress_queue.get(timeout=300)  # 5分钟超时
+                    yield f"data: {json.dumps(progress, ensure_ascii=False)}\n\n"
+                    if progress['step'] in ('complete', 'error'):
+                        finished = True
+                        break
+                except queue.Empty:
+                    yield f"data: {json.dumps({'step': 'heartbeat', 'message': '训练中...'})}\n\n"
+        finally:
+            if not finished:
+                cancel_event.set()
     
     return Response(
         generate(),
@@ -0,0 +1,116 @@
+"""
+SSH 连接池与常驻 shell 的本地检查：用在本机 bash 上执行命令的假 SSH 客户端替换 paramiko，
+检查连接复用、失效连接的淘汰、结束标记的解析（输出不以换行结尾、非零退出码），
+以及命令中途出错的 shell 不会被放回连接池。不满足时抛出 AssertionError。
+
+    python -m backend.check_cloud_pool
+"""
+import subprocess
+
+from backend.cloud_trainer import SSHConnectionPool, CloudTrainer
+
+
+class _FakeChannel:
+    """本机子进程充当远端 channel"""
+
+    def __init__(self):
+        self.process = None
+        self.closed = False
+
+    def set_combine_stderr(self, combine):
+        pass
+
+    def exec_command(self, command):
+        self.process = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT, text=True, encoding='utf-8')
+
+    def makefile(self, mode):
+        return self.process.stdin if 'w' in mode else self.process.stdout
+
+    def exit_status_ready(self):
+        return self.process.poll() is not None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.process.kill()
+            self.process.wait()
+
+
+class _FakeTransport:
+    def __init__(self):
+        self.active = True
+        self.channels = []
+
+    def is_active(self):
+        return self.active
+
+    def set_keepalive(self, interval):
+        pass
+
+    def open_session(self):
+        channel = _FakeChannel()
+        self.channels.append(channel)
+        return channel
+
+
+class _FakeClient:
+    def __init__(self):
+        self.transport = None
+        self.closed = False
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, **kwargs):
+        self.transport = _FakeTransport()
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.closed = True
+        self.transport.active = False
+
+
+def check_cloud_pool():
+    pool = SSHConnectionPool(client_factory=_FakeClient, shell_init="true")
+    try:
+        # 同一主机复用连接，失效的连接被淘汰并重连
+        client = pool.get_client("host", 22, "root", "password")
+        assert pool.get_client("host", 22, "root", "password") is client
+        client.transport.active = False
+        reconnected = pool.get_client("host", 22, "root", "password")
+        assert reconnected is not client and client.closed
+
+        # 结束标记：输出不以换行结尾、以换行结尾、退出码非零
+        shell = pool.acquire_shell(reconnected)
+        assert shell.run("printf abc") == (True, "abc\n")
+        assert shell.run("echo hi") == (True, "hi\n")
+        assert shell.run("echo out; exit 3") == (False, "out\n")
+        assert shell.run("cd /", subshell=True) == (True, "")
+        pool.release_shell(reconnected, shell)
+        assert pool.acquire_shell(reconnected) is shell
+        pool.release_shell(reconnected, shell)
+
+        # 命令中途出错（这里是输出无法按 UTF-8 解码）的 shell 被关闭，下一个调用方拿到新的 shell
+        trainer = CloudTrainer("host", 22, "password", pool=pool)
+        assert trainer.connect()
+        try:
+            trainer.execute_in_env("printf '\\377\\n'; sleep 5")
+        except UnicodeDecodeError:
+            pass
+        else:
+            raise AssertionError("undecodable output should raise")
+        assert shell.channel.closed and not shell.is_alive()
+        fresh = pool.acquire_shell(reconnected)
+        assert fresh is not shell and fresh.run("echo ok") == (True, "ok\n")
+        pool.release_shell(reconnected, fresh)
+        trainer.disconnect()
+    finally:
+        pool.close_all()
+
+
+if __name__ == "__main__":
+    check_cloud_pool()
+    print("[CHECK] SSHConnectionPool ok")
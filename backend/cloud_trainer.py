@@ -2,35 +2,242 @@
 云端训练模块 - 通过SSH连接到AutoDL服务器进行训练
 """
 import os
+import json
+import hashlib
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import paramiko
-from scp import SCPClient
 import time
 
 
+# 远端 conda 环境激活命令（常驻 shell 启动时执行一次）
+CONDA_ACTIVATE = "source /root/miniconda3/etc/profile.d/conda.sh && conda activate gt"
+
+# 分块传输参数
+TRANSFER_CHUNK_SIZE = 8 * 1024 * 1024
+TRANSFER_WORKERS = 4
+# 远端每个目录下记录 {文件名: {sha256, size, mtime}} 的清单
+MANIFEST_NAME = ".cloud_manifest.json"
+# 本地断点续传记录目录
+TRANSFER_JOURNAL_DIR = "./temp/transfers"
+
+# 云端训练定期写检查点的间隔
+TRAIN_CHECKPOINT_INTERVAL = 1000
+
+
+def build_train_command(remote_data_dir, model_name, config, iterations, resume=False):
+    """
+    云端训练命令。
+    resume=True 仅用于重试同一个任务（实例被回收后），从最近的检查点继续；
+    新的训练先清掉同名模型上一轮的检查点，否则续训会找到上一轮最终的检查点，直接以旧权重"完成"。
+    """
+    model_path = f"output/{model_name}"
+    train_cmd = (f"WANDB_MODE=disabled python train.py -s {remote_data_dir} --model_path {model_path} "
+                 f"--configs {config} --iterations {iterations} --checkpoint_interval {TRAIN_CHECKPOINT_INTERVAL}")
+    if resume:
+        return f"{train_cmd} --start_checkpoint latest"
+    return f"rm -rf {model_path}/checkpoints && {train_cmd}"
+
+
+def _sha256_file(path, block_size=TRANSFER_CHUNK_SIZE):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class RemoteShell:
+    """
+    常驻远端的 bash 进程。
+    启动时激活一次 conda 环境，之后的命令都在该 shell 的子 shell 中执行，
+    省去每条命令重复 source conda 的开销。一个 shell 同一时间只执行一条命令。
+    """
+
+    def __init__(self, transport, init_command=CONDA_ACTIVATE):
+        self.channel = transport.open_session()
+        self.channel.set_combine_stderr(True)
+        self.channel.exec_command("bash --noprofile --norc")
+        self.stdin = self.channel.makefile('wb')
+        self.stdout = self.channel.makefile('r')
+
+        success, output = self.run(f"export PYTHONUNBUFFERED=1 && {init_command}", subshell=False)
+        if not success:
+            self.close()
+            raise RuntimeError(f"远端 shell 初始化失败: {output}")
+
+    def is_alive(self):
+        return not self.channel.closed and not self.channel.exit_status_ready()
+
+    def run(self, command, cwd=None, subshell=True):
+        """执行命令并实时输出，返回 (success, output)"""
+        if cwd:
+            command = f"cd {cwd} && {command}"
+        if subshell:
+            # 放进子 shell，cd/exit 等不会影响常驻 shell 本身
+            command = f"( {command} ) < /dev/null"
+
+        # 标记前先补一个换行：命令输出不以换行结尾（printf、进度条）时标记也独占一行
+        marker = f"__CLOUD_TRAINER_DONE_{uuid.uuid4().hex}__"
+        self.stdin.write(f"{command}; printf '\\n%s %d\\n' \"{marker}\" $?\n")
+        self.stdin.flush()
+
+        lines = []
+        exit_status = None
+        for line in self.stdout:
+            if marker in line:
+                exit_status = int(line.split(marker, 1)[1].strip() or 1)
+                # 输出本身以换行结尾时，补的换行多出一个空行
+                if lines and lines[-1] == "\n":
+                    lines.pop()
+                break
+            print(f"[REMOTE] {line.rstrip()}")
+            lines.append(line)
+
+        output = "".join(lines)
+        if exit_status is None:
+            # 读到 EOF 说明远端 shell 已退出
+            return False, output
+        return exit_status == 0, output
+
+    def close(self):
+        try:
+            self.channel.close()
+        except Exception:
+            pass
+
+
+class SSHConnectionPool:
+    """
+    进程级 SSH 连接池。
+    同一 (host, port, username) 复用一个已认证的 transport（开启 keepalive），
+    多个渲染/训练任务通过各自的 channel 共享它；同时缓存空闲的 RemoteShell。
+    client_factory / shell_init 可替换为测试用的假客户端和初始化命令（见 backend/check_cloud_pool.py）。
+    """
+
+    def __init__(self, keepalive=30, client_factory=paramiko.SSHClient, shell_init=CONDA_ACTIVATE):
+        self.keepalive = keepalive
+        self.client_factory = client_factory
+        self.shell_init = shell_init
+        self._clients = {}
+        self._idle_shells = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _is_active(client):
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def get_client(self, host, port, username, password, timeout=30, compress=False):
+        key = (host, int(port), username, bool(compress))
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None and self._is_active(client):
+                return client
+            if client is not None:
+                self._drop(key)
+
+        # 在锁外建立连接，一台慢或不可达的主机不会阻塞其他主机的调用
+        client = self.client_factory()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            hostname=host,
+            port=int(port),
+            username=username,
+            password=password,
+            timeout=timeout,
+            compress=compress
+        )
+        client.get_transport().set_keepalive(self.keepalive)
+
+        with self._lock:
+            existing = self._clients.get(key)
+            if existing is not None and self._is_active(existing):
+                # 其他线程同时连上了同一主机，用先放进池里的那个
+                client.close()
+                return existing
+            if existing is not None:
+                self._drop(key)
+            self._clients[key] = client
+            self._idle_shells[key] = []
+            return client
+
+    def acquire_shell(self, client):
+        """取一个空闲的常驻 shell，没有则新建"""
+        with self._lock:
+            idle = self._idle_shells.setdefault(self._key_of(client), [])
+            while idle:
+                shell = idle.pop()
+                if shell.is_alive():
+                    return shell
+                shell.close()
+        return RemoteShell(client.get_transport(), self.shell_init)
+
+    def release_shell(self, client, shell):
+        """命令正常结束后归还 shell；命令中途出错时调用方应直接 close，不能归还"""
+        with self._lock:
+            key = self._key_of(client)
+            if shell.is_alive() and self._clients.get(key) is client:
+                self._idle_shells.setdefault(key, []).append(shell)
+            else:
+                shell.close()
+
+    def _key_of(self, client):
+        for key, c in self._clients.items():
+            if c is client:
+                return key
+        return id(client)
+
+    def _drop(self, key):
+        for shell in self._idle_shells.pop(key, []):
+            shell.close()
+        client = self._clients.pop(key, None)
+        if client is not None:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        with self._lock:
+            for key in list(self._clients):
+                self._drop(key)
+
+
+# 进程级共享连接池
+_POOL = SSHConnectionPool()
+
+
+def get_connection_pool():
+    return _POOL
+
+
 class CloudTrainer:
     """AutoDL云端训练器"""
     
-    def __init__(self, ssh_host, ssh_port, ssh_password):
+    def __init__(self, ssh_host, ssh_port, ssh_password, pool=None, compress=False):
         self.ssh_host = ssh_host
         self.ssh_port = int(ssh_port)
         self.ssh_password = ssh_password
         self.ssh_username = "root"
         self.remote_base = "/root/autodl-tmp/GaussianTalker"
         self.ssh_client = None
+        self.pool = pool if pool is not None else _POOL
+        # 是否启用 SSH 传输层压缩（视频本身已压缩，默认关闭）
+        self.compress = compress
         
     def connect(self):
-        """建立SSH连接"""
+        """从连接池获取SSH连接（已有可用连接时直接复用）"""
         print(f"[CloudTrainer] 连接到 {self.ssh_host}:{self.ssh_port}")
-        self.ssh_client = paramiko.SSHClient()
-        self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
         try:
-            self.ssh_client.connect(
-                hostname=self.ssh_host,
-                port=self.ssh_port,
-                username=self.ssh_username,
-                password=self.ssh_password,
-                timeout=30
+            self.ssh_client = self.pool.get_client(
+                self.ssh_host,
+                self.ssh_port,
+                self.ssh_username,
+                self.ssh_password,
+                timeout=30,
+                compress=self.compress
             )
             print("[CloudTrainer] SSH连接成功")
             return True
@@ -39,10 +246,10 @@ class CloudTrainer:
             return False
     
     def disconnect(self):
-        """断开SSH连接"""
+        """释放SSH连接（连接归还连接池，不真正关闭）"""
         if self.ssh_client:
-            self.ssh_client.close()
-            print("[CloudTrainer] SSH连接已关闭")
+            self.ssh_client = None
+            print("[CloudTrainer] SSH连接已归还连接池")
     
     def execute_command(self, command, cwd=None):
         """执行远程命令"""
@@ -66,41 +273,254 @@ class CloudTrainer:
         
         return True, stdout.read().decode()
     
-    def upload_file(self, local_path, remote_path):
-        """上传文件到云端"""
+    def execute_in_env(self, command, cwd=None):
+        """在已激活 gt 环境的常驻远端 shell 中执行命令"""
+        print(f"[CloudTrainer] 执行命令(gt): {command}")
+        shell = self.pool.acquire_shell(self.ssh_client)
+        try:
+            success, output = shell.run(command, cwd=cwd)
+        except BaseException:
+            # 没读到结束标记（超时、中断、输出解码失败）时 shell 里可能还在跑这条命令，不能再给下一个调用方
+            shell.close()
+            raise
+        self.pool.release_shell(self.ssh_client, shell)
+        
+        if not success:
+            print(f"[CloudTrainer] 命令执行失败")
+        return success, output
+    
+    def _run_quiet(self, command):
+        """执行远程命令并返回 (退出码, 标准输出)，不打印输出"""
+        stdin, stdout, stderr = self.ssh_client.exec_command(command)
+        output = stdout.read().decode()
+        return stdout.channel.recv_exit_status(), output
+    
+    def checkpoint_stamp(self, model_name, iteration):
+        """云端检查点目录中文件的最新修改时间（渲染缓存用），找不到时返回 None"""
+        path = f"{self.remote_base}/output/{model_name}/point_cloud/iteration_{iteration}"
+        try:
+            sftp = self.ssh_client.open_sftp()
+            try:
+                return int(max([sftp.stat(path).st_mtime] + [a.st_mtime for a in sftp.listdir_attr(path)]))
+            finally:
+                sftp.close()
+        except IOError:
+            return None
+    
+    def _read_manifest(self, sftp, remote_dir):
+        try:
+            with sftp.open(f"{remote_dir}/{MANIFEST_NAME}", 'r') as f:
+                return json.loads(f.read())
+        except (IOError, ValueError):
+            return {}
+    
+    def _write_manifest(self, sftp, remote_dir, manifest):
+        with sftp.open(f"{remote_dir}/{MANIFEST_NAME}", 'w') as f:
+            f.write(json.dumps(manifest, indent=2))
+    
+    def _remote_sha256(self, sftp, remote_path):
+        """
+        获取远端文件的 sha256。
+        清单里的记录在大小和修改时间都一致时直接复用，否则在远端重新计算并更新清单。
+        """
+        st = sftp.stat(remote_path)
+        remote_dir, name = os.path.dirname(remote_path), os.path.basename(remote_path)
+        manifest = self._read_manifest(sftp, remote_dir)
+        entry = manifest.get(name)
+        if entry and entry.get('size') == st.st_size and entry.get('mtime') == st.st_mtime:
+            return entry['sha256']
+        
+        status, output = self._run_quiet(f"sha256sum '{remote_path}'")
+        if status != 0 or not output:
+            raise IOError(f"远端校验和计算失败: {remote_path}")
+        sha = output.split()[0]
+        manifest[name] = {'sha256': sha, 'size': st.st_size, 'mtime': st.st_mtime}
+        self._write_manifest(sftp, remote_dir, manifest)
+        return sha
+    
+    def _load_journal(self, kind, src, dst, sha, total):
+        """读取断点续传记录；文件内容或分块大小变化时作废"""
+        os.makedirs(TRANSFER_JOURNAL_DIR, exist_ok=True)
+        key = hashlib.sha1(f"{kind}:{self.ssh_host}:{self.ssh_port}:{src}:{dst}".encode()).hexdigest()
+        journal_path = os.path.join(TRANSFER_JOURNAL_DIR, f"{key}.json")
+        journal = {'sha256': sha, 'size': total, 'chunk_size': TRANSFER_CHUNK_SIZE, 'done': []}
+        try:
+            with open(journal_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if all(saved.get(k) == journal[k] for k in ('sha256', 'size', 'chunk_size')):
+                journal = saved
+        except (IOError, ValueError):
+            pass
+        return journal_path, journal
+    
+    def _save_journal(self, journal_path, journal):
+        tmp_path = journal_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(journal, f)
+        os.replace(tmp_path, journal_path)
+    
+    def _transfer_chunks(self, total, journal_path, journal, open_pair, progress_callback=None):
+        """
+        多线程并行传输尚未完成的分块。
+        每个工作线程在共享 transport 上打开自己的 SFTP channel，
+        open_pair(sftp) 返回该线程使用的 (源文件, 目标文件)。
+        """
+        chunk_size = journal['chunk_size']
+        n_chunks = max(1, (total + chunk_size - 1) // chunk_size)
+        done = set(journal['done'])
+        pending = [i for i in range(n_chunks) if i not in done]
+        state = {'transferred': sum(min(chunk_size, total - i * chunk_size) for i in done)}
+        local = threading.local()
+        handles = []
+        lock = threading.Lock()
+        
+        if progress_callback:
+            progress_callback(state['transferred'], total)
+        
+        def worker(index):
+            if not hasattr(local, 'pair'):
+                sftp = self.ssh_client.open_sftp()
+                local.pair = open_pair(sftp)
+                with lock:
+                    handles.append((sftp,) + local.pair)
+            src, dst = local.pair
+            offset = index * chunk_size
+            src.seek(offset)
+            data = src.read(min(chunk_size, total - offset))
+            dst.seek(offset)
+            dst.write(data)
+            dst.flush()
+            with lock:
+                done.add(index)
+                journal['done'] = sorted(done)
+                self._save_journal(journal_path, journal)
+                state['transferred'] += len(data)
+                if progress_callback:
+                    progress_callback(state['transferred'], total)
+        
+        try:
+            with ThreadPoolExecutor(max_workers=TRANSFER_WORKERS) as executor:
+                list(executor.map(worker, pending))
+        finally:
+            for handle in handles:
+                for h in reversed(handle):
+                    h.close()
+    
+    def upload_file(self, local_path, remote_path, progress_callback=None):
+        """
+        上传文件到云端（分块并行、断点续传、sha256 校验）。
+        远端已存在内容相同的文件时直接跳过。
+        progress_callback: 可选，(已传输字节数, 总字节数)
+        """
         print(f"[CloudTrainer] 上传文件: {local_path} -> {remote_path}")
         
         try:
-            with SCPClient(self.ssh_client.get_transport()) as scp:
-                # 确保远程目录存在
-                remote_dir = os.path.dirname(remote_path)
-                self.execute_command(f"mkdir -p {remote_dir}")
+            # 确保远程目录存在
+            remote_dir = os.path.dirname(remote_path)
+            self.execute_command(f"mkdir -p {remote_dir}")
+            
+            total = os.path.getsize(local_path)
+            sha = _sha256_file(local_path)
+            sftp = self.ssh_client.open_sftp()
+            try:
+                try:
+                    exists = sftp.stat(remote_path).st_size == total
+                except IOError:
+                    exists = False
+                if exists and self._remote_sha256(sftp, remote_path) == sha:
+                    print(f"[CloudTrainer] 远端已存在相同文件，跳过上传")
+                    if progress_callback:
+                        progress_callback(total, total)
+                    return True
                 
-                # 上传文件
-                scp.put(local_path, remote_path)
+                part_path = remote_path + ".part"
+                journal_path, journal = self._load_journal('upload', local_path, remote_path, sha, total)
+                try:
+                    sftp.stat(part_path)
+                except IOError:
+                    journal['done'] = []
+                if not journal['done']:
+                    sftp.open(part_path, 'wb').close()
+                
+                self._transfer_chunks(
+                    total, journal_path, journal,
+                    lambda s: (open(local_path, 'rb'), s.open(part_path, 'r+b')),
+                    progress_callback
+                )
+                
+                status, output = self._run_quiet(f"sha256sum '{part_path}'")
+                if status != 0 or output.split()[0] != sha:
+                    os.remove(journal_path)
+                    raise IOError("上传后校验失败")
+                
+                try:
+                    sftp.remove(remote_path)
+                except IOError:
+                    pass
+                sftp.rename(part_path, remote_path)
+                st = sftp.stat(remote_path)
+                manifest = self._read_manifest(sftp, remote_dir)
+                manifest[os.path.basename(remote_path)] = {'sha256': sha, 'size': st.st_size, 'mtime': st.st_mtime}
+                self._write_manifest(sftp, remote_dir, manifest)
+                os.remove(journal_path)
+            finally:
+                sftp.close()
             print(f"[CloudTrainer] 文件上传成功")
             return True
         except Exception as e:
             print(f"[CloudTrainer] 文件上传失败: {e}")
             return False
     
-    def download_file(self, remote_path, local_path):
-        """从云端下载文件"""
+    def download_file(self, remote_path, local_path, progress_callback=None):
+        """
+        从云端下载文件（分块并行、断点续传、sha256 校验）。
+        本地已存在内容相同的文件时直接跳过。
+        progress_callback: 可选，(已传输字节数, 总字节数)
+        """
         print(f"[CloudTrainer] 下载文件: {remote_path} -> {local_path}")
         
         try:
             # 确保本地目录存在
             os.makedirs(os.path.dirname(local_path), exist_ok=True)
             
-            with SCPClient(self.ssh_client.get_transport()) as scp:
-                scp.get(remote_path, local_path)
+            sftp = self.ssh_client.open_sftp()
+            try:
+                total = sftp.stat(remote_path).st_size
+                sha = self._remote_sha256(sftp, remote_path)
+            finally:
+                sftp.close()
+            
+            if os.path.exists(local_path) and os.path.getsize(local_path) == total and _sha256_file(local_path) == sha:
+                print(f"[CloudTrainer] 本地已存在相同文件，跳过下载")
+                if progress_callback:
+                    progress_callback(total, total)
+                return True
+            
+            part_path = local_path + ".part"
+            journal_path, journal = self._load_journal('download', remote_path, local_path, sha, total)
+            if not os.path.exists(part_path):
+                journal['done'] = []
+            if not journal['done']:
+                open(part_path, 'wb').close()
+            
+            self._transfer_chunks(
+                total, journal_path, journal,
+                lambda s: (s.open(remote_path, 'rb'), open(part_path, 'r+b')),
+                progress_callback
+            )
+            
+            if _sha256_file(part_path) != sha:
+                os.remove(journal_path)
+                raise IOError("下载后校验失败")
+            os.replace(part_path, local_path)
+            os.remove(journal_path)
             print(f"[CloudTrainer] 文件下载成功")
             return True
         except Exception as e:
             print(f"[CloudTrainer] 文件下载失败: {e}")
             return False
     
-    def train_model(self, model_name, video_path, au_csv_path, iterations=10000, config="arguments/64_dim_1_transformer.py"):
+    def train_model(self, model_name, video_path, au_csv_path, iterations=10000, config="arguments/64_dim_1_transformer.py", resume=False):
         """
         完整训练流程
         
@@ -110,6 +530,7 @@ class CloudTrainer:
             au_csv_path: 本地au.csv路径
             iterations: 训练迭代次数
             config: 配置文件路径
+            resume: 重试同一个任务时为 True，从最近的检查点继续
         """
         print(f"[CloudTrainer] 开始云端训练: {model_name}")
         
@@ -130,15 +551,15 @@ class CloudTrainer:
         
         # 3. 预处理
         print("\n===== 步骤3: 数据预处理 =====")
-        preprocess_cmd = f"source /root/miniconda3/etc/profile.d/conda.sh && conda activate gt && python data_utils/process.py {remote_data_dir}/{os.path.basename(video_path)}"
-        success, output = self.execute_command(preprocess_cmd, cwd=self.remote_base)
+        preprocess_cmd = f"python data_utils/process.py {remote_data_dir}/{os.path.basename(video_path)}"
+        success, output = self.execute_in_env(preprocess_cmd, cwd=self.remote_base)
         if not success:
             return False, f"预处理失败: {output}"
         
         # 4. 训练
         print("\n===== 步骤4: 模型训练 =====")
-        train_cmd = f"source /root/miniconda3/etc/profile.d/conda.sh && conda activate gt && WANDB_MODE=disabled python train.py -s {remote_data_dir} --model_path output/{model_name} --configs {config} --iterations {iterations}"
-        success, output = self.execute_command(train_cmd, cwd=self.remote_base)
+        train_cmd = build_train_command(remote_data_dir, model_name, config, iterations, resume)
+        success, output = self.execute_in_env(train_cmd, cwd=self.remote_base)
         if not success:
             return False, f"训练失败: {output}"
         
@@ -172,8 +593,8 @@ class CloudTrainer:
                 return False, "音频上传失败"
             
             # 提取DeepSpeech特征
-            extract_cmd = f"source /root/miniconda3/etc/profile.d/conda.sh && conda activate gt && python data_utils/deepspeech_features/extract_ds_features.py --input {remote_audio} --output {remote_data_dir}/{audio_name}.npy"
-            success, output = self.execute_command(extract_cmd, cwd=self.remote_base)
+            extract_cmd = f"python data_utils/deepspeech_features/extract_ds_features.py --input {remote_audio} --output {remote_data_dir}/{audio_name}.npy"
+            success, output = self.execute_in_env(extract_cmd, cwd=self.remote_base)
             if not success:
                 return False, f"音频特征提取失败: {output}"
             
@@ -188,7 +609,7 @@ class CloudTrainer:
         # 2. 渲染（包含ulimit设置）
         print("\n===== 步骤2: 渲染视频 =====")
         render_cmd = (
-            f"source /root/miniconda3/etc/profile.d/conda.sh && conda activate gt && ulimit -n 65535 && python render.py "
+            f"ulimit -n 65535 && python render.py "
             f"-s {remote_data_dir} "
             f"--model_path output/{model_name} "
             f"--configs {config} "
@@ -198,7 +619,7 @@ class CloudTrainer:
             f"--custom_aud {custom_aud} "
             f"--custom_wav {custom_wav}"
         )
-        success, output = self.execute_command(render_cmd, cwd=self.remote_base)
+        success, output = self.execute_in_env(render_cmd, cwd=self.remote_base)
         if not success:
             return False, f"渲染失败: {output}"
         
@@ -237,6 +658,7 @@ def cloud_train_model(data):
             - ssh_password: SSH密码
             - iterations: 迭代次数
             - config: 配置文件
+            - resume: 是否为重试同一个任务（从最近的检查点继续）
     """
     trainer = CloudTrainer(
         ssh_host="connect.bjb1.seetacloud.com",
@@ -257,7 +679,8 @@ def cloud_train_model(data):
             video_path=video_path,
             au_csv_path=data.get('au_csv'),
             iterations=int(data.get('iterations', 10000)),
-            config=data.get('config', 'arguments/64_dim_1_transformer.py')
+            config=data.get('config', 'arguments/64_dim_1_transformer.py'),
+            resume=bool(data.get('resume'))
         )
         
         return success, message
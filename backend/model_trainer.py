@@ -1,6 +1,7 @@
 import subprocess
 import os
 import time
+from backend.process_runner import run_with_progress, describe_progress, ProcessCancelled
 
 def train_model(data, progress_callback=None):
     """
@@ -12,6 +13,16 @@ def train_model(data, progress_callback=None):
             progress_callback(step, message, extra_data)
         print(f"[model_trainer] Step {step}: {message}")
     
+    def subprocess_progress(step, message):
+        """把子进程输出中解析出的进度事件转发给 report_progress"""
+        return lambda event: report_progress(step, describe_progress(event, message), event)
+    
+    def print_line(line):
+        print(f"[model_trainer] {line}")
+    
+    # 可选的 threading.Event，set 后终止正在运行的训练子进程
+    cancel_event = data.get('cancel_event')
+    
     print("[backend.model_trainer] 收到数据：")
     for k, v in data.items():
         print(f"  {k}: {v}")
@@ -42,20 +53,19 @@ def train_model(data, progress_callback=None):
             
             report_progress(5, '正在训练模型...')
             
-            # 执行训练命令
-            result = subprocess.run(
+            # 执行训练命令，实时解析迭代次数、loss 和剩余时间
+            run_with_progress(
                 cmd,
-                capture_output=True,
-                text=True,
+                progress_callback=subprocess_progress(5, '正在训练模型'),
+                line_callback=print_line,
+                cancel_event=cancel_event,
                 check=True
             )
             
-            print("[backend.model_trainer] 训练输出:", result.stdout)
-            if result.stderr:
-                print("[backend.model_trainer] 错误输出:", result.stderr)
-            
             report_progress(7, '训练完成！')
                 
+        except ProcessCancelled:
+            raise
         except subprocess.CalledProcessError as e:
             print(f"[backend.model_trainer] 训练失败，退出码: {e.returncode}")
             print(f"错误输出: {e.stderr}")
@@ -73,7 +83,7 @@ def train_model(data, progress_callback=None):
         # 云端训练
         if gpu_choice == 'cloud':
             print("[backend.model_trainer] 使用云端训练")
-            from backend.cloud_trainer import CloudTrainer
+            from backend.cloud_trainer import CloudTrainer, build_train_command
             
             try:
                 trainer = CloudTrainer(
@@ -103,8 +113,9 @@ def train_model(data, progress_callback=None):
                         remote_base = "/root/autodl-tmp/GaussianTalker"
                         remote_data_dir = f"{remote_base}/data/{model_name}"
                         
-                        train_cmd = f"source /root/miniconda3/etc/profile.d/conda.sh && conda activate gt && WANDB_MODE=disabled python train.py -s {remote_data_dir} --model_path output/{model_name} --configs {data.get('config', 'arguments/64_dim_1_transformer.py')} --iterations {data.get('iterations', 10000)}"
-                        success, output = trainer.execute_command(train_cmd, cwd=remote_base)
+                        train_cmd = build_train_command(remote_data_dir, model_name, data.get('config', 'arguments/64_dim_1_transformer.py'),
+                                                        data.get('iterations', 10000), resume=bool(data.get('resume')))
+                        success, output = trainer.execute_in_env(train_cmd, cwd=remote_base)
                         
                         if not success:
                             raise Exception(f"训练失败: {output}")
@@ -124,7 +135,8 @@ def train_model(data, progress_callback=None):
                     remote_data_dir = f"{remote_base}/data/{inferred_model_name}"
                     remote_video = f"{remote_data_dir}/{os.path.basename(video_path)}"
                     
-                    if not trainer.upload_file(video_path, remote_video):
+                    upload_progress = lambda done, total: report_progress(1, '正在上传视频到云端...', {'transferred': done, 'total': total})
+                    if not trainer.upload_file(video_path, remote_video, progress_callback=upload_progress):
                         raise Exception("视频上传失败")
                     
                     # 上传AU文件
@@ -132,13 +144,14 @@ def train_model(data, progress_callback=None):
                     au_csv_path = data.get('au_csv')
                     if au_csv_path and os.path.exists(au_csv_path):
                         remote_au = f"{remote_data_dir}/au.csv"
-                        if not trainer.upload_file(au_csv_path, remote_au):
+                        upload_progress = lambda done, total: report_progress(2, '正在上传AU文件...', {'transferred': done, 'total': total})
+                        if not trainer.upload_file(au_csv_path, remote_au, progress_callback=upload_progress):
                             raise Exception("AU文件上传失败")
                     
                     # 预处理
                     report_progress(3, '正在进行数据预处理...')
-                    preprocess_cmd = f"source /root/miniconda3/etc/profile.d/conda.sh && conda activate gt && python data_utils/process.py {remote_video}"
-                    success, output = trainer.execute_command(preprocess_cmd, cwd=remote_base)
+                    preprocess_cmd = f"python data_utils/process.py {remote_video}"
+                    success, output = trainer.execute_in_env(preprocess_cmd, cwd=remote_base)
                     if not success:
                         raise Exception(f"预处理失败: {output}")
                     
@@ -146,8 +159,9 @@ def train_model(data, progress_callback=None):
                     
                     # 训练
                     report_progress(5, '正在训练模型（这可能需要很长时间）...')
-                    train_cmd = f"source /root/miniconda3/etc/profile.d/conda.sh && conda activate gt && WANDB_MODE=disabled python train.py -s {remote_data_dir} --model_path output/{inferred_model_name} --configs {data.get('config', 'arguments/64_dim_1_transformer.py')} --iterations {data.get('iterations', 10000)}"
-                    success, output = trainer.execute_command(train_cmd, cwd=remote_base)
+                    train_cmd = build_train_command(remote_data_dir, inferred_model_name, data.get('config', 'arguments/64_dim_1_transformer.py'),
+                                                    data.get('iterations', 10000), resume=bool(data.get('resume')))
+                    success, output = trainer.execute_in_env(train_cmd, cwd=remote_base)
                     
                     if not success:
                         raise Exception(f"训练失败: {output}")
@@ -192,20 +206,19 @@ def train_model(data, progress_callback=None):
             
             report_progress(5, '正在训练模型...')
             
-            # 执行训练命令
-            result = subprocess.run(
+            # 执行训练命令，实时解析迭代次数、loss 和剩余时间
+            run_with_progress(
                 cmd,
-                capture_output=True,
-                text=True,
+                progress_callback=subprocess_progress(5, '正在训练模型'),
+                line_callback=print_line,
+                cancel_event=cancel_event,
                 check=True
             )
             
-            print("[backend.model_trainer] 训练输出:", result.stdout)
-            if result.stderr:
-                print("[backend.model_trainer] 错误输出:", result.stderr)
-            
             report_progress(7, '训练完成！')
                 
+        except ProcessCancelled:
+            raise
         except subprocess.CalledProcessError as e:
             print(f"[backend.model_trainer] 训练失败，退出码: {e.returncode}")
             print(f"错误输出: {e.stderr}")
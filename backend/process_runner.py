@@ -0,0 +1,197 @@
+"""
+子进程运行模块 - 逐行读取渲染/训练子进程的输出，解析出结构化进度后回调
+"""
+import codecs
+import collections
+import json
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+
+
+# tqdm 进度行，例如：
+# Training progress:  45%|████▌     | 450/1000 [00:10<00:12, 43.21it/s, Loss=0.0123, psnr=30.12, point=30000]
+_TQDM_RE = re.compile(
+    r'(?:(?P<desc>[^|\r\n]*?):\s*)?(?P<percent>\d+)%\|[^|]*\|\s*(?P<current>\d+)/(?P<total>\d+)\s*'
+    r'\[(?P<elapsed>[^<\]]*)<(?P<eta>[^,\]]*)(?:,\s*(?P<rate>[^,\]]*))?(?:,\s*(?P<postfix>[^\]]*))?\]'
+)
+# train.py 保存时打印的 "[ITER 500] Saving Gaussians"
+_ITER_RE = re.compile(r'\[ITER (?P<iteration>\d+)\]')
+
+
+def _parse_number(value):
+    try:
+        return float(value) if '.' in value or 'e' in value.lower() else int(value)
+    except ValueError:
+        return value
+
+
+def parse_progress(line):
+    """
+    从一行输出中解析进度事件，无法识别时返回 None。
+    支持三种格式：JSON 行、tqdm 进度条、"[ITER n]" 日志。
+    """
+    line = line.strip()
+    if not line:
+        return None
+
+    if line.startswith('{') and line.endswith('}'):
+        try:
+            event = json.loads(line)
+        except ValueError:
+            event = None
+        if isinstance(event, dict):
+            return event
+
+    match = _TQDM_RE.search(line)
+    if match:
+        event = {
+            'stage': (match.group('desc') or '').strip(),
+            'percent': int(match.group('percent')),
+            'current': int(match.group('current')),
+            'total': int(match.group('total')),
+            'elapsed': match.group('elapsed').strip(),
+            'eta': match.group('eta').strip(),
+        }
+        if match.group('rate'):
+            event['rate'] = match.group('rate').strip()
+        for item in (match.group('postfix') or '').split(','):
+            if '=' in item:
+                key, value = item.split('=', 1)
+                event[key.strip().lower()] = _parse_number(value.strip())
+        return event
+
+    match = _ITER_RE.search(line)
+    if match:
+        return {'iteration': int(match.group('iteration')), 'message': line}
+
+    return None
+
+
+def _popen_group_kwargs():
+    """让子进程成为独立进程组的 leader，取消时可以连同孙进程一起结束"""
+    if os.name == 'nt':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+
+def kill_process_group(proc, timeout=5):
+    """先 SIGTERM 整个进程组，超时后 SIGKILL"""
+    if proc.poll() is not None:
+        return
+    if os.name == 'nt':
+        proc.kill()
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class ProcessCancelled(Exception):
+    """子进程被取消"""
+
+
+def run_with_progress(cmd, progress_callback=None, line_callback=None, cancel_event=None,
+                      cwd=None, env=None, check=True, min_interval=0.5, tail_lines=200):
+    """
+    运行子进程并实时读取输出（stderr 合并到 stdout，按 \\r 和 \\n 切分，兼容 tqdm）。
+
+    Args:
+        progress_callback: 解析出进度事件时调用 progress_callback(event)，同类事件最多每 min_interval 秒一次
+        line_callback: 每读到一行输出调用 line_callback(line)
+        cancel_event: threading.Event，被 set 后结束整个子进程组并抛出 ProcessCancelled
+        check: 退出码非 0 时抛出 subprocess.CalledProcessError（output/stderr 为最后 tail_lines 行）
+
+    Returns:
+        (returncode, 最后 tail_lines 行输出拼成的字符串)
+    """
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        stdin=subprocess.DEVNULL,
+        cwd=cwd,
+        env=env,
+        **_popen_group_kwargs()
+    )
+
+    cancelled = threading.Event()
+    finished = threading.Event()
+
+    def watch_cancel():
+        while not finished.is_set():
+            if cancel_event.wait(0.2):
+                cancelled.set()
+                kill_process_group(proc)
+                return
+
+    if cancel_event is not None:
+        threading.Thread(target=watch_cancel, daemon=True).start()
+
+    tail = collections.deque(maxlen=tail_lines)
+    last_emit = {}
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending = ''
+
+    def handle_line(line):
+        if not line.strip():
+            return
+        tail.append(line)
+        if line_callback:
+            line_callback(line)
+        event = parse_progress(line)
+        if event is None or progress_callback is None:
+            return
+        key = event.get('stage', '')
+        now = time.monotonic()
+        is_last = event.get('total') is not None and event.get('current') == event.get('total')
+        if is_last or now - last_emit.get(key, 0) >= min_interval:
+            last_emit[key] = now
+            progress_callback(event)
+
+    try:
+        while True:
+            chunk = proc.stdout.read1(4096)
+            if not chunk:
+                break
+            pending += decoder.decode(chunk)
+            parts = re.split(r'[\r\n]', pending)
+            pending = parts.pop()
+            for part in parts:
+                handle_line(part)
+        pending += decoder.decode(b'', final=True)
+        handle_line(pending)
+        returncode = proc.wait()
+    finally:
+        finished.set()
+        if proc.poll() is None:
+            kill_process_group(proc)
+        proc.stdout.close()
+
+    output = '\n'.join(tail)
+    if cancelled.is_set():
+        raise ProcessCancelled(f"子进程已取消: {cmd}")
+    if check and returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, output=output, stderr=output)
+    return returncode, output
+
+
+def describe_progress(event, default_message):
+    """把进度事件转成给前端展示的一行文字"""
+    if 'current' in event and 'total' in event:
+        text = f"{default_message} {event['current']}/{event['total']}"
+        if 'loss' in event:
+            text += f"，loss={event['loss']}"
+        if event.get('eta'):
+            text += f"，剩余约 {event['eta']}"
+        return text
+    if 'iteration' in event:
+        return f"{default_message}（迭代 {event['iteration']}）"
+    return event.get('message', default_message)
@@ -0,0 +1,162 @@
+"""
+渲染结果缓存模块 - 以 (模型, 检查点, 配置, 音频内容) 为键缓存已渲染的视频，
+同一段音频在同一检查点上重复渲染时直接返回缓存结果。
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+
+CACHE_DIR = os.path.join("static", "videos", "cache")
+# 缓存占用上限（字节），超出后按最近使用时间淘汰
+DEFAULT_MAX_BYTES = int(os.environ.get("RENDER_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+
+_lock = threading.Lock()
+
+
+def file_sha256(path, block_size=8 * 1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _latest_mtime(path):
+    """目录及其中文件的最新修改时间（覆盖写入已有文件不会改变目录本身的修改时间）；目录不存在时返回 None"""
+    if not os.path.isdir(path):
+        return None
+    mtimes = [os.path.getmtime(path)]
+    for name in os.listdir(path):
+        file_path = os.path.join(path, name)
+        if os.path.isfile(file_path):
+            mtimes.append(os.path.getmtime(file_path))
+    return int(max(mtimes))
+
+
+def checkpoint_stamp(model_dir, iteration):
+    """GaussianTalker 本地检查点的修改时间，模型重新训练后旧缓存自动失效；找不到时返回 None"""
+    return _latest_mtime(os.path.join(model_dir, "point_cloud", f"iteration_{iteration}"))
+
+
+def synctalk_checkpoint_stamp(model_dir):
+    """SyncTalk 模型 checkpoints 目录中检查点的最新修改时间；找不到时返回 None"""
+    return _latest_mtime(os.path.join(model_dir, "checkpoints"))
+
+
+def make_metadata(model_name, model_path, iteration, config, audio_path, location, checkpoint=None):
+    """
+    构造缓存元数据，键由其中除时间戳外的全部字段决定。
+    location 区分本地 / 云端渲染（两边的检查点不一定相同）。
+    """
+    return {
+        'model_name': model_name,
+        'model_path': model_path,
+        'iteration': str(iteration),
+        'config': config,
+        'audio_sha256': file_sha256(audio_path),
+        'location': location,
+        'checkpoint': checkpoint,
+    }
+
+
+def cache_key(meta):
+    payload = json.dumps(meta, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """磁盘渲染缓存：每个条目为 <key><ext> 视频文件 + <key>.json 元数据"""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_entry(self, key):
+        try:
+            with open(self._meta_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def _write_entry(self, key, entry):
+        tmp_path = self._meta_path(key) + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._meta_path(key))
+
+    def lookup(self, meta):
+        """命中时返回缓存视频路径并刷新最近使用时间，否则返回 None"""
+        key = cache_key(meta)
+        with _lock:
+            entry = self._read_entry(key)
+            if entry is None:
+                return None
+            video_path = os.path.join(self.cache_dir, entry['file'])
+            if not os.path.exists(video_path):
+                os.remove(self._meta_path(key))
+                return None
+            entry['last_used'] = time.time()
+            entry['hits'] = entry.get('hits', 0) + 1
+            self._write_entry(key, entry)
+        print(f"[render_cache] 命中缓存: {video_path}")
+        return video_path
+
+    def store(self, meta, video_path):
+        """把渲染结果放入缓存，返回缓存中的视频路径；失败时原样返回 video_path"""
+        key = cache_key(meta)
+        ext = os.path.splitext(video_path)[1] or '.mp4'
+        filename = f"{key}{ext}"
+        cached_path = os.path.join(self.cache_dir, filename)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with _lock:
+                tmp_path = cached_path + ".tmp"
+                shutil.copyfile(video_path, tmp_path)
+                os.replace(tmp_path, cached_path)
+                now = time.time()
+                self._write_entry(key, dict(meta, file=filename, size=os.path.getsize(cached_path),
+                                            created=now, last_used=now, hits=0))
+                self._evict(keep=key)
+        except (IOError, OSError) as e:
+            print(f"[render_cache] 写入缓存失败: {e}")
+            return video_path
+        return cached_path
+
+    def _evict(self, keep=None):
+        """超出配额时按最近使用时间从旧到新淘汰，keep 指定的条目不淘汰"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            key = name[:-len('.json')]
+            entry = self._read_entry(key)
+            if entry is not None:
+                entries.append((entry.get('last_used', 0), key, entry))
+
+        total = sum(entry.get('size', 0) for _, _, entry in entries)
+        for _, key, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for path in (os.path.join(self.cache_dir, entry['file']), self._meta_path(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= entry.get('size', 0)
+            print(f"[render_cache] 淘汰缓存: {entry['file']}")
+
+
+_cache = RenderCache()
+
+
+def get_render_cache():
+    return _cache
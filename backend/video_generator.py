@@ -2,6 +2,44 @@ import os
 import time
 import subprocess
 import shutil
+from backend.process_runner import run_with_progress, describe_progress, ProcessCancelled
+from backend.render_cache import get_render_cache, make_metadata, checkpoint_stamp, synctalk_checkpoint_stamp
+
+# GaussianTalker 渲染默认使用的配置（云端命令与 run_gaussiantalker.sh 中相同）
+GT_DEFAULT_CONFIG = "arguments/64_dim_1_transformer.py"
+
+
+def _render_cache_metadata(data, remote_checkpoint=None):
+    """
+    构造渲染缓存元数据：(模型, 检查点, 配置, 音频 sha256, 本地/云端)。
+    未提供音频（使用训练音频）、显式关闭缓存或无法确定检查点版本时返回 None（不缓存），
+    否则重新训练同名模型后会命中旧权重渲染的视频。
+    云端渲染的检查点版本由调用方连接后查询，通过 remote_checkpoint 传入。
+    """
+    audio_path = data.get('ref_audio') or ''
+    if data.get('no_cache') or not audio_path.strip() or not os.path.exists(audio_path):
+        return None
+
+    model_name = data.get('model_name')
+    model_param = data.get('model_param') or ''
+    if model_name == "SyncTalk":
+        checkpoint = synctalk_checkpoint_stamp(model_param)
+        if checkpoint is None:
+            return None
+        return make_metadata(model_name, model_param, '', '', audio_path, 'local', checkpoint=checkpoint)
+    if model_name == "GaussianTalker":
+        iteration = data.get('iteration', '10000')
+        config = data.get('config') or GT_DEFAULT_CONFIG
+        if data.get('gpu_choice') == 'cloud':
+            location, checkpoint = 'cloud', remote_checkpoint
+        else:
+            model_dir = os.path.join("GaussianTalker", "output", os.path.basename(model_param))
+            location, checkpoint = 'local', checkpoint_stamp(model_dir, iteration)
+        if checkpoint is None:
+            return None
+        return make_metadata(model_name, model_param, iteration, config, audio_path, location, checkpoint=checkpoint)
+    return None
+
 
 def generate_video(data, progress_callback=None):
     """
@@ -14,6 +52,16 @@ def generate_video(data, progress_callback=None):
             progress_callback(step, message, extra_data)
         print(f"[video_generator] Step {step}: {message}")
     
+    def subprocess_progress(step, message):
+        """把子进程输出中解析出的进度事件转发给 report_progress"""
+        return lambda event: report_progress(step, describe_progress(event, message), event)
+    
+    def print_line(line):
+        print(f"[video_generator] {line}")
+    
+    # 可选的 threading.Event，set 后终止正在运行的渲染子进程
+    cancel_event = data.get('cancel_event')
+    
     print("[backend.video_generator] 收到数据：")
     for k, v in data.items():
         print(f"  {k}: {v}")
@@ -63,6 +111,21 @@ def generate_video(data, progress_callback=None):
     else:
         report_progress(1, '跳过语音克隆（使用上传音频）')
 
+    # 渲染前先查缓存：同一音频在同一检查点上渲染过则直接返回
+    render_cache = get_render_cache()
+    cache_meta = _render_cache_metadata(data)
+    if cache_meta is not None:
+        cached_video = render_cache.lookup(cache_meta)
+        if cached_video:
+            report_progress(6, '命中渲染缓存，视频生成完成！', {'cached': True})
+            return cached_video
+
+    def cache_result(video_path):
+        """渲染成功后写入缓存，返回缓存中的视频路径"""
+        if cache_meta is None:
+            return video_path
+        return render_cache.store(cache_meta, video_path)
+
     if data['model_name'] == "SyncTalk":
         try:
             report_progress(2, '正在加载 SyncTalk 模型...')
@@ -77,20 +140,17 @@ def generate_video(data, progress_callback=None):
 
             print(f"[backend.video_generator] 执行命令: {' '.join(cmd)}")
             
-            report_progress(3, '正在进行音频特征提取...')
-            report_progress(4, '正在生成视频帧...')
+            report_progress(3, '正在启动 SyncTalk 推理...')
 
-            # 执行命令
-            result = subprocess.run(
+            # 执行命令，实时解析输出中的进度
+            run_with_progress(
                 cmd,
-                capture_output=True,
-                text=True
+                progress_callback=subprocess_progress(4, '正在生成视频帧'),
+                line_callback=print_line,
+                cancel_event=cancel_event,
+                check=False
             )
             
-            print("命令标准输出:", result.stdout)
-            if result.stderr:
-                print("命令标准错误:", result.stderr)
-            
             report_progress(5, '正在合成视频...')
             
             # 文件原路径与目的路径 
@@ -105,7 +165,7 @@ def generate_video(data, progress_callback=None):
                 shutil.copy(source_path, destination_path)
                 print(f"[backend.video_generator] 视频生成完成，路径：{destination_path}")
                 report_progress(6, '视频生成完成！')
-                return destination_path
+                return cache_result(destination_path)
             else:
                 print(f"[backend.video_generator] 视频文件不存在: {source_path}")
                 # 尝试查找任何新生成的mp4文件
@@ -118,10 +178,12 @@ def generate_video(data, progress_callback=None):
                         shutil.copy(source_path, destination_path)
                         print(f"[backend.video_generator] 找到最新视频文件: {destination_path}")
                         report_progress(6, '视频生成完成！')
-                        return destination_path
+                        return cache_result(destination_path)
                 
                 return os.path.join("static", "videos", "out.mp4")
             
+        except ProcessCancelled:
+            raise
         except subprocess.CalledProcessError as e:
             print(f"[backend.video_generator] 命令执行失败: {e}")
             print("错误输出:", e.stderr)
@@ -159,6 +221,14 @@ def generate_video(data, progress_callback=None):
                     remote_base = "/root/autodl-tmp/GaussianTalker"
                     remote_data_dir = f"{remote_base}/data/{model_name}"
                     
+                    # 云端检查点的版本要连上服务器才能查到，此时再查缓存
+                    cache_meta = _render_cache_metadata(data, trainer.checkpoint_stamp(model_name, iteration))
+                    if cache_meta is not None:
+                        cached_video = render_cache.lookup(cache_meta)
+                        if cached_video:
+                            report_progress(7, '命中渲染缓存，视频生成完成！', {'cached': True})
+                            return cached_video
+                    
                     # 如果有音频，上传
                     if audio_path and audio_path.strip() and os.path.exists(audio_path):
                         report_progress(3, '正在上传音频到云端...')
@@ -166,12 +236,13 @@ def generate_video(data, progress_callback=None):
                         audio_name = os.path.splitext(audio_filename)[0]
                         remote_audio = f"{remote_data_dir}/{audio_filename}"
                         
-                        if not trainer.upload_file(audio_path, remote_audio):
+                        upload_progress = lambda done, total: report_progress(3, '正在上传音频到云端...', {'transferred': done, 'total': total})
+                        if not trainer.upload_file(audio_path, remote_audio, progress_callback=upload_progress):
                             raise Exception("音频上传失败")
                         
                         report_progress(4, '正在提取音频特征...')
-                        extract_cmd = f"source /root/miniconda3/etc/profile.d/conda.sh && conda activate gt && python data_utils/deepspeech_features/extract_ds_features.py --input {remote_audio} --output {remote_data_dir}/{audio_name}.npy"
-                        success, output = trainer.execute_command(extract_cmd, cwd=remote_base)
+                        extract_cmd = f"python data_utils/deepspeech_features/extract_ds_features.py --input {remote_audio} --output {remote_data_dir}/{audio_name}.npy"
+                        success, output = trainer.execute_in_env(extract_cmd, cwd=remote_base)
                         if not success:
                             raise Exception(f"音频特征提取失败: {output}")
                         
@@ -184,17 +255,17 @@ def generate_video(data, progress_callback=None):
                     
                     report_progress(5, '正在渲染视频（这可能需要几分钟）...')
                     render_cmd = (
-                        f"source /root/miniconda3/etc/profile.d/conda.sh && conda activate gt && ulimit -n 65535 && python render.py "
+                        f"ulimit -n 65535 && python render.py "
                         f"-s {remote_data_dir} "
                         f"--model_path output/{model_name} "
-                        f"--configs arguments/64_dim_1_transformer.py "
+                        f"--configs {data.get('config') or GT_DEFAULT_CONFIG} "
                         f"--iteration {iteration} "
                         f"--batch {batch_size} "
                         f"--skip_train --skip_test "
                         f"--custom_aud {custom_aud} "
                         f"--custom_wav {custom_wav}"
                     )
-                    success, output = trainer.execute_command(render_cmd, cwd=remote_base)
+                    success, output = trainer.execute_in_env(render_cmd, cwd=remote_base)
                     if not success:
                         raise Exception(f"渲染失败: {output}")
                     
@@ -202,15 +273,16 @@ def generate_video(data, progress_callback=None):
                     remote_video = f"{remote_base}/output/{model_name}/custom/ours_{iteration}/renders/output_custom_{iteration}iter_renders.mov"
                     local_video = f"./static/videos/cloud_{model_name}_{iteration}.mov"
                     
-                    if not trainer.download_file(remote_video, local_video):
+                    download_progress = lambda done, total: report_progress(6, '正在下载生成的视频...', {'transferred': done, 'total': total})
+                    if not trainer.download_file(remote_video, local_video, progress_callback=download_progress):
                         remote_video_alt = f"{remote_base}/output/{model_name}/renders/output.mp4"
                         local_video = f"./static/videos/cloud_{model_name}_{iteration}.mp4"
-                        if not trainer.download_file(remote_video_alt, local_video):
+                        if not trainer.download_file(remote_video_alt, local_video, progress_callback=download_progress):
                             raise Exception("视频下载失败")
                     
                     report_progress(7, '视频生成完成！')
                     print(f"[backend.video_generator] 云端渲染成功: {local_video}")
-                    return local_video
+                    return cache_result(local_video)
                     
                 finally:
                     trainer.disconnect()
@@ -242,20 +314,16 @@ def generate_video(data, progress_callback=None):
             print(f"[backend.video_generator] 执行GaussianTalker推理命令: {' '.join(cmd)}")
             
             report_progress(3, '正在提取音频特征...')
-            report_progress(4, '正在渲染视频帧...')
 
-            # 执行命令（使用check=True确保错误时抛出异常）
-            result = subprocess.run(
+            # 执行命令（check=True 确保错误时抛出异常），实时解析渲染进度
+            run_with_progress(
                 cmd,
-                capture_output=True,
-                text=True,
+                progress_callback=subprocess_progress(4, '正在渲染视频帧'),
+                line_callback=print_line,
+                cancel_event=cancel_event,
                 check=True
             )
             
-            print("[backend.video_generator] 推理标准输出:", result.stdout)
-            if result.stderr:
-                print("[backend.video_generator] 推理标准错误:", result.stderr)
-            
             report_progress(5, '正在合成最终视频...')
             
             # 确定输出视频路径（run_gaussiantalker.sh会将视频生成到GaussianTalker/output/目录）
@@ -299,11 +367,13 @@ def generate_video(data, progress_callback=None):
                 shutil.copy(source_path, destination_path)
                 print(f"[backend.video_generator] GaussianTalker视频生成完成: {destination_path}")
                 report_progress(6, '视频生成完成！')
-                return destination_path
+                return cache_result(destination_path)
             else:
                 print(f"[backend.video_generator] 错误: 未找到GaussianTalker输出视频")
                 return os.path.join("static", "videos", "out.mp4")
             
+        except ProcessCancelled:
+            raise
         except subprocess.CalledProcessError as e:
             print(f"[backend.video_generator] GaussianTalker推理失败，退出码: {e.returncode}")
             print(f"错误输出: {e.stderr}")
@@ -1,7 +1,18 @@
 import os
 import subprocess
+import threading
+from collections import OrderedDict
+
+import numpy as np
 
 _tts = None
+# 参考音频 -> (gpt_cond_latent, speaker_embedding)，按路径和修改时间缓存，避免每次合成重复提取；
+# 只保留最近使用的 _COND_CACHE_SIZE 个参考音频
+_COND_CACHE_SIZE = 8
+_cond_cache = OrderedDict()
+_cond_lock = threading.Lock()
+# 句间静音的采样点数，与 TTS 的 Synthesizer.tts（tts_to_file）在每句后补的静音一致
+SENTENCE_PAUSE_SAMPLES = 10000
 
 
 def _get_tts():
@@ -53,26 +64,90 @@ def _ffmpeg_convert_to_wav_mono_22k(src_path: str, dst_path: str) -> bool:
         return False
 
 
-def synthesize_with_clone(text: str, ref_audio_path: str, out_path: str, language: str = "zh-cn") -> str:
+def _get_conditioning(tts, ref_audio_path: str):
+    key = (os.path.abspath(ref_audio_path), os.path.getmtime(ref_audio_path))
+    with _cond_lock:
+        if key in _cond_cache:
+            _cond_cache.move_to_end(key)
+            return _cond_cache[key]
+
+    tmp_dir = os.path.dirname(ref_audio_path)
+    norm_ref = os.path.join(tmp_dir, "__ref_norm__.wav")
+    ok = _ffmpeg_convert_to_wav_mono_22k(ref_audio_path, norm_ref)
+    use_ref = norm_ref if ok else ref_audio_path
+
+    model = tts.synthesizer.tts_model
+    config = model.config
+    try:
+        # 与 Xtts.synthesize（tts_to_file）相同，按模型配置截取和归一化参考音频
+        latents = model.get_conditioning_latents(
+            audio_path=[use_ref],
+            gpt_cond_len=config.gpt_cond_len,
+            gpt_cond_chunk_len=config.gpt_cond_chunk_len,
+            max_ref_length=config.max_ref_len,
+            sound_norm_refs=config.sound_norm_refs,
+        )
+    finally:
+        try:
+            if os.path.exists(norm_ref):
+                os.remove(norm_ref)
+        except Exception:
+            pass
+
+    with _cond_lock:
+        _cond_cache[key] = latents
+        while len(_cond_cache) > _COND_CACHE_SIZE:
+            _cond_cache.popitem(last=False)
+    return latents
+
+
+def _check_inputs(text: str, ref_audio_path: str):
     if not text:
         raise ValueError("empty text")
     if not ref_audio_path or not os.path.exists(ref_audio_path):
         raise FileNotFoundError("reference audio not found")
 
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
 
-    tmp_dir = os.path.dirname(ref_audio_path)
-    norm_ref = os.path.join(tmp_dir, "__ref_norm__.wav")
-    ok = _ffmpeg_convert_to_wav_mono_22k(ref_audio_path, norm_ref)
-    use_ref = norm_ref if ok else ref_audio_path
+def synthesize_with_clone_stream(text: str, ref_audio_path: str, language: str = "zh-cn"):
+    """
+    流式语音克隆：按句切分后逐句调用 XTTS 的 inference_stream，
+    每生成一段音频立即 yield 一个 float32 numpy 数组（采样率见 tts.synthesizer.output_sample_rate），
+    每句之后 yield 一段句间静音。
+    """
+    _check_inputs(text, ref_audio_path)
 
     tts = _get_tts()
-    tts.tts_to_file(text=text, speaker_wav=use_ref, language=language, file_path=out_path)
+    model = tts.synthesizer.tts_model
+    gpt_cond_latent, speaker_embedding = _get_conditioning(tts, ref_audio_path)
+    # inference_stream 的默认采样参数与模型配置不同，按 Xtts.synthesize（tts_to_file）的做法从配置取
+    config = model.config
+    settings = {
+        "temperature": config.temperature,
+        "length_penalty": config.length_penalty,
+        "repetition_penalty": config.repetition_penalty,
+        "top_k": config.top_k,
+        "top_p": config.top_p,
+    }
 
-    try:
-        if os.path.exists(norm_ref):
-            os.remove(norm_ref)
-    except Exception:
-        pass
+    for sentence in tts.synthesizer.split_into_sentences(text):
+        if not sentence.strip():
+            continue
+        for chunk in model.inference_stream(sentence, language, gpt_cond_latent, speaker_embedding, **settings):
+            yield chunk.detach().float().cpu().numpy().reshape(-1)
+        yield np.zeros(SENTENCE_PAUSE_SAMPLES, dtype=np.float32)
+
+
+def synthesize_with_clone(text: str, ref_audio_path: str, out_path: str, language: str = "zh-cn") -> str:
+    _check_inputs(text, ref_audio_path)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+    chunks = list(synthesize_with_clone_stream(text, ref_audio_path, language=language))
+    # 一次性分配输出缓冲区再写入各段，避免 list 逐段扩容
+    wav = np.empty(sum(c.shape[0] for c in chunks), dtype=np.float32)
+    offset = 0
+    for c in chunks:
+        wav[offset:offset + c.shape[0]] = c
+        offset += c.shape[0]
 
+    _get_tts().synthesizer.save_wav(wav, out_path)
     return out_path